@@ -1,17 +1,32 @@
 import sys
-from logging import DEBUG, INFO, getLogger
 
+PLAN_USAGE = "usage: bumpr plan PLANFILE [options]"
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    plan = None
+    if args[:1] == ["plan"]:
+        if len(args) < 2 or args[1].startswith("-"):
+            print(PLAN_USAGE, file=sys.stderr)
+            sys.exit(2)
+        plan, args = args[1], args[2:]
+    if "--version" in args:
+        # Fast path: don't pay the configuration and release machinery import cost
+        from .__about__ import __version__
+
+        print(__version__)
+        return
+
+    from logging import DEBUG, INFO, getLogger
 
-def main():
     from . import log
 
     log.init()
 
     from .config import Config, ValidationError
-    from .helpers import BumprError
-    from .releaser import Releaser
 
-    config = Config.parse_args()
+    config = Config.parse_args(args)
     getLogger().setLevel(DEBUG if config.verbose else INFO)
     logger = getLogger(__name__)
 
@@ -22,6 +37,26 @@ def main():
         logger.error(msg)
         sys.exit(1)
 
+    from .helpers import BumprError
+
+    if plan:
+        from .plan import Plan
+
+        try:
+            Plan.load(config, plan).run()
+        except ValidationError as e:
+            logger.error("Invalid plan: {0}".format(e))
+            sys.exit(1)
+        except BumprError as error:
+            logger.error(str(error))
+            sys.exit(1)
+        return
+
+    if config.packages:
+        from .monorepo import MonorepoReleaser as Releaser
+    else:
+        from .releaser import Releaser
+
     try:
         releaser = Releaser(config)
         releaser.release()
@@ -1,22 +1,28 @@
 from __future__ import annotations
 
-import argparse
 import logging
+import os
 from configparser import RawConfigParser
+from copy import deepcopy
 from os.path import exists
 from typing import Any
 
 from bumpr.helpers import ObjectDict
 from bumpr.hooks import HOOKS
+from bumpr.timings import FORMATS
 from bumpr.version import PARTS, Version
 
 logger = logging.getLogger(__name__)
 
 DEFAULTS: dict[str, Any] = {
     "file": None,
-    "regex": r'(__version__|VERSION)\s*=\s*(\'|")(?P<version>.+?)(\'|")',
+    "regex": r'(?m)^\s*(__version__|VERSION)\s*=\s*(\'|")(?P<version>.+?)(\'|")',
+    "regex_scan_bytes": None,
+    "regex_max_line": None,
     "encoding": "utf8",
     "vcs": None,
+    "fsmonitor": False,
+    "validate_paths": [],
     "commit": True,
     "tag": True,
     "tag_format": "{version}",
@@ -31,6 +37,20 @@ DEFAULTS: dict[str, Any] = {
     "bump_only": False,
     "prepare_only": False,
     "files": [],
+    "exclude": [],
+    "jobs": 1,
+    "parallel": [],
+    "parallel_jobs": None,
+    "output_log": None,
+    "timeout": None,
+    "retries": 0,
+    "retry": ["publish", "push"],
+    "retry_backoff": 1.0,
+    "stream_threshold": 16 * 1024 * 1024,
+    "timings": False,
+    "timings_output": None,
+    "timings_format": "json",
+    "cache": False,
     "bump": {
         "unsuffix": True,
         "suffix": None,
@@ -43,6 +63,48 @@ DEFAULTS: dict[str, Any] = {
         "part": None,
         "message": "Update to version {version} for next development cycle",
     },
+    "packages": {},
+    "only": [],
+}
+
+PACKAGE_PREFIX = "package:"
+
+# Commands blocks which can run their commands in parallel
+PARALLEL_BLOCKS = ("clean", "tests", "publish")
+
+# Phases whose commands can be retried on failure
+RETRY_PHASES = ("clean", "tests", "publish", "push")
+
+# Typed options of the `bumpr` and packages sections, the others being strings
+BOOLEAN_OPTIONS = (
+    "tag",
+    "commit",
+    "push",
+    "bump_only",
+    "prepare_only",
+    "skip_tests",
+    "timings",
+    "cache",
+    "fsmonitor",
+)
+INT_OPTIONS = (
+    "jobs",
+    "stream_threshold",
+    "regex_scan_bytes",
+    "regex_max_line",
+    "parallel_jobs",
+    "retries",
+)
+FLOAT_OPTIONS = ("timeout", "retry_backoff")
+LINES_OPTIONS = ("files", "exclude", "validate_paths")
+LIST_OPTIONS = ("parallel", "retry")
+
+PACKAGE_DEFAULTS: dict[str, Any] = {
+    "path": None,
+    "tag_format": "{name}-{version}",
+    "clean": None,
+    "tests": None,
+    "publish": None,
 }
 
 
@@ -85,6 +147,11 @@ class BumprConfigParser(RawConfigParser):
             if RawConfigParser.has_option(self, section, option):
                 return RawConfigParser.getboolean(self, section, option)
 
+    def getint(self, section, option):
+        for section in self.candidate_sections(section):
+            if RawConfigParser.has_option(self, section, option):
+                return RawConfigParser.getint(self, section, option)
+
     def items(self, section):
         for section in self.candidate_sections(section):
             if RawConfigParser.has_section(self, section):
@@ -118,23 +185,7 @@ class Config(ObjectDict):
         # Common options
         if config.has_section("bumpr"):
             for option in config.options("bumpr"):
-                if option in (
-                    "tag",
-                    "commit",
-                    "push",
-                    "bump_only",
-                    "prepare_only",
-                    "skip_tests",
-                ):
-                    self[option] = config.getboolean("bumpr", option)
-                elif option == "files":
-                    self.files = [
-                        name.strip()
-                        for name in config.get("bumpr", "files").split("\n")
-                        if name.strip()
-                    ]
-                else:
-                    self[option] = config.get("bumpr", option)
+                self[option] = self.parse_option(config, "bumpr", option)
 
         # Bump and next section
         for section in "bump", "prepare":
@@ -155,8 +206,72 @@ class Config(ObjectDict):
             else:
                 self[hook.key] = False
 
+        # Monorepo packages
+        for section in config.sections():
+            if section.startswith("bumpr:"):
+                section_key = section.split(":", 1)[1]
+            else:
+                section_key = section
+            prefix, _, key = section_key.partition(PACKAGE_PREFIX)
+            if prefix or not key:
+                continue
+            name, _, hook_key = key.partition(":")
+            package = self.packages.setdefault(name, ObjectDict())
+            if hook_key:
+                hook = next((hook for hook in HOOKS if hook.key == hook_key), None)
+                if hook is None:
+                    raise ValidationError("Unknown hook {0} for package {1}".format(hook_key, name))
+                package[hook.key] = dict(hook.defaults, **dict(config.items(section)))
+                continue
+            for option in config.options(section):
+                package[option] = self.parse_option(config, section, option)
+
+    @staticmethod
+    def parse_option(config, section, option):
+        """Parse an option of the `bumpr` or a package section according to its type"""
+        if option in BOOLEAN_OPTIONS:
+            return config.getboolean(section, option)
+        elif option in INT_OPTIONS:
+            return config.getint(section, option)
+        elif option in FLOAT_OPTIONS:
+            return float(config.get(section, option))
+        elif option in LINES_OPTIONS:
+            return [
+                name.strip() for name in config.get(section, option).split("\n") if name.strip()
+            ]
+        elif option in LIST_OPTIONS:
+            return config.get(section, option).replace(",", " ").split()
+        return config.get(section, option)
+
+    def package(self, name):
+        """
+        Build the configuration of a single package from a monorepo configuration.
+
+        Packages inherit the common options but neither the hooks
+        nor the `clean`, `tests` and `publish` commands which are executed once for all.
+        """
+        if name not in self.packages:
+            raise ValidationError("Unknown package {0}".format(name))
+        config = deepcopy(self)
+        config.update(PACKAGE_DEFAULTS, name=name, packages={}, only=[], files=[], exclude=[])
+        for hook in HOOKS:
+            config[hook.key] = False
+        config.merge(deepcopy(self.packages[name]))
+        return config
+
     def override_from_args(self, parsed_args):
-        for arg in "file", "vcs", "files":
+        for arg in (
+            "file",
+            "vcs",
+            "files",
+            "jobs",
+            "only",
+            "timings_output",
+            "timings_format",
+            "output_log",
+            "timeout",
+            "retries",
+        ):
             if arg in parsed_args and getattr(parsed_args, arg) not in (
                 None,
                 [],
@@ -164,13 +279,13 @@ class Config(ObjectDict):
             ):
                 self[arg] = getattr(parsed_args, arg)
 
-        for arg in "verbose", "dryrun":
+        for arg in "verbose", "dryrun", "timings":
             if arg in parsed_args and getattr(parsed_args, arg):
                 self[arg] = True
 
         if hasattr(parsed_args, "nocommit"):
             self.commit = not parsed_args.nocommit
-        for attr in "bump_only", "prepare_only", "push", "skip_tests":
+        for attr in "bump_only", "prepare_only", "push", "skip_tests", "cache":
             if hasattr(parsed_args, attr):
                 self[attr] = getattr(parsed_args, attr)
 
@@ -191,16 +306,48 @@ class Config(ObjectDict):
             self.prepare.unsuffix = parsed_args.prepare_unsuffix
 
     def validate(self):
-        if not self.file:
+        if self.packages:
+            for name in self.only:
+                if name not in self.packages:
+                    raise ValidationError("Unknown package {0}".format(name))
+            for name, package in self.packages.items():
+                if not package.get("file"):
+                    raise ValidationError("Package {0} requires a file".format(name))
+        elif not self.file:
             raise ValidationError(
                 "A file is required from the configuration file or the command line"
             )
+        for block in self.parallel:
+            if block not in PARALLEL_BLOCKS:
+                raise ValidationError(
+                    "Unknown parallel block {0}, expected some of: {1}".format(
+                        block, ", ".join(PARALLEL_BLOCKS)
+                    )
+                )
+        for phase in self.retry:
+            if phase not in RETRY_PHASES:
+                raise ValidationError(
+                    "Unknown retry phase {0}, expected some of: {1}".format(
+                        phase, ", ".join(RETRY_PHASES)
+                    )
+                )
+        if self.timings_format not in FORMATS:
+            raise ValidationError(
+                "Unknown timings format {0}, expected one of: {1}".format(
+                    self.timings_format, ", ".join(FORMATS)
+                )
+            )
 
     @classmethod
     def parse_args(cls, args=None):
+        import argparse
+
         from bumpr import __description__, __version__
 
-        parser = argparse.ArgumentParser(description=__description__)
+        parser = argparse.ArgumentParser(
+            description=__description__,
+            epilog="Use bumpr plan PLANFILE [options] to release many versions from a plan file",
+        )
 
         parser.add_argument("file", help="Versionned module file", nargs="?")
         parser.add_argument("files", help="Files to update", nargs="*")
@@ -229,6 +376,76 @@ class Config(ObjectDict):
             default=argparse.SUPPRESS,
             help="Skip tests",
         )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="Number of files to rewrite and of monorepo package commands to run in parallel",
+        )
+
+        parser.add_argument(
+            "--output-log",
+            dest="output_log",
+            metavar="FILE",
+            default=None,
+            help="Append the full output of the executed commands to FILE",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            metavar="SECONDS",
+            default=None,
+            help="Stop any command running for more than SECONDS",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            metavar="N",
+            default=None,
+            help="Retry the failed commands of the retry phases (publish and push) up to N times",
+        )
+        parser.add_argument(
+            "--timings",
+            action="store_true",
+            help="Display the time spent in each phase and hook",
+        )
+        parser.add_argument(
+            "--timings-output",
+            dest="timings_output",
+            metavar="FILE",
+            default=None,
+            help="Export the timings to FILE",
+        )
+        parser.add_argument(
+            "--timings-format",
+            dest="timings_format",
+            choices=FORMATS,
+            default=None,
+            help="Timings export format: JSON or Chrome trace events (default: json)",
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            default=argparse.SUPPRESS,
+            help="Reuse and update the state of previous runs stored in .bumpr/",
+        )
+        parser.add_argument(
+            "--no-cache",
+            action="store_false",
+            dest="cache",
+            default=argparse.SUPPRESS,
+            help="Ignore the state of previous runs",
+        )
+
+        parser.add_argument(
+            "-k",
+            "--package",
+            dest="only",
+            action="append",
+            default=None,
+            help="Only release this package from a monorepo configuration (can be repeated)",
+        )
 
         group = parser.add_mutually_exclusive_group()
         group.add_argument(
@@ -326,7 +543,9 @@ class Config(ObjectDict):
         )
 
         group = parser.add_argument_group("Version control system")
-        group.add_argument("--vcs", choices=["git", "hg"], default=None, help="VCS implementation")
+        group.add_argument(
+            "--vcs", choices=["git", "git-native", "hg"], default=None, help="VCS implementation"
+        )
         group.add_argument(
             "-nc",
             "--nocommit",
@@ -351,4 +570,27 @@ class Config(ObjectDict):
         )
 
         parsed_args = parser.parse_args(args)
-        return cls(parsed_args=parsed_args)
+        if not getattr(parsed_args, "cache", True):
+            return cls(parsed_args=parsed_args)
+
+        from bumpr.state import State, config_key
+
+        state = State()
+        key = config_key(parsed_args, ["setup.cfg", parsed_args.config])
+        if os.path.isdir(state.directory):
+            cached = state.config(key)
+            if cached is not None:
+                logger.debug("Using the cached configuration")
+                return cls.restore(cached)
+        config = cls(parsed_args=parsed_args)
+        if config.cache:
+            state.store_config(key, config)
+            state.save()
+        return config
+
+    @classmethod
+    def restore(cls, data):
+        """Rebuild a complete configuration, as cached by a previous run, without reading any file"""
+        config = cls.__new__(cls)
+        ObjectDict.__init__(config, data)
+        return config
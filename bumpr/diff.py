@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Iterable, Iterator, Optional
+
+    Edit = tuple[int, int, str]
+
+__all__ = ("changed_region", "unified_diff")
+
+CONTEXT = 3
+
+
+def common_length(a: str, b: str, limit: int, suffix: bool = False) -> int:
+    """
+    The length of the common prefix (or suffix) of `a` and `b`, up to `limit`.
+
+    It is found by bisection with slices comparisons instead of comparing characters one by one.
+    """
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if suffix:
+            a_stop, b_stop = len(a) - low, len(b) - low
+            a_start, b_start = a_stop - (middle - low), b_stop - (middle - low)
+            same = a[a_start:a_stop] == b[b_start:b_stop]
+        else:
+            same = a[low:middle] == b[low:middle]
+        if same:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def changed_region(before: str, after: str) -> Edit:
+    """The single `(start, end, replacement)` edit turning `before` into `after`"""
+    limit = min(len(before), len(after))
+    prefix = common_length(before, after, limit)
+    suffix = common_length(before, after, limit - prefix, suffix=True)
+    stop = len(after) - suffix
+    return prefix, len(before) - suffix, after[prefix:stop]
+
+
+def format_range(start: int, length: int) -> str:
+    """A unified diff hunk range, `start` being 0-based"""
+    if length == 1:
+        return str(start + 1)
+    if not length:
+        return "{0},0".format(start)
+    return "{0},{1}".format(start + 1, length)
+
+
+def context_lines(text: str, position: int, count: int, forward: bool) -> list[str]:
+    """Up to `count` full lines of `text` after (or before) the line boundary at `position`"""
+    lines = []
+    for _ in range(count):
+        if forward:
+            if position >= len(text):
+                break
+            start = position + 1
+            end = text.find("\n", start)
+            end = len(text) if end < 0 else end
+            lines.append(text[start:end])
+            position = end
+        else:
+            if position <= 0:
+                break
+            end = position - 1
+            start = text.rfind("\n", 0, end) + 1
+            lines.insert(0, text[start:end])
+            position = start
+    return lines
+
+
+def group_edits(text: str, edits: Iterable[Edit], context: int) -> Iterator[tuple[int, int, list]]:
+    """
+    Group sorted edits whose lines are close enough to share a hunk.
+
+    Yields `(start, end, edits)` where `start` and `end` are the offsets of the first line start
+    and of the last line end covered by the group edits.
+    """
+    group: list[Edit] = []
+    start = end = 0
+    for edit in edits:
+        edit_start = text.rfind("\n", 0, edit[0]) + 1
+        # Hunks are merged when the unchanged lines between them fit in their contexts
+        if group and text.count("\n", end, edit_start) - 1 <= 2 * context:
+            group.append(edit)
+        else:
+            if group:
+                yield start, end, group
+            group = [edit]
+            start = edit_start
+        end = text.find("\n", edit[1])
+        end = len(text) if end < 0 else end
+    if group:
+        yield start, end, group
+
+
+def unified_diff(
+    before: str,
+    after: str,
+    edits: Optional[Iterable[Edit]] = None,
+    context: int = CONTEXT,
+    fromfile: str = "",
+    tofile: str = "",
+) -> Iterator[str]:
+    """
+    Lazily yield the unified diff lines of `before` and `after`, like `difflib.unified_diff`.
+
+    Only the lines around the `(start, end, replacement)` edits (sorted offsets in `before`)
+    are compared. Without edits, the region between the common prefix and suffix is used.
+    The `---` and `+++` file headers are only yielded when there is a change.
+    """
+    from difflib import SequenceMatcher
+
+    if edits is None:
+        edits = [changed_region(before, after)] if before != after else []
+    line = shift = 0
+    position = 0
+    headers = ["--- {0}".format(fromfile), "+++ {0}".format(tofile)]
+    for start, end, group in group_edits(before, edits, context):
+        line += before.count("\n", position, start)
+        position = start
+        parts, offset = [], start
+        for edit_start, edit_end, replacement in group:
+            parts.append(before[offset:edit_start])
+            parts.append(replacement)
+            offset = edit_end
+        parts.append(before[offset:end])
+
+        leading = context_lines(before, start, context, forward=False)
+        trailing = context_lines(before, end, context, forward=True)
+        a = leading + before[start:end].split("\n") + trailing
+        b = leading + "".join(parts).split("\n") + trailing
+        first = line - len(leading)
+
+        for opcodes in SequenceMatcher(None, a, b).get_grouped_opcodes(context):
+            yield from headers
+            headers = []
+            i1, i2, j1, j2 = opcodes[0][1], opcodes[-1][2], opcodes[0][3], opcodes[-1][4]
+            yield "@@ -{0} +{1} @@".format(
+                format_range(first + i1, i2 - i1), format_range(first + shift + j1, j2 - j1)
+            )
+            for tag, i1, i2, j1, j2 in opcodes:
+                if tag == "equal":
+                    for text in a[i1:i2]:
+                        yield " " + text
+                    continue
+                if tag in ("replace", "delete"):
+                    for text in a[i1:i2]:
+                        yield "-" + text
+                if tag in ("replace", "insert"):
+                    for text in b[j1:j2]:
+                        yield "+" + text
+        shift += len(b) - len(a)
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+from .helpers import BumprError
+
+if TYPE_CHECKING:
+    from typing import Iterable
+
+__all__ = ("Edit", "EditConflict", "EditList")
+
+
+class EditConflict(BumprError):
+    """Raised when two edits of the same file overlap"""
+
+
+class Edit(NamedTuple):
+    """Replace `length` characters at `offset` of the original text by `text`"""
+
+    offset: int
+    length: int
+    text: str
+    source: str = ""
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.length
+
+
+class EditList:
+    """
+    The pending edits of a file, all relative to its original `text`.
+
+    Edits from many sources (hooks, replacements) are combined and applied in a single pass.
+    Overlapping edits are conflicts.
+    """
+
+    def __init__(self, filename: str, text: str):
+        self.filename = filename
+        self.text = text
+        self.edits: list[Edit] = []
+
+    def __bool__(self):
+        return bool(self.edits)
+
+    def add(self, offset: int, length: int, text: str, source: str = ""):
+        """Add an edit. Conflicts are only checked when the edits are applied."""
+        self.edits.append(Edit(offset, length, text, source))
+
+    def extend(self, edits: Iterable[tuple[int, int, str]], source: str = ""):
+        """Add `(start, end, replacement)` edits"""
+        for start, end, text in edits:
+            self.add(start, end - start, text, source)
+
+    def replace(self, old: str, new: str, source: str = ""):
+        """Add the edits replacing every occurrence of `old` by `new`, like `str.replace()`"""
+        if not old:
+            return
+        position = self.text.find(old)
+        while position >= 0:
+            self.add(position, len(old), new, source)
+            position = self.text.find(old, position + len(old))
+
+    def ordered(self) -> list[Edit]:
+        """
+        The edits sorted by offset.
+
+        Raises an `EditConflict` if two edits overlap or insert text at the same offset.
+        """
+        edits = sorted(self.edits)
+        for previous, edit in zip(edits, edits[1:]):
+            if previous.end > edit.offset or (
+                previous.offset == edit.offset and not (previous.length and edit.length)
+            ):
+                raise EditConflict(
+                    "Conflicting edits of {0} at offset {1} from {2} and {3}".format(
+                        self.filename,
+                        edit.offset,
+                        previous.source or "unknown",
+                        edit.source or "unknown",
+                    )
+                )
+        return edits
+
+    def spans(self) -> list[tuple[int, int, str]]:
+        """The sorted `(start, end, replacement)` edits"""
+        return [(edit.offset, edit.end, edit.text) for edit in self.ordered()]
+
+    def apply(self) -> str:
+        """The original text with all edits applied"""
+        if not self.edits:
+            return self.text
+        parts = []
+        position = 0
+        for start, end, replacement in self.spans():
+            parts.append(self.text[position:start])
+            parts.append(replacement)
+            position = end
+        parts.append(self.text[position:])
+        return "".join(parts)
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import BinaryIO, Iterable, Iterator, Optional, Pattern
+
+    Signature = tuple[int, int, int, int]
+
+__all__ = ("ContentCache", "FileIndex", "Transaction", "is_pattern", "resolve", "translate")
+
+log = logging.getLogger(__name__)
+
+MAGIC = re.compile(r"[*?[]")
+
+VCS_DIRS = {".git", ".hg", ".bzr"}
+
+
+def is_pattern(name: str) -> bool:
+    """Wether a `files` entry is a glob pattern or a literal filename"""
+    return MAGIC.search(name) is not None
+
+
+def normalize(path: str) -> str:
+    """Normalize a relative path to its `/` separated form without leading `./`"""
+    path = path.replace(os.sep, "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path
+
+
+def translate(pattern: str) -> str:
+    """
+    Translate a glob pattern into a regular expression.
+
+    `*` and `?` never match a `/` while `**` match across directories.
+    """
+    i, n = 0, len(pattern)
+    res = []
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            if pattern.startswith("*", i):
+                i += 1
+                if pattern.startswith("/", i):
+                    i += 1
+                    res.append("(?:.*/)?")
+                else:
+                    res.append(".*")
+            else:
+                res.append("[^/]*")
+        elif c == "?":
+            res.append("[^/]")
+        elif c == "[":
+            j = i
+            if pattern.startswith(("!", "^"), j):
+                j += 1
+            if pattern.startswith("]", j):
+                j += 1
+            j = pattern.find("]", j)
+            if j < 0:
+                res.append(re.escape(c))
+            else:
+                content = pattern[i:j].replace("\\", "\\\\")
+                if content[0] in ("!", "^"):
+                    content = "^" + content[1:]
+                res.append("[{0}]".format(content))
+                i = j + 1
+        else:
+            res.append(re.escape(c))
+    return "".join(res)
+
+
+def compile_glob(pattern: str) -> Pattern[str]:
+    return re.compile("^{0}$".format(translate(normalize(pattern))))
+
+
+class IgnoreRule:
+    """A single `.gitignore` rule relative to the directory declaring it"""
+
+    def __init__(self, pattern: str, base: str = ""):
+        self.base = base
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\"):
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        prefix = "^" if anchored else "^(?:.*/)?"
+        self.regex = re.compile("{0}{1}$".format(prefix, translate(pattern)))
+
+    def match(self, path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            base, _, path = path.partition(self.base)
+            if base or not path:
+                return False
+        return self.regex.match(path) is not None
+
+    @classmethod
+    def load(cls, filename: str, base: str = "") -> list[IgnoreRule]:
+        try:
+            with open(filename, encoding="utf8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return []
+        rules = []
+        for line in lines:
+            line = line.rstrip()
+            if line and not line.startswith("#"):
+                rules.append(cls(line, base))
+        return rules
+
+
+def is_ignored(path: str, is_dir: bool, rules: Iterable[IgnoreRule]) -> bool:
+    ignored = False
+    for rule in rules:
+        if rule.match(path, is_dir):
+            ignored = not rule.negate
+    return ignored
+
+
+class FileIndex:
+    """
+    A lazy index of the files under `root`, honouring `.gitignore` files.
+
+    The tree is walked only once, on first access, and all patterns are resolved against it.
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = root
+        self._files: Optional[list[str]] = None
+
+    @property
+    def files(self) -> list[str]:
+        if self._files is None:
+            self._files = self.walk()
+        return self._files
+
+    def walk(self) -> list[str]:
+        log.debug("Indexing files in %s", self.root)
+        files: list[str] = []
+        rules_by_dir = {"": IgnoreRule.load(os.path.join(self.root, ".git", "info", "exclude"))}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            relative = normalize(os.path.relpath(dirpath, self.root))
+            prefix = "" if relative == "." else relative + "/"
+            rules = rules_by_dir.pop(prefix.rstrip("/"), [])
+            rules = rules + IgnoreRule.load(os.path.join(dirpath, ".gitignore"), prefix)
+
+            dirnames[:] = sorted(
+                name
+                for name in dirnames
+                if name not in VCS_DIRS and not is_ignored(prefix + name, True, rules)
+            )
+            for name in dirnames:
+                rules_by_dir[prefix + name] = rules
+            files.extend(
+                prefix + name
+                for name in sorted(filenames)
+                if not is_ignored(prefix + name, False, rules)
+            )
+        return files
+
+    def glob(self, pattern: str) -> list[str]:
+        """List the indexed files matching a glob pattern"""
+        regex = compile_glob(pattern)
+        return [path for path in self.files if regex.match(path)]
+
+    def expand(self, names: Iterable[str], excludes: Iterable[str] = ()) -> list[str]:
+        """
+        Expand glob patterns from a list of filenames.
+
+        Literal filenames are kept as is while patterns are expanded and filtered by `excludes`.
+        The order is preserved and each file is listed only once.
+        """
+        exclusions = [compile_glob(pattern) for pattern in excludes]
+        expanded: dict[str, None] = {}
+        for name in names:
+            if not is_pattern(name):
+                expanded.setdefault(name)
+                continue
+            matches = [
+                path
+                for path in self.glob(name)
+                if not any(regex.match(path) for regex in exclusions)
+            ]
+            if not matches:
+                log.warning("No file matching %s", name)
+            for path in matches:
+                expanded.setdefault(path)
+        return list(expanded)
+
+
+def resolve(filename: str) -> str:
+    """
+    The normalized path of the file `filename` stands for.
+
+    `./X` and `X` resolve to the same path and symbolic links to the file they point to.
+    """
+    filename = os.path.normpath(filename)
+    if not os.path.islink(filename):
+        return filename
+    target = os.path.realpath(filename)
+    return target if os.path.isabs(filename) else os.path.relpath(target)
+
+
+class Transaction:
+    """
+    Stage files rewrites and apply them all together.
+
+    Each rewrite is written to a synced temporary file next to its target.
+    `commit()` renames them into place, keeping a backup of the originals
+    until `close()` so `rollback()` can restore every original file.
+    Symbolic links are resolved so their targets are rewritten, not the links themselves.
+    """
+
+    def __init__(self):
+        self.staged: dict[str, str] = {}
+        self.backups: dict[str, Optional[str]] = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, filename: str) -> bool:
+        return resolve(filename) in self.staged
+
+    @property
+    def committed(self) -> list[str]:
+        """The files renamed into place by `commit()`"""
+        return list(self.backups)
+
+    def path(self, filename: str) -> str:
+        """The path to read `filename` current content from"""
+        filename = resolve(filename)
+        return self.staged.get(filename, filename)
+
+    @contextmanager
+    def stage(self, filename: str) -> Iterator[BinaryIO]:
+        """Stage the content of `filename` written in the yielded binary file"""
+        filename = resolve(filename)
+        dirname, basename = os.path.split(os.path.abspath(filename))
+        fd, tmp = tempfile.mkstemp(prefix=".{0}.".format(basename), suffix=".tmp", dir=dirname)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self.lock:
+            previous = self.staged.get(filename)
+            self.staged[filename] = tmp
+        if previous:
+            os.unlink(previous)
+
+    def commit(self):
+        """Rename all staged files into place. Originals are restored on failure."""
+        try:
+            while self.staged:
+                filename, tmp = next(iter(self.staged.items()))
+                exists = os.path.exists(filename)
+                if exists:
+                    shutil.copymode(filename, tmp)
+                if filename not in self.backups:
+                    # Only the first backup holds the original content
+                    backup = None
+                    if exists:
+                        backup = tmp[: -len(".tmp")] + ".bak"
+                        try:
+                            os.link(filename, backup)
+                        except OSError:
+                            shutil.copy2(filename, backup)
+                    self.backups[filename] = backup
+                os.replace(tmp, filename)
+                del self.staged[filename]
+        except BaseException:
+            self.rollback()
+            raise
+
+    def rollback(self):
+        """Drop the staged files and restore the already committed ones"""
+        for tmp in self.staged.values():
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        self.staged.clear()
+        for filename, backup in self.backups.items():
+            try:
+                if backup:
+                    os.replace(backup, filename)
+                    if os.path.exists(backup):
+                        # Renaming a hard link over the same inode is a no-op
+                        os.unlink(backup)
+                elif os.path.exists(filename):
+                    os.unlink(filename)
+                log.debug("Restored %s", filename)
+            except OSError as e:
+                log.error("Unable to restore %s: %s", filename, e)
+        self.backups.clear()
+
+    def close(self):
+        """Drop the staged files and the originals backups"""
+        for path in list(self.staged.values()) + list(self.backups.values()):
+            if path and os.path.exists(path):
+                os.unlink(path)
+        self.staged.clear()
+        self.backups.clear()
+
+
+def signature(stat: os.stat_result) -> Signature:
+    """Identify a file content version from its device, inode, modification time and size"""
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class ContentCache:
+    """
+    Raw contents of the files read or written during a run.
+
+    Contents are keyed by their file signature (see `signature()`), checked on each read,
+    so a file modified by anyone else is read again and a content written to a temporary file
+    is still known once that file is renamed into place.
+    """
+
+    def __init__(self):
+        self.contents: dict[Signature, bytes] = {}
+        self.signatures: dict[str, Signature] = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def read(self, path: str) -> bytes:
+        """The raw content of `path`, read from disk only if unknown or modified"""
+        key = signature(os.stat(path))
+        data = self.contents.get(key)
+        if data is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            with open(path, "rb") as f:
+                data = f.read()
+                key = signature(os.fstat(f.fileno()))
+        self.remember(path, key, data)
+        return data
+
+    def store(self, path: str, data: bytes):
+        """Remember `data` as the content just written to `path`"""
+        self.remember(path, signature(os.stat(path)), data)
+
+    def remember(self, path: str, key: Signature, data: bytes):
+        with self.lock:
+            previous = self.signatures.get(path)
+            if previous is not None and previous != key:
+                self.contents.pop(previous, None)
+            self.signatures[path] = key
+            self.contents[key] = data
@@ -1,23 +1,69 @@
 from __future__ import annotations
 
+import codecs
+import locale
 import logging
+import os
 import shlex
+import signal
 import subprocess
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+
+log = logging.getLogger(__name__)
+
+# Size of the output chunks read from commands running in parallel
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+# Number of output lines of a command kept to be displayed on failure
+OUTPUT_TAIL_LINES = 200
+
+# Delay given to cancelled commands to exit before being killed
+TERMINATE_TIMEOUT = 5
+
+# Signals terminating the running commands before interrupting bumpr
+SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+# The running commands processes, with wether they lead their own process group
+RUNNING: dict = {}
+RUNNING_LOCK = threading.Lock()
 
 
 class BumprError(Exception):
     pass
 
 
-def check_output(*args, **kwargs):
-    """A wrapper for preconfigured calls to subprocess.check_output"""
-    return subprocess.check_output(
-        stderr=subprocess.STDOUT, universal_newlines=True, *args, **kwargs
-    )
+def execute(
+    command,
+    verbose=False,
+    replacements=None,
+    dryrun=False,
+    cwd=None,
+    parallel=False,
+    jobs=None,
+    capture=False,
+    spool=None,
+    timeout=None,
+    retries=0,
+    backoff=1,
+):
+    """
+    Execute a command or a block of commands (one by line or a list of arguments lists).
 
+    With `parallel`, the commands of a block run concurrently, at most `jobs` at once
+    (see `execute_parallel()`). Otherwise they run one after the other.
 
-def execute(command, verbose=False, replacements=None, dryrun=False):
-    logger = logging.getLogger(__name__)
+    Commands output is streamed line by line to the debug log (or to stdout when `verbose`)
+    and appended to the `spool` file if any. Only its last lines are kept to be displayed
+    on failure, unless `capture` is set: the whole output is then kept and returned.
+
+    Each command is stopped after `timeout` seconds. Failed or timed out commands are retried
+    up to `retries` times, waiting `backoff` seconds doubled on each attempt.
+    Running commands are terminated on SIGINT and SIGTERM.
+    """
     replacements = replacements or {}
     if not command:
         return
@@ -31,23 +77,405 @@ def execute(command, verbose=False, replacements=None, dryrun=False):
         command = command.format(**replacements)
         commands = [shlex.split(cmd.strip()) for cmd in command.splitlines() if cmd.strip()]
 
-    output = ""
-    for cmd in commands:
+    if dryrun:
+        for cmd in commands:
+            log.dryrun("execute: {0}".format(" ".join(cmd)))
+        return ""
+
+    with ExitStack() as stack:
+        stack.enter_context(cancellable())
+        spool = stack.enter_context(open(spool, "a")) if spool else None
+        if parallel and len(commands) > 1:
+            try:
+                return execute_parallel(
+                    commands, verbose, cwd, jobs, capture, spool, timeout, retries, backoff
+                )
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as exception:
+                raise command_error(exception)
+
+        outputs = []
+        for cmd in commands:
+            for attempt in range(retries + 1):
+                output = None
+                if capture or spool or not verbose:
+                    output = CommandOutput(capture=capture, spool=spool, echo=verbose)
+                try:
+                    run_command(cmd, output, cwd, timeout)
+                    break
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as exception:
+                    if attempt >= retries:
+                        raise command_error(exception)
+                    delay = backoff * 2**attempt
+                    log.warning(
+                        "%s, retrying in %gs (%d/%d)",
+                        describe(exception),
+                        delay,
+                        attempt + 1,
+                        retries,
+                    )
+                    time.sleep(delay)
+            if capture:
+                outputs.append(output.text)
+        return "".join(outputs)
+
+
+class CommandOutput:
+    """
+    A command output, handled line by line with a bounded memory.
+
+    Lines are sent to the debug log (or to stdout with `echo`) and to the `spool` file if any.
+    Only the last `tail` lines are kept, unless the output is captured.
+    """
+
+    def __init__(self, prefix="", capture=False, spool=None, echo=False, tail=OUTPUT_TAIL_LINES):
+        self.prefix = prefix
+        self.lines = [] if capture else deque(maxlen=tail)
+        self.spool = spool
+        self.echo = echo
+        self.count = 0
+
+    def write(self, line):
+        self.count += 1
+        self.lines.append(line)
+        if self.echo:
+            sys.stdout.write(self.prefix + line)
+        else:
+            log.debug("%s%s", self.prefix, line.rstrip("\n"))
+        if self.spool:
+            self.spool.write(self.prefix + line)
+
+    @property
+    def text(self):
+        """The kept lines, preceded by the number of dropped lines if any"""
+        dropped = self.count - len(self.lines)
+        header = "[{0} lines skipped]\n".format(dropped) if dropped else ""
+        return header + "".join(self.lines)
+
+    @property
+    def error_output(self):
+        """The output to display on failure: nothing if it has already been displayed"""
+        return "" if self.echo else self.text
+
+
+def interactive():
+    """Wether commands inheriting the terminal may prompt the user"""
+    try:
+        return sys.stdin is not None and sys.stdin.isatty()
+    except ValueError:
+        return False
+
+
+def send_signal(process, group, sig):
+    """Send a signal to a process or to its whole process group"""
+    try:
+        if group and hasattr(os, "killpg"):
+            os.killpg(process.pid, sig)
+        else:
+            process.send_signal(sig)
+    except OSError:
+        pass
+
+
+def stop(process, group, timeout=TERMINATE_TIMEOUT):
+    """Terminate a process (group), killing it if it is still running after `timeout` seconds"""
+    if process.returncode is not None:
+        return
+    send_signal(process, group, signal.SIGTERM)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        send_signal(process, group, getattr(signal, "SIGKILL", signal.SIGTERM))
+        process.wait()
+
+
+@contextmanager
+def running(process, group):
+    """Track a running process so it is terminated on SIGINT and SIGTERM"""
+    with RUNNING_LOCK:
+        RUNNING[process] = group
+    try:
+        yield
+    finally:
+        with RUNNING_LOCK:
+            RUNNING.pop(process, None)
+
+
+@contextmanager
+def cancellable():
+    """
+    Terminate the running commands on SIGINT and SIGTERM before interrupting bumpr.
+
+    Handlers can only be installed from the main thread, they are left untouched otherwise.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def handler(signum, frame):
+        with RUNNING_LOCK:
+            processes = list(RUNNING.items())
+        for process, group in processes:
+            send_signal(process, group, signal.SIGTERM)
+        if signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        raise SystemExit(128 + signum)
+
+    previous = {sig: signal.signal(sig, handler) for sig in SIGNALS}
+    try:
+        yield
+    finally:
+        for sig, previous_handler in previous.items():
+            signal.signal(sig, previous_handler if previous_handler is not None else signal.SIG_DFL)
+
+
+def run_command(cmd, output=None, cwd=None, timeout=None):
+    """
+    Run a command, raising `CalledProcessError` on failure or `TimeoutExpired` after `timeout` seconds.
+
+    Its merged stdout and stderr lines are written to the `output` (a `CommandOutput`) if any.
+    Otherwise it inherits the terminal.
+    Commands run in their own process group, stopped as a whole on timeout or interruption,
+    except commands inheriting an interactive terminal: they stay in the foreground process group
+    so they can still prompt the user.
+    """
+    group = output is not None or not interactive()
+    kwargs = {}
+    if output is not None:
+        kwargs = dict(
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            errors="replace",
+        )
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        stop(process, group)
+
+    process = subprocess.Popen(cmd, cwd=cwd, start_new_session=group, **kwargs)
+    timer = threading.Timer(timeout, expire) if timeout else None
+    with running(process, group):
         try:
-            if dryrun:
-                logger.dryrun("execute: {0}".format(" ".join(cmd)))
-            elif verbose:
-                subprocess.check_call(cmd)
-            else:
-                output += check_output(cmd)
-        except subprocess.CalledProcessError as exception:
-            if hasattr(exception, "output") and exception.output:
-                print(exception.output)
-            cmd = " ".join(cmd) if isinstance(cmd, (list, tuple)) else cmd
-            raise BumprError(
-                'Command "{0}" failed with exit code {1}'.format(cmd, exception.returncode)
-            )
-    return output
+            if timer:
+                timer.start()
+            if output is not None:
+                for line in process.stdout:
+                    output.write(line)
+            process.wait()
+        except BaseException:
+            stop(process, group)
+            raise
+        finally:
+            if timer:
+                timer.cancel()
+            if process.stdout:
+                process.stdout.close()
+    error_output = output.error_output if output is not None else None
+    if expired.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, output=error_output)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd, output=error_output)
+
+
+def iter_lines(command, cwd=None, timeout=None):
+    """
+    Lazily yield the output lines of a command, without their line ending.
+
+    Closing the generator before the end stops the command,
+    so callers can stop reading as soon as they found what they were looking for.
+    Raises a `BumprError` if the command fails or runs for more than `timeout` seconds.
+    """
+    import tempfile
+
+    cmd = shlex.split(command) if isinstance(command, str) else list(command)
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        stop(process, True)
+
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            universal_newlines=True,
+            errors="replace",
+            start_new_session=True,
+        )
+        timer = threading.Timer(timeout, expire) if timeout else None
+        with running(process, True):
+            try:
+                if timer:
+                    timer.start()
+                for line in process.stdout:
+                    yield line.rstrip("\r\n")
+                process.wait()
+            except BaseException:
+                stop(process, True)
+                raise
+            finally:
+                if timer:
+                    timer.cancel()
+                process.stdout.close()
+        stderr.seek(0)
+        error_output = stderr.read().decode(locale.getpreferredencoding(False), "replace")
+    if expired.is_set():
+        raise command_error(subprocess.TimeoutExpired(cmd, timeout, output=error_output))
+    if process.returncode:
+        raise command_error(
+            subprocess.CalledProcessError(process.returncode, cmd, output=error_output)
+        )
+
+
+def describe(exception):
+    """Describe a failed command"""
+    cmd = exception.cmd
+    cmd = " ".join(cmd) if isinstance(cmd, (list, tuple)) else cmd
+    if isinstance(exception, subprocess.TimeoutExpired):
+        return 'Command "{0}" timed out after {1:g}s'.format(cmd, exception.timeout)
+    return 'Command "{0}" failed with exit code {1}'.format(cmd, exception.returncode)
+
+
+def command_error(exception):
+    """Display a failed command output and build its error"""
+    if hasattr(exception, "output") and exception.output:
+        print(exception.output)
+    return BumprError(describe(exception))
+
+
+def command_prefixes(commands):
+    """Aligned output prefixes from the commands programs names, numbered when not unique"""
+    names = [os.path.basename(cmd[0]) for cmd in commands]
+    counts = Counter(names)
+    seen: Counter[str] = Counter()
+    for i, name in enumerate(names):
+        if counts[name] > 1:
+            seen[name] += 1
+            names[i] = "{0}#{1}".format(name, seen[name])
+    width = max(len(name) for name in names)
+    return ["{0:<{1}} | ".format(name, width) for name in names]
+
+
+def execute_parallel(
+    commands,
+    verbose=False,
+    cwd=None,
+    jobs=None,
+    capture=False,
+    spool=None,
+    timeout=None,
+    retries=0,
+    backoff=1,
+):
+    """
+    Run commands concurrently in an asyncio event loop, at most `jobs` at once.
+
+    Output lines are prefixed by their command name (see `CommandOutput`).
+    The first failure (after its retries) cancels the pending commands
+    and terminates the running ones, its `CalledProcessError` or `TimeoutExpired` being raised.
+    Returns the captured outputs, concatenated in the commands order.
+    """
+    import asyncio
+
+    return asyncio.run(
+        run_commands(commands, verbose, cwd, jobs, capture, spool, timeout, retries, backoff)
+    )
+
+
+async def terminate(process, timeout=TERMINATE_TIMEOUT):
+    """Terminate a process group, killing it if it is still running after `timeout` seconds"""
+    import asyncio
+
+    if process.returncode is not None:
+        return
+    send_signal(process, True, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        send_signal(process, True, getattr(signal, "SIGKILL", signal.SIGTERM))
+        await process.wait()
+
+
+async def read_output(process, output):
+    """Write a process output lines to a `CommandOutput` and wait for its exit code"""
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+    pending = ""
+    chunk = True
+    while chunk:
+        chunk = await process.stdout.read(OUTPUT_CHUNK_SIZE)
+        lines = (pending + decoder.decode(chunk, final=not chunk)).split("\n")
+        # The last line is incomplete until the output ends
+        pending = lines.pop() if chunk else ""
+        for line in lines[:-1] if not chunk and not lines[-1] else lines:
+            output.write(line + "\n")
+    if output.echo:
+        sys.stdout.flush()
+    return await process.wait()
+
+
+async def run_async_command(cmd, output, cwd=None, timeout=None):
+    """The asyncio counterpart of `run_command()`, always in its own process group"""
+    import asyncio
+
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd, start_new_session=True
+    )
+    with running(process, True):
+        try:
+            returncode = await asyncio.wait_for(read_output(process, output), timeout)
+        except asyncio.TimeoutError:
+            await terminate(process)
+            raise subprocess.TimeoutExpired(cmd, timeout, output=output.error_output)
+        except BaseException:
+            await terminate(process)
+            raise
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, output=output.error_output)
+
+
+async def run_commands(
+    commands, verbose, cwd, jobs, capture=False, spool=None, timeout=None, retries=0, backoff=1
+):
+    import asyncio
+
+    semaphore = asyncio.Semaphore(jobs or len(commands))
+    prefixes = command_prefixes(commands)
+    outputs = [None] * len(commands)
+
+    async def run(index, cmd):
+        async with semaphore:
+            for attempt in range(retries + 1):
+                outputs[index] = output = CommandOutput(
+                    prefixes[index], capture=capture, spool=spool, echo=verbose
+                )
+                try:
+                    await run_async_command(cmd, output, cwd, timeout)
+                    return
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as exception:
+                    if attempt >= retries:
+                        raise
+                    delay = backoff * 2**attempt
+                    log.warning(
+                        "%s, retrying in %gs (%d/%d)",
+                        describe(exception),
+                        delay,
+                        attempt + 1,
+                        retries,
+                    )
+                    await asyncio.sleep(delay)
+
+    tasks = [asyncio.ensure_future(run(i, cmd)) for i, cmd in enumerate(commands)]
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception():
+            raise task.exception()
+    return "".join(output.text for output in outputs) if capture else ""
 
 
 class ObjectDict(dict):
@@ -57,7 +485,10 @@ class ObjectDict(dict):
         self.update(*args, **kwargs)
 
     def __getattr__(self, key):
-        return self[key]
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
 
     def __setattr__(self, key, value):
         if isinstance(value, dict) and not isinstance(value, ObjectDict):
@@ -41,6 +41,10 @@ class Hook:
     def prepare(self, replacements):
         pass
 
+    def modifies_any_file(self, phase):
+        """Wether the hook may modify files outside of the releaser edits during `phase`"""
+        return False
+
 
 class ReadTheDocHook(Hook):
     """
@@ -92,10 +96,8 @@ class ChangelogHook(Hook):
             raise BumprError("Changelog file does not exists")
 
     def bump(self, replacements):
-        with open(self.config.file, "r", encoding=self.releaser.config.encoding) as changelog_file:
-            before = changelog_file.read()
-            after = before.replace(self.dev_header(), self.bumped_header())
-        self.releaser.perform(self.config.file, before, after)
+        edits = self.releaser.edit(self.config.file)
+        edits.replace(self.dev_header(), self.bumped_header(), self.key)
 
     def prepare(self, replacements):
         next_header = "\n".join(
@@ -107,10 +109,8 @@ class ChangelogHook(Hook):
                 self.bumped_header(),
             )
         )
-        with open(self.config.file, "r", encoding=self.releaser.config.encoding) as changelog_file:
-            before = changelog_file.read()
-            after = before.replace(self.bumped_header(), next_header)
-        self.releaser.perform(self.config.file, before, after)
+        edits = self.releaser.edit(self.config.file)
+        edits.replace(self.bumped_header(), next_header, self.key)
 
     def dev_header(self):
         return self.underline(self.config.prepare)
@@ -149,12 +149,7 @@ class CommandsHook(Hook):
                 date=self.releaser.timestamp,
                 **self.releaser.version.__dict__,
             )
-            execute(
-                self.config.bump,
-                replacements=replacements,
-                verbose=self.verbose,
-                dryrun=self.dryrun,
-            )
+            self.execute(self.config.bump, replacements)
 
     def prepare(self, replacements):
         if self.config.prepare:
@@ -164,12 +159,16 @@ class CommandsHook(Hook):
                 date=self.releaser.timestamp,
                 **self.releaser.next_version.__dict__,
             )
-            execute(
-                self.config.prepare,
-                replacements=replacements,
-                verbose=self.verbose,
-                dryrun=self.dryrun,
-            )
+            self.execute(self.config.prepare, replacements)
+
+    def execute(self, command, replacements):
+        """Execute a hook command with the releaser commands timeout and output log"""
+        options = self.releaser.execute_options(verbose=self.verbose)
+        options["dryrun"] = self.dryrun
+        execute(command, replacements=replacements, **options)
+
+    def modifies_any_file(self, phase):
+        return bool(self.config.get(phase))
 
 
 class ReplaceHook(Hook):
@@ -52,16 +52,21 @@ class ANSIFormatter(Formatter):
         elif record.levelname == "DRYRUN":
             return ansi("magenta", "dryrun-> ") + msg
         elif record.levelname == "DIFF":
-            if msg.startswith("+"):
-                return ansi("green", msg)
-            elif msg.startswith("-"):
-                return ansi("red", msg)
-            else:
-                return msg
+            return "\n".join(self.format_diff(line) for line in msg.split("\n"))
         else:
             color = LEVEL_COLORS.get(record.levelname, "white")
             return ansi(color, record.levelname.lower()) + ": " + msg
 
+    def format_diff(self, line):
+        if line.startswith("+"):
+            return ansi("green", line)
+        elif line.startswith("-"):
+            return ansi("red", line)
+        elif line.startswith("@@"):
+            return ansi("cyan", line)
+        else:
+            return line
+
 
 class TextFormatter(Formatter):
     """
@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+from collections import Counter
+
+from .files import ContentCache, FileIndex
+from .helpers import BumprError, execute
+from .releaser import Releaser, covering_paths
+from .timings import Timings
+
+logger = logging.getLogger(__name__)
+
+__all__ = ("MonorepoReleaser", "dependency_waves", "read_project")
+
+PROJECT_FILE = "pyproject.toml"
+
+REQUIREMENT_NAME = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+def normalize_name(name):
+    """Normalize a distribution name as specified by PEP 503"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def load_toml(filename):
+    try:
+        import tomllib  # type: ignore
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib  # type: ignore
+        except ImportError:
+            raise BumprError("tomli is required to read {0}".format(filename))
+    with open(filename, "rb") as f:
+        return tomllib.load(f)
+
+
+def find_package_path(filename):
+    """
+    Find a package root directory from its version file.
+
+    This is the closest parent directory having a `pyproject.toml` file
+    or the version file directory if there is none.
+    """
+    start = os.path.dirname(os.path.normpath(filename))
+    path = start
+    while path:
+        if os.path.exists(os.path.join(path, PROJECT_FILE)):
+            return path
+        path = os.path.dirname(path)
+    return start or "."
+
+
+def read_project(path):
+    """
+    Read a package distribution name and runtime dependencies names from its `pyproject.toml`.
+
+    Both PEP 621 `project` and `tool.poetry` tables are supported.
+    Development dependencies, groups and extras are ignored: they don't order releases.
+    Returns `(None, set())` if there is no `pyproject.toml`.
+    """
+    filename = os.path.join(path, PROJECT_FILE)
+    if not os.path.exists(filename):
+        return None, set()
+    data = load_toml(filename)
+    project = data.get("project", {})
+    poetry = data.get("tool", {}).get("poetry", {})
+
+    dependencies = set()
+    for requirement in project.get("dependencies", []):
+        match = REQUIREMENT_NAME.match(requirement)
+        if match:
+            dependencies.add(normalize_name(match.group(1)))
+    dependencies.update(normalize_name(name) for name in poetry.get("dependencies", {}))
+
+    name = project.get("name") or poetry.get("name")
+    return (normalize_name(name) if name else None), dependencies
+
+
+def dependency_waves(dependencies):
+    """
+    Group nodes by waves from a `{node: set of dependencies}` mapping.
+
+    Each wave only depends on the previous ones, so all its nodes can be processed at once.
+    The mapping order is kept inside a wave. Raises a `BumprError` on cycles.
+    """
+    remaining = {
+        node: (set(deps) & set(dependencies)) - {node} for node, deps in dependencies.items()
+    }
+    waves = []
+    while remaining:
+        wave = [node for node, deps in remaining.items() if not deps]
+        if not wave:
+            raise BumprError("Circular dependencies between {0}".format(", ".join(remaining)))
+        waves.append(wave)
+        for node in wave:
+            del remaining[node]
+        for deps in remaining.values():
+            deps.difference_update(wave)
+    return waves
+
+
+class MonorepoReleaser(Releaser):
+    """
+    Release workflow executor for many packages sharing a single repository.
+
+    Each package versions, hooks and replacements are handled by its own `Releaser`
+    but all files rewrites are applied together in a single commit with a tag by package.
+    The common `clean`, `tests` and `publish` commands are executed once.
+    """
+
+    def __init__(self, config, index=None, cache=None, state=None, vcs=None):
+        self.config = config
+        self.timings = Timings()
+        self.stats: Counter[str] = Counter()
+        self.transaction = None
+        self.index = index or FileIndex()
+        self.cache = cache or ContentCache()
+        self.state = state
+        if self.state is None and config.cache:
+            from .state import State
+
+            self.state = State()
+        packages = [self.package(name) for name in config.only or config.packages]
+        self.waves = self.order(packages)
+        self.packages = [package for wave in self.waves for package in wave]
+        self.timestamp = None
+
+        if config.vcs:
+            if vcs is None:
+                from .vcs import from_config
+
+                vcs = from_config(config)
+            self.vcs = vcs
+            with self.timings.span("validate", "vcs"):
+                self.vcs.validate(dryrun=config.dryrun, paths=self.validation_paths())
+
+        if config.dryrun:
+            self.modified = {}
+            self.diffs = {}
+            for package in self.packages:
+                package.modified = self.modified
+                package.diffs = self.diffs
+
+        self.hooks = []
+
+    def validation_paths(self):
+        """The `validate_paths` if set, otherwise all the released packages validation paths"""
+        if self.config.validate_paths:
+            return covering_paths(self.config.validate_paths)
+        paths = []
+        for package in self.packages:
+            package_paths = package.validation_paths()
+            if package_paths is None:
+                return None
+            paths.extend(package_paths)
+        return covering_paths(paths)
+
+    def package(self, name):
+        """
+        Build a package releaser sharing this releaser file index, caches, statistics and timings
+        """
+        config = self.config.package(name)
+        config.vcs = None
+        config.path = config.path or find_package_path(config.file)
+        package = Releaser(config, index=self.index, cache=self.cache, state=self.state)
+        package.stats = self.stats
+        package.timings = self.timings
+        return package
+
+    def order(self, packages):
+        """Group packages by dependency waves from their `pyproject.toml` dependencies"""
+        by_project = {}
+        dependencies = {}
+        for package in packages:
+            project, deps = read_project(package.config.path)
+            by_project[project or normalize_name(package.config.name)] = package.config.name
+            dependencies[package.config.name] = deps
+        graph = {
+            name: {by_project[dep] for dep in deps if dep in by_project}
+            for name, deps in dependencies.items()
+        }
+        waves = dependency_waves(graph)
+        logger.debug("Release waves: %s", " > ".join(", ".join(wave) for wave in waves))
+        by_name = {package.config.name: package for package in packages}
+        return [[by_name[name] for name in wave] for wave in waves]
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self._timestamp = value
+        for package in self.packages:
+            package.timestamp = value
+
+    def summary(self, attr):
+        """A `name version` listing of the packages for a given version attribute"""
+        return ", ".join(
+            "{0} {1}".format(package.config.name, getattr(package, attr))
+            for package in self.packages
+        )
+
+    def execute(self, command, version=None, verbose=None, block=None):
+        execute(
+            command,
+            replacements=dict(date=self.timestamp),
+            **self.execute_options(block, verbose),
+        )
+
+    def clean(self):
+        super().clean()
+        self.run_waves("clean", "Cleaning")
+
+    def test(self):
+        super().test()
+        if not self.config.skip_tests:
+            self.run_waves("tests", "Running test suite for", verbose=True)
+
+    def publish(self):
+        super().publish()
+        self.run_waves("publish", "Publish")
+
+    def run_waves(self, key, message, verbose=None):
+        """
+        Execute a command of each package by dependency waves.
+
+        Packages of a wave run in parallel within a process pool when `jobs` is greater than 1.
+        The first failure stops the release after its wave running commands.
+        """
+        verbose = verbose or self.config.verbose
+        for wave in self.waves:
+            packages = [package for package in wave if package.config[key]]
+            if not packages:
+                continue
+            names = [package.config.name for package in packages]
+            logger.info("%s %s", message, ", ".join(names))
+            with self.timings.span(key, "wave", packages=names):
+                self.run_wave(packages, key, verbose)
+
+    def run_wave(self, packages, key, verbose):
+        """Execute a command of each package of a wave"""
+        calls = [
+            (
+                package.config[key],
+                dict(
+                    replacements=package.command_replacements(),
+                    cwd=package.config.path,
+                    **self.execute_options(key, verbose),
+                ),
+            )
+            for package in packages
+        ]
+        jobs = min(self.config.jobs or 1, len(calls))
+        if jobs <= 1 or self.config.dryrun:
+            for command, kwargs in calls:
+                execute(command, **kwargs)
+            return
+        from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(execute, command, **kwargs) for command, kwargs in calls]
+            _, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+            for future in futures:
+                if future.done() and not future.cancelled() and future.exception():
+                    raise future.exception()
+
+    def bump(self):
+        logger.info("Bump versions %s", self.summary("version"))
+
+        with self.transactional() as transaction:
+            for package in self.packages:
+                self.stage(package, transaction, package.stage_bump)
+            transaction.commit()
+
+            if self.config.vcs:
+                self.commit(
+                    self.config.bump.message.format(
+                        version=self.summary("version"),
+                        tag=", ".join(package.tag_label for package in self.packages),
+                        date=self.timestamp,
+                    ),
+                    self.commit_files(transaction, "bump"),
+                )
+
+        if self.config.vcs:
+            self.tag()
+
+        if self.config.dryrun:
+            self.display_diff()
+            self.diffs.clear()
+
+    def prepare(self):
+        packages = [p for p in self.packages if p.version != p.next_version]
+        if not packages:
+            logger.info("Skip prepare phase")
+            return
+        logger.info("Prepare versions %s", self.summary("next_version"))
+
+        with self.transactional() as transaction:
+            for package in packages:
+                self.stage(package, transaction, package.stage_prepare)
+            transaction.commit()
+
+            if self.config.vcs:
+                self.commit(
+                    self.config.prepare.message.format(
+                        version=self.summary("next_version"),
+                        tag=", ".join(package.tag_label for package in self.packages),
+                        date=self.timestamp,
+                    ),
+                    self.commit_files(transaction, "prepare"),
+                )
+
+        if self.config.dryrun:
+            self.display_diff()
+
+    def commit_files(self, transaction, phase):
+        if any(package.commit_files(transaction, phase) is None for package in self.packages):
+            return None
+        return transaction.committed
+
+    def stage(self, package, transaction, phase):
+        """Execute a package phase staging its files in the shared transaction"""
+        package.transaction = transaction
+        try:
+            with self.timings.span(package.config.name, "package"):
+                phase()
+        finally:
+            package.transaction = None
+
+    def tag(self):
+        for package in self.packages:
+            self.create_tag(package.tag_label, getattr(package, "tag_annotation", None))
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import logging
+import shlex
+from copy import deepcopy
+from typing import TYPE_CHECKING, NamedTuple, cast
+
+from .config import ValidationError
+from .helpers import BumprError
+from .version import PARTS
+
+if TYPE_CHECKING:
+    from typing import Iterable, Optional
+
+    from .log import BumprLogger
+
+logger = cast("BumprLogger", logging.getLogger(__name__))
+
+__all__ = ("PlanEntry", "Plan", "parse_plan")
+
+KEYS = ("package", "part", "suffix", "branch")
+
+STATUS_RELEASED = "released"
+STATUS_SKIPPED = "skipped"
+
+
+class PlanEntry(NamedTuple):
+    """A release of a version plan"""
+
+    line: int
+    package: Optional[str] = None
+    part: Optional[str] = None
+    suffix: Optional[str] = None
+    branch: Optional[str] = None
+
+
+def parse_plan(lines: Iterable[str], filename: str = "plan") -> list[PlanEntry]:
+    """
+    Parse a version plan: one release by line of `key=value` fields.
+
+    Known keys are `package`, `part` (`major`, `minor` or `patch`), `suffix` and `branch`.
+    Empty lines and `#` comments are ignored.
+    """
+    entries = []
+    for number, line in enumerate(lines, 1):
+        try:
+            tokens = shlex.split(line, comments=True)
+        except ValueError as e:
+            raise ValidationError("{0}:{1}: {2}".format(filename, number, e))
+        if not tokens:
+            continue
+        fields = {}
+        for token in tokens:
+            key, sep, value = token.partition("=")
+            if not sep or key not in KEYS:
+                raise ValidationError(
+                    "{0}:{1}: expected some of {2} as key=value, got {3}".format(
+                        filename, number, ", ".join(KEYS), token
+                    )
+                )
+            fields[key] = value
+        if fields.get("part", "major") not in PARTS:
+            raise ValidationError(
+                "{0}:{1}: unknown part {2}, expected one of: {3}".format(
+                    filename, number, fields["part"], ", ".join(PARTS)
+                )
+            )
+        entries.append(PlanEntry(number, **fields))
+    return entries
+
+
+class Plan:
+    """
+    Execute many releases in a single process.
+
+    The configuration is parsed once, then each entry is released from a copy of it
+    sharing the contents cache, the run state and the VCS backend.
+    The file index is shared by the entries of a same branch.
+    """
+
+    def __init__(self, config, entries: list[PlanEntry]):
+        self.config = config
+        self.entries = entries
+        self.results: list[tuple[PlanEntry, str, str, str]] = []
+
+    @classmethod
+    def load(cls, config, filename: str) -> Plan:
+        try:
+            with open(filename) as f:
+                entries = parse_plan(f, filename)
+        except OSError as e:
+            raise ValidationError("Unable to read plan {0}: {1}".format(filename, e))
+        plan = cls(config, entries)
+        plan.validate()
+        return plan
+
+    def validate(self):
+        """Ensure each entry matches the configuration"""
+        if not self.entries:
+            raise ValidationError("The plan has no entry")
+        for entry in self.entries:
+            if entry.package and entry.package not in self.config.packages:
+                raise ValidationError(
+                    "Unknown package {0} at line {1}".format(entry.package, entry.line)
+                )
+            if entry.branch and not self.config.vcs:
+                raise ValidationError(
+                    "Line {0} requires a vcs to checkout {1}".format(entry.line, entry.branch)
+                )
+
+    def entry_config(self, entry: PlanEntry):
+        """The configuration of a single entry release"""
+        config = deepcopy(self.config)
+        if entry.package:
+            config.only = [entry.package]
+        if entry.part:
+            config.bump.part = PARTS[entry.part]
+        if entry.suffix is not None:
+            config.bump.suffix = entry.suffix or None
+        return config
+
+    def run(self):
+        """Release every entry in order, stopping at the first failure"""
+        from .files import ContentCache, FileIndex
+
+        vcs = None
+        if self.config.vcs:
+            from .vcs import from_config
+
+            vcs = from_config(self.config)
+        state = None
+        if self.config.cache:
+            from .state import State
+
+            state = State()
+        cache = ContentCache()
+        index = FileIndex()
+        initial_branch = current_branch = None
+        try:
+            for entry in self.entries:
+                try:
+                    if entry.branch and entry.branch != current_branch:
+                        if current_branch is None:
+                            initial_branch = vcs.current_branch()
+                        self.checkout(vcs, entry.branch)
+                        current_branch = entry.branch
+                        index = FileIndex()
+                    version, tag = self.release(
+                        entry, index=index, cache=cache, state=state, vcs=vcs
+                    )
+                except BumprError as e:
+                    self.results.append((entry, "", "", "failed: {0}".format(e)))
+                    raise
+                self.results.append((entry, version, tag, STATUS_RELEASED))
+        finally:
+            if initial_branch and current_branch not in (None, initial_branch):
+                self.checkout(vcs, initial_branch)
+            done = len(self.results)
+            self.results += [(entry, "", "", STATUS_SKIPPED) for entry in self.entries[done:]]
+            for line in self.summary():
+                logger.info(line)
+
+    def checkout(self, vcs, branch: str):
+        if self.config.dryrun:
+            logger.dryrun("checkout: {0}".format(branch))
+        else:
+            logger.info("Checkout %s", branch)
+            vcs.checkout(branch)
+
+    def release(self, entry: PlanEntry, **shared) -> tuple[str, str]:
+        """Release a single entry, returning its version and tag summaries"""
+        config = self.entry_config(entry)
+        if config.packages:
+            from .monorepo import MonorepoReleaser
+
+            monorepo = MonorepoReleaser(config, **shared)
+            monorepo.release()
+            return (
+                monorepo.summary("version"),
+                ", ".join(package.tag_label for package in monorepo.packages),
+            )
+        from .releaser import Releaser
+
+        releaser = Releaser(config, **shared)
+        releaser.release()
+        return str(releaser.version), releaser.tag_label
+
+    def summary(self) -> list[str]:
+        """The entries results, as text table lines"""
+        rows = [("Line", "Package", "Branch", "Version", "Tag", "Status")]
+        for entry, version, tag, status in self.results:
+            rows.append(
+                (
+                    str(entry.line),
+                    entry.package or "-",
+                    entry.branch or "-",
+                    version or "-",
+                    tag or "-",
+                    status,
+                )
+            )
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows]
+        lines.insert(1, "  ".join("-" * width for width in widths))
+        return [line.rstrip() for line in lines]
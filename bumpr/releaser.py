@@ -1,33 +1,142 @@
 from __future__ import annotations
 
+import codecs
 import logging
+import os
 import re
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
-from difflib import unified_diff
+from functools import lru_cache, partial
 
+from .diff import unified_diff
+from .edits import EditList
+from .files import ContentCache, FileIndex, Transaction, resolve
 from .helpers import BumprError, execute
 from .hooks import HOOKS
-from .vcs import VCS
+from .replacer import Replacer
+from .timings import Timings
 from .version import Version
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of diff lines sent in a single log record
+DIFF_CHUNK_SIZE = 200
+
+# Size of the raw chunks decoded while searching the version
+SCAN_CHUNK_SIZE = 64 * 1024
+
+
+def decode(data, encoding):
+    """Decode raw file content with the same newlines translation than text mode reading"""
+    text = data.decode(encoding)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+@lru_cache(maxsize=None)
+def compile_regex(regex):
+    return re.compile(regex)
+
+
+def search_version(pattern, data, encoding, max_bytes=None, max_lines=None):
+    """
+    Search the version `pattern` line by line in the raw `data`, stopping at the first match.
+
+    Data is decoded by chunks so the cost depends on the match position, not on the file size.
+    The scan stops after `max_bytes` bytes and `max_lines` lines. If no single line matches,
+    the whole scanned text is searched so patterns spanning many lines still match.
+    Returns the `version` group or `None`.
+    """
+    truncated = bool(max_bytes) and len(data) > max_bytes
+    if truncated:
+        data = memoryview(data)[:max_bytes]
+    decoder = codecs.getincrementaldecoder(encoding)()
+    scanned = []
+    pending = ""
+    lines = 0
+    for offset in range(0, max(len(data), 1), SCAN_CHUNK_SIZE):
+        final = offset + SCAN_CHUNK_SIZE >= len(data)
+        stop = offset + SCAN_CHUNK_SIZE
+        # A character cut by `max_bytes` is left incomplete in the decoder and dropped
+        text = pending + decoder.decode(bytes(data[offset:stop]), final and not truncated)
+        if not final:
+            # Only complete lines are searched: a `\r\n` can't be split
+            cut = text.rfind("\n") + 1
+            text, pending = text[:cut], text[cut:]
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        position = 0
+        while position < len(text):
+            end = text.find("\n", position)
+            end = len(text) if end < 0 else end
+            match = pattern.search(text, position, end)
+            if match:
+                return match.group("version")
+            lines += 1
+            if max_lines and lines >= max_lines:
+                scanned.append(text[:end])
+                return fallback_search(pattern, scanned)
+            position = end + 1
+        scanned.append(text)
+    return fallback_search(pattern, scanned)
+
+
+def fallback_search(pattern, texts):
+    match = pattern.search("".join(texts))
+    return match.group("version") if match else None
+
+
+def encode(text, encoding):
+    """Encode text with the same newlines translation than text mode writing"""
+    if os.linesep != "\n":
+        text = text.replace("\n", os.linesep)
+    return text.encode(encoding)
+
+
+def covering_paths(paths):
+    """
+    The normalized and sorted `paths`, without those inside another one.
+
+    Returns `None` if they include the current directory, meaning the whole working tree.
+    """
+    paths = {os.path.normpath(path) for path in paths}
+    if os.curdir in paths:
+        return None
+    covered = []
+    for path in paths:
+        parent = os.path.dirname(path)
+        while parent and parent not in paths:
+            parent = os.path.dirname(parent)
+        if not parent:
+            covered.append(path)
+    return sorted(covered)
+
 
 class Releaser:
     """
-    Release workflow executor
+    Release workflow executor.
+
+    The file `index`, contents `cache`, run `state` and `vcs` backend
+    can be shared with other releasers of the same process.
     """
 
-    def __init__(self, config):
+    def __init__(self, config, index=None, cache=None, state=None, vcs=None):
         self.config = config
+        self.timings = Timings()
+        self.cache = cache or ContentCache()
+        self.state = state
+        if self.state is None and config.cache:
+            from .state import State
 
-        with open(config.file) as f:
-            match = re.search(config.regex, f.read())
-            try:
-                version_string = match.group("version")
-                self.prev_version = Version.parse(version_string)
-            except Exception:
-                raise BumprError("Unable to extract version from {0}".format(config.file))
+            self.state = State()
+
+        try:
+            version_string = self.find_version()
+            self.prev_version = Version.parse(version_string)
+        except Exception:
+            raise BumprError("Unable to extract version from {0}".format(config.file))
 
         logger.debug("Previous version: {0}".format(self.prev_version))
 
@@ -39,7 +148,9 @@ class Releaser:
         self.next_version.bump(config.prepare.part, config.prepare.unsuffix, config.prepare.suffix)
         logger.debug("Prepared version: {0}".format(self.next_version))
 
-        self.tag_label = self.config.tag_format.format(version=self.version)
+        self.tag_label = self.config.tag_format.format(
+            version=self.version, name=self.config.get("name")
+        )
         logger.debug("Tag: {0}".format(self.tag_label))
         if self.config.tag_annotation:
             self.tag_annotation = self.config.tag_annotation.format(version=self.version)
@@ -47,9 +158,21 @@ class Releaser:
 
         self.timestamp = None
 
+        self.stats: Counter[str] = Counter()
+        self.transaction = None
+        self.edits: dict[str, EditList] = {}
+        self.changes: list[tuple[str, list]] = []
+        self.index = index or FileIndex()
+        self.files = self.index.expand(config.files, config.exclude)
+
         if config.vcs:
-            self.vcs = VCS[config.vcs](verbose=config.verbose)
-            self.vcs.validate(dryrun=config.dryrun)
+            if vcs is None:
+                from .vcs import from_config
+
+                vcs = from_config(config)
+            self.vcs = vcs
+            with self.timings.span("validate", "vcs"):
+                self.vcs.validate(dryrun=config.dryrun, paths=self.validation_paths())
 
         if config.dryrun:
             self.modified = {}
@@ -57,31 +180,99 @@ class Releaser:
 
         self.hooks = [hook(self) for hook in HOOKS if self.config[hook.key]]
 
-    def execute(self, command, version=None, verbose=None):
+    def find_version(self):
+        """
+        Extract the version string from the version file or from the state of a previous run.
+
+        The version file is searched line by line up to `regex_scan_bytes` and `regex_max_line`.
+        """
+        config = self.config
+        read = partial(self.cache.read, config.file)
+        method = [config.regex, config.regex_scan_bytes, config.regex_max_line]
+        if self.state:
+            version_string = self.state.version(config.file, method, config.encoding, read)
+            if version_string is not None:
+                logger.debug("Using the cached version of %s", config.file)
+                return version_string
+        data = read()
+        version_string = search_version(
+            compile_regex(config.regex),
+            data,
+            config.encoding,
+            config.regex_scan_bytes,
+            config.regex_max_line,
+        )
+        if version_string is not None and self.state:
+            self.state.store_version(config.file, method, config.encoding, data, version_string)
+        return version_string
+
+    def command_replacements(self, version=None):
+        """The tokens available to format commands"""
         version = version or self.version
-        verbose = verbose or self.config.verbose
-        replacements = dict(version=version, date=self.timestamp, **version.__dict__)
+        return dict(version=version, date=self.timestamp, **version.__dict__)
+
+    def execute(self, command, version=None, verbose=None, block=None):
+        """Execute a command, in parallel if its `block` (ie. `tests`) is listed in `parallel`"""
         execute(
             command,
-            replacements=replacements,
+            replacements=self.command_replacements(version),
+            **self.execute_options(block, verbose),
+        )
+
+    def execute_options(self, block=None, verbose=None):
+        """The `execute` keyword arguments of a command `block` (ie. `tests`)"""
+        return dict(
+            verbose=verbose or self.config.verbose,
             dryrun=self.config.dryrun,
-            verbose=verbose,
+            parallel=block in self.config.parallel,
+            jobs=self.config.parallel_jobs,
+            spool=self.config.output_log,
+            timeout=self.config.timeout,
+            retries=self.config.retries if block in self.config.retry else 0,
+            backoff=self.config.retry_backoff,
         )
 
+    def validation_paths(self):
+        """
+        The paths which must not have any modification: `validate_paths` if set,
+        otherwise the package directory, its version file, `files` and changelog.
+
+        `None` stands for the whole working tree (ie. outside of a monorepo).
+        """
+        if self.config.validate_paths:
+            return covering_paths(self.config.validate_paths)
+        paths = [self.config.get("path") or os.curdir, self.config.file] + self.files
+        if self.config.get("changelog"):
+            paths.append(self.config.changelog.file)
+        return covering_paths(paths)
+
     def release(self):
         self.timestamp = datetime.now()
 
         if self.config.bump_only:
-            self.bump()
+            phases = ["bump"]
         elif self.config.prepare_only:
-            self.prepare()
+            phases = ["prepare"]
         else:
-            self.clean()
-            self.test()
-            self.bump()
-            self.publish()
-            self.prepare()
-            self.push()
+            phases = ["clean", "test", "bump", "publish", "prepare", "push"]
+
+        try:
+            for phase in phases:
+                with self.timings.span(phase):
+                    getattr(self, phase)()
+        finally:
+            self.report_timings()
+            if self.state:
+                self.state.save()
+
+    def report_timings(self):
+        """Display and export the timing spans if requested"""
+        if self.config.timings:
+            logger.info("Timings:")
+            for line in self.timings.report():
+                logger.info("  %s", line)
+        if self.config.timings_output:
+            self.timings.export(self.config.timings_output, self.config.timings_format)
 
     def test(self):
         if self.config.tests:
@@ -89,27 +280,27 @@ class Releaser:
                 logger.info("Skip test suite")
                 return
             logger.info("Running test suite")
-            self.execute(self.config.tests, verbose=True)
+            self.execute(self.config.tests, verbose=True, block="tests")
 
     def bump(self):
         logger.info("Bump version %s", self.version)
 
-        replacements = [(str(self.prev_version), str(self.version))]
-
-        for hook in self.hooks:
-            hook.bump(replacements)
-
-        self.bump_files(replacements)
+        with self.transactional() as transaction:
+            self.stage_bump()
+            transaction.commit()
+
+            if self.config.vcs:
+                self.commit(
+                    self.config.bump.message.format(
+                        version=self.version,
+                        tag=self.tag_label,
+                        date=self.timestamp,
+                        **self.version.__dict__,
+                    ),
+                    self.commit_files(transaction, "bump"),
+                )
 
         if self.config.vcs:
-            self.commit(
-                self.config.bump.message.format(
-                    version=self.version,
-                    tag=self.tag_label,
-                    date=self.timestamp,
-                    **self.version.__dict__,
-                )
-            )
             self.tag()
 
         if self.config.dryrun:
@@ -122,83 +313,301 @@ class Releaser:
             return
         logger.info("Prepare version %s", self.next_version)
 
+        with self.transactional() as transaction:
+            self.stage_prepare()
+            transaction.commit()
+
+            if self.config.vcs:
+                self.commit(
+                    self.config.prepare.message.format(
+                        version=self.next_version,
+                        tag=self.tag_label,
+                        date=self.timestamp,
+                        **self.next_version.__dict__,
+                    ),
+                    self.commit_files(transaction, "prepare"),
+                )
+
+        if self.config.dryrun:
+            self.display_diff()
+
+    def stage_bump(self):
+        """Execute the bump hooks and replacements without applying the staged files"""
+        replacements = [(str(self.prev_version), str(self.version))]
+
+        try:
+            self.run_hooks("bump", replacements)
+
+            self.bump_files(replacements)
+        finally:
+            self.edits.clear()
+
+    def stage_prepare(self):
+        """Execute the prepare hooks and replacements without applying the staged files"""
         replacements = [(str(self.version), str(self.next_version))]
 
-        for hook in self.hooks:
-            hook.prepare(replacements)
+        try:
+            self.run_hooks("prepare", replacements)
 
-        self.bump_files(replacements)
+            self.bump_files(replacements)
+        finally:
+            self.edits.clear()
 
-        if self.config.vcs:
-            self.commit(
-                self.config.prepare.message.format(
-                    version=self.next_version,
-                    tag=self.tag_label,
-                    date=self.timestamp,
-                    **self.next_version.__dict__,
-                )
-            )
+    def run_hooks(self, phase, replacements):
+        """
+        Execute the `phase` hooks in order.
 
-        if self.config.dryrun:
-            self.display_diff()
+        The pending edits are applied before a hook which may modify any file (ie. commands)
+        so it sees the files rewritten by the previous hooks (ie. the changelog).
+        They are still restored if the phase fails.
+        """
+        for hook in self.hooks:
+            if hook.modifies_any_file(phase) and self.edits and not self.config.dryrun:
+                self.bump_files([], edits_only=True)
+                if self.transaction:
+                    self.transaction.commit()
+            with self.timings.span("{0}.{1}".format(hook.key, phase), "hook"):
+                getattr(hook, phase)(replacements)
 
     def clean(self):
         """Clean the workspace"""
         if self.config.clean:
             logger.info("Cleaning")
-            self.execute(self.config.clean)
-
-    def perform(self, filename, before, after):
+            self.execute(self.config.clean, block="clean")
+
+    @contextmanager
+    def transactional(self):
+        """
+        Stage all files rewrites performed in this context into a single transaction.
+
+        Staged files must be applied with `Transaction.commit()`.
+        If anything fails before leaving the context, every original file is restored.
+        """
+        self.transaction = transaction = Transaction()
+        try:
+            yield transaction
+        except BaseException:
+            transaction.rollback()
+            raise
+        finally:
+            self.transaction = None
+            transaction.close()
+
+    @contextmanager
+    def write(self, filename):
+        """
+        Open `filename` for binary writing.
+
+        The file is staged in the current transaction if any or atomically replaced.
+        """
+        transaction = self.transaction or Transaction()
+        with transaction.stage(filename) as f:
+            yield f
+        if transaction is not self.transaction:
+            try:
+                transaction.commit()
+            finally:
+                transaction.close()
+
+    def read(self, filename):
+        """
+        Read the raw content of `filename`, including uncommitted staged rewrites.
+
+        Contents are read through the run content cache so each file is read from disk only once.
+        """
+        path = self.transaction.path(filename) if self.transaction else filename
+        return self.cache.read(path)
+
+    def load(self, filename):
+        """The decoded content of `filename`, including dry-run and staged rewrites"""
+        filename = resolve(filename)
+        if self.config.dryrun and filename in self.modified:
+            return self.modified[filename]
+        return decode(self.read(filename), self.config.encoding)
+
+    def edit(self, filename):
+        """
+        The pending edits of `filename`.
+
+        Edits are relative to the file content at the phase start and are applied
+        together with the replacements in a single pass by `bump_files()`.
+        Edits are keyed by resolved path so every spelling of a file shares the same edits.
+        """
+        filename = resolve(filename)
+        if filename not in self.edits:
+            self.edits[filename] = EditList(filename, self.load(filename))
+        return self.edits[filename]
+
+    def perform(self, filename, before, after, edits=None):
+        """
+        Write the `after` content of `filename` or record its diff in dry-run mode.
+
+        The diff is rendered lazily, only around the `(start, end, replacement)` edits
+        or around the changed region when they are not known.
+        """
         if before == after:
             return
         if self.config.dryrun:
             self.modified[filename] = after
-            diff = unified_diff(before.split("\n"), after.split("\n"), lineterm="")
-            self.diffs[filename] = diff
+            self.diffs[filename] = unified_diff(before, after, edits)
         else:
-            with open(filename, "w", encoding=self.config.encoding) as f:
-                f.write(after)
+            data = encode(after, self.config.encoding)
+            with self.write(filename) as f:
+                f.write(data)
+            path = self.transaction.path(filename) if self.transaction else filename
+            self.cache.store(path, data)
+
+    def bump_files(self, replacements, edits_only=False):
+        """
+        Apply the replacements to the version file and `files` and the pending edits.
+
+        Files only having pending edits (ie. from hooks) are not subject to the replacements.
+        With `edits_only`, only the pending edits are applied.
+        """
+        replacer = Replacer(replacements)
+        # Keep the first occurrence of each file: a file can't be rewritten twice concurrently
+        filenames = [] if edits_only else [self.config.file] + self.files
+        replaced = dict.fromkeys(map(resolve, filenames))
+        filenames = list(replaced) + [name for name in self.edits if name not in replaced]
+        no_replacement = Replacer([])
+
+        def bump_file(filename):
+            return self.bump_file(filename, replacer if filename in replaced else no_replacement)
+
+        jobs = min(self.config.jobs or 1, len(filenames))
+        with self.timings.span("files", "files", files=len(filenames), jobs=jobs):
+            if jobs > 1:
+                from concurrent.futures import ThreadPoolExecutor
+
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    # `map` yields results (and raises errors) in submission order
+                    results = list(executor.map(bump_file, filenames))
+            else:
+                results = [bump_file(filename) for filename in filenames]
+        for filename, status, edits, after in results:
+            self.stats[status] += 1
+            if status == "rewritten" and edits is not None:
+                self.changes.append((filename, edits.ordered()))
+                if self.config.dryrun:
+                    self.perform(filename, edits.text, after, edits.spans())
+        logger.debug(
+            "%d file(s) rewritten, %d skipped", self.stats["rewritten"], self.stats["skipped"]
+        )
 
-    def bump_files(self, replacements):
-        for filename in [self.config.file] + self.config.files:
+    def bump_file(self, filename, replacer):
+        """
+        Apply the pending edits and the replacements to a single file in a single pass.
+
+        Outside of dry-run, the file is written right away (possibly from a worker thread).
+        Dry-run bookkeeping is left to the caller so diffs are recorded in a stable order.
+        Files without pending edits whose raw bytes can't contain any token
+        are skipped before being decoded, or even before being read if the run state
+        knows they don't contain any token.
+        Files larger than `stream_threshold` are rewritten in streaming (outside of dry-run).
+
+        Returns a `(filename, status, edits, after)` tuple where status is one of
+        `skipped`, `unchanged` or `rewritten`. `edits` is the file `EditList`
+        and `after` its new content, both `None` when not decoded.
+        """
+        edits = self.edits.pop(filename, None)
+        if edits is None:
             if self.config.dryrun and filename in self.modified:
-                before = self.modified[filename]
+                text = self.modified[filename]
             else:
-                with open(filename, "r", encoding=self.config.encoding) as current_file:
-                    before = current_file.read()
-            after = before
-            for token, replacement in replacements:
-                after = after.replace(token, replacement)
-            self.perform(filename, before, after)
+                threshold = self.config.stream_threshold
+                staged = self.transaction is not None and filename in self.transaction
+                state = self.state if replacer and not staged else None
+                if state and state.is_clean(filename, replacer, self.config.encoding):
+                    return filename, "skipped", None, None
+                if (
+                    threshold
+                    and not self.config.dryrun
+                    and not staged
+                    and os.path.getsize(filename) >= threshold
+                ):
+                    count = self.stream_file(filename, replacer)
+                    if count >= 0:
+                        return filename, "rewritten" if count else "skipped", None, None
+                data = self.read(filename)
+                if not replacer.may_match(data, self.config.encoding):
+                    if state:
+                        state.mark_clean(
+                            filename, replacer, self.config.encoding, os.stat(filename)
+                        )
+                    return filename, "skipped", None, None
+                text = decode(data, self.config.encoding)
+            edits = EditList(filename, text)
+        edits.extend(replacer.edits(edits.text), "replacements")
+        after = edits.apply()
+        if after == edits.text:
+            return filename, "unchanged", edits, after
+        if not self.config.dryrun:
+            self.perform(filename, edits.text, after)
+        return filename, "rewritten", edits, after
+
+    def stream_file(self, filename, replacer):
+        """
+        Rewrite a large file from its memory mapping through an atomically renamed temporary file.
+
+        Bytes outside of the matches are copied as is (newlines are not translated).
+        Returns the number of replacements or `-1` if the file needs to be decoded.
+        """
+        encoding = self.config.encoding
+        pattern = replacer.bytes_pattern(encoding)
+        if pattern is None:
+            return -1
+        import mmap
+
+        with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if pattern.search(data) is None:
+                return 0
+            logger.debug("Streaming replacements in %s", filename)
+            with self.write(filename) as target:
+                return replacer.stream(data, target, encoding)
 
     def publish(self):
         """Publish the current release to PyPI"""
         if self.config.publish:
             logger.info("Publish")
-            self.execute(self.config.publish)
+            self.execute(self.config.publish, block="publish")
 
     def tag(self):
+        self.create_tag(self.tag_label, getattr(self, "tag_annotation", None))
+
+    def create_tag(self, label, annotation=None):
         if self.config.commit and self.config.tag:
-            if self.config.tag_annotation:
-                logger.debug("Tag: %s Annotation: %s", self.tag_label, self.tag_annotation)
+            if annotation:
+                logger.debug("Tag: %s Annotation: %s", label, annotation)
                 if not self.config.dryrun:
-                    self.vcs.tag(self.tag_label, self.tag_annotation)
+                    with self.timings.span("tag", "vcs", tag=label):
+                        self.vcs.tag(label, annotation)
                 else:
-                    logger.dryrun(
-                        "tag: {0} annotation: {1}".format(self.tag_label, self.tag_annotation)
-                    )
+                    logger.dryrun("tag: {0} annotation: {1}".format(label, annotation))
             else:
-                logger.debug("Tag: %s", self.tag_label)
+                logger.debug("Tag: %s", label)
                 if not self.config.dryrun:
-                    self.vcs.tag(self.tag_label)
+                    with self.timings.span("tag", "vcs", tag=label):
+                        self.vcs.tag(label)
                 else:
-                    logger.dryrun("tag: {0}".format(self.tag_label))
+                    logger.dryrun("tag: {0}".format(label))
+
+    def commit_files(self, transaction, phase):
+        """
+        The files to commit after `phase`: those rewritten by its `transaction`.
+
+        Returns `None`, meaning all the modified files, if a hook may have modified other files.
+        """
+        if any(hook.modifies_any_file(phase) for hook in self.hooks):
+            return None
+        return transaction.committed
 
-    def commit(self, message):
+    def commit(self, message, files=None):
+        """Commit the given `files`, or all the modified files if `None`"""
         if self.config.commit:
             logger.debug("Commit: %s", message)
             if not self.config.dryrun:
-                self.vcs.commit(message)
+                with self.timings.span("commit", "vcs"):
+                    self.vcs.commit(message, files)
             else:
                 logger.dryrun("commit: {0}".format(message))
 
@@ -211,8 +620,14 @@ class Releaser:
                 logger.dryrun("push to remote repository")
 
     def display_diff(self):
+        """Display the recorded diffs, logging lines by chunks"""
         for filename, diff in self.diffs.items():
             logger.diff(filename)
+            chunk = []
             for line in diff:
-                logger.diff(line)
-            logger.diff("")
+                chunk.append(line)
+                if len(chunk) >= DIFF_CHUNK_SIZE:
+                    logger.diff("\n".join(chunk))
+                    chunk = []
+            chunk.append("")
+            logger.diff("\n".join(chunk))
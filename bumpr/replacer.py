@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import codecs
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import BinaryIO, Iterable, Optional, Pattern
+
+__all__ = ("Replacer", "is_ascii_compatible")
+
+
+def is_ascii_compatible(encoding: str) -> bool:
+    """
+    Wether an encoding represents ASCII characters (including newlines) as themselves.
+
+    For such encodings, an encoded token can be searched directly in the raw file bytes.
+    """
+    try:
+        codec = codecs.lookup(encoding)
+    except LookupError:
+        return False
+    return codec.encode("a\n")[0] == b"a\n"
+
+
+class Replacer:
+    """
+    Perform all `(token, replacement)` pairs in a single scan.
+
+    Tokens are matched left to right. When several tokens match at the same position,
+    the first declared pair wins, just like it would when applying them sequentially.
+    Empty tokens are ignored and only the first occurrence of a duplicated token is kept.
+    """
+
+    def __init__(self, replacements: Iterable[tuple[str, str]]):
+        self.mapping: dict[str, str] = {}
+        for token, replacement in replacements:
+            if token and token not in self.mapping:
+                self.mapping[token] = replacement
+        self.pattern: Optional[Pattern[str]] = (
+            re.compile("|".join(re.escape(token) for token in self.mapping))
+            if self.mapping
+            else None
+        )
+        self._bytes_patterns: dict[str, Optional[Pattern[bytes]]] = {}
+
+    def __bool__(self):
+        return self.pattern is not None
+
+    def replace(self, text: str) -> str:
+        """Return `text` with every token replaced"""
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(self._substitute, text)
+
+    def edits(self, text: str) -> list[tuple[int, int, str]]:
+        """The sorted `(start, end, replacement)` edits `replace()` performs on `text`"""
+        if self.pattern is None:
+            return []
+        return [(m.start(), m.end(), self.mapping[m.group(0)]) for m in self.pattern.finditer(text)]
+
+    def bytes_pattern(self, encoding: str) -> Optional[Pattern[bytes]]:
+        """
+        The encoded tokens pattern to search in raw bytes or `None` if it can't be trusted.
+
+        Tokens with newlines can't be searched as bytes because of newlines translation.
+        """
+        if encoding not in self._bytes_patterns:
+            pattern = None
+            if is_ascii_compatible(encoding) and not any(
+                "\n" in token or "\r" in token for token in self.mapping
+            ):
+                try:
+                    pattern = re.compile(
+                        b"|".join(re.escape(token.encode(encoding)) for token in self.mapping)
+                    )
+                except UnicodeEncodeError:
+                    pattern = None
+            self._bytes_patterns[encoding] = pattern
+        return self._bytes_patterns[encoding]
+
+    def may_match(self, data: bytes, encoding: str) -> bool:
+        """
+        A fast check on raw bytes telling wether `data` may contain any token.
+
+        A `False` result guarantees that `replace()` won't change the decoded content.
+        """
+        if self.pattern is None:
+            return False
+        pattern = self.bytes_pattern(encoding)
+        return pattern is None or pattern.search(data) is not None
+
+    def stream(self, source, target: BinaryIO, encoding: str) -> int:
+        """
+        Write the `source` buffer (ie. a `mmap`) with every token replaced into `target`.
+
+        Unmatched bytes are copied as is without being decoded nor loaded in memory as a whole.
+        Returns the number of replacements or `-1` if `source` can't be processed as bytes.
+        """
+        pattern = self.bytes_pattern(encoding)
+        if pattern is None:
+            return -1
+        mapping = {
+            token.encode(encoding): replacement.encode(encoding)
+            for token, replacement in self.mapping.items()
+        }
+        count = position = 0
+        with memoryview(source) as view:
+            for match in pattern.finditer(source):
+                start, end = match.span()
+                target.write(view[position:start])
+                target.write(mapping[match.group(0)])
+                position = end
+                count += 1
+            target.write(view[position:])
+        return count
+
+    def _substitute(self, match):
+        return self.mapping[match.group(0)]
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from bumpr import __version__
+from bumpr.files import signature
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Iterable, Optional
+
+    from bumpr.replacer import Replacer
+
+__all__ = ("State", "config_key", "digest")
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY = ".bumpr"
+
+# Bumped whenever the state files layout changes
+FORMAT = 1
+
+# Files modified less than this before the run started are never trusted by their stat only
+# as they may still be modified within the same filesystem timestamp granularity.
+RACY_DELAY = 2.0
+
+# Number of cached configurations (one by command line arguments set)
+MAX_CONFIGS = 8
+
+# Number of token sets for which files known not to contain any token are remembered
+MAX_TOKENS = 4
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def config_key(parsed_args: Any, filenames: Iterable[str]) -> str:
+    """Identify a configuration from its command line arguments and its files contents"""
+    sha = hashlib.sha1(json.dumps(vars(parsed_args), sort_keys=True, default=str).encode())
+    for filename in filenames:
+        sha.update(filename.encode())
+        try:
+            with open(filename, "rb") as f:
+                sha.update(digest(f.read()).encode())
+        except OSError:
+            sha.update(b"-")
+    return sha.hexdigest()
+
+
+class State:
+    """
+    The work done by previous invocations, persisted in the `.bumpr` directory.
+
+    It holds the parsed configurations, the last version found in each version file
+    and the files known not to contain some tokens.
+    Entries are validated against the file fingerprints (see `bumpr.files.signature()`) and content hashes.
+    State files written by another bumpr version or format, or unreadable, are ignored.
+    """
+
+    def __init__(self, directory: str = DIRECTORY):
+        self.directory = directory
+        self.started = time.time()
+        self.sections: dict[str, dict[str, Any]] = {}
+        self.modified: set[str] = set()
+        self.lock = threading.RLock()
+
+    def section(self, name: str) -> dict[str, Any]:
+        """The `name` section entries, loaded on first access"""
+        with self.lock:
+            if name not in self.sections:
+                self.sections[name] = self.load(name)
+            return self.sections[name]
+
+    def filename(self, name: str) -> str:
+        return os.path.join(self.directory, "{0}.json".format(name))
+
+    def load(self, name: str) -> dict[str, Any]:
+        filename = self.filename(name)
+        try:
+            with open(filename) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.debug("Ignoring unreadable state %s: %s", filename, e)
+            return {}
+        if not isinstance(data, dict) or (data.get("format"), data.get("bumpr")) != (
+            FORMAT,
+            __version__,
+        ):
+            logger.debug("Ignoring outdated state %s", filename)
+            return {}
+        entries = data.get("entries")
+        return entries if isinstance(entries, dict) else {}
+
+    def save(self):
+        """Atomically write the modified sections"""
+        if not self.modified:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        gitignore = os.path.join(self.directory, ".gitignore")
+        if not os.path.exists(gitignore):
+            with open(gitignore, "w") as f:
+                f.write("*\n")
+        for name in sorted(self.modified):
+            data = {"format": FORMAT, "bumpr": __version__, "entries": self.sections[name]}
+            fd, tmp = tempfile.mkstemp(prefix=".{0}.".format(name), dir=self.directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.filename(name))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        self.modified.clear()
+
+    def trusted(self, stat: os.stat_result) -> bool:
+        """Wether a file fingerprint is reliable: it was not modified right before the run"""
+        return stat.st_mtime < self.started - RACY_DELAY
+
+    def config(self, key: str) -> Optional[dict[str, Any]]:
+        """The configuration cached for `key`"""
+        return self.section("config").get(key)
+
+    def store_config(self, key: str, config: dict[str, Any]):
+        try:
+            # Only keep JSON round-trippable configurations
+            value = json.loads(json.dumps(config))
+        except (TypeError, ValueError):
+            logger.debug("Configuration can't be cached")
+            return
+        entries = self.section("config")
+        entries.pop(key, None)
+        entries[key] = value
+        while len(entries) > MAX_CONFIGS:
+            del entries[next(iter(entries))]
+        self.modified.add("config")
+
+    def version(
+        self, filename: str, method: list[Any], encoding: str, read: Callable[[], bytes]
+    ) -> Optional[str]:
+        """
+        The version string previously extracted from `filename` with `method`.
+
+        `method` is a JSON serializable value identifying the extraction (ie. the regex).
+        The file fingerprint is checked first, then its content hash read through `read`.
+        """
+        entry = self.section("versions").get(filename)
+        if not entry or (entry["method"], entry["encoding"]) != (method, encoding):
+            return None
+        stat = os.stat(filename)
+        if entry["fingerprint"] == list(signature(stat)) and self.trusted(stat):
+            return entry["version"]
+        data = read()
+        if entry["sha"] != digest(data):
+            return None
+        self.store_version(filename, method, encoding, data, entry["version"])
+        return entry["version"]
+
+    def store_version(
+        self, filename: str, method: list[Any], encoding: str, data: bytes, version: str
+    ):
+        """Remember the `version` string extracted from the `data` content of `filename`"""
+        stat = os.stat(filename)
+        self.section("versions")[filename] = {
+            "method": method,
+            "encoding": encoding,
+            "fingerprint": list(signature(stat)) if self.trusted(stat) else None,
+            "sha": digest(data),
+            "version": version,
+        }
+        self.modified.add("versions")
+
+    def tokens(self, replacer: Replacer, encoding: str) -> str:
+        return digest(json.dumps([encoding] + sorted(replacer.mapping)).encode())
+
+    def is_clean(self, filename: str, replacer: Replacer, encoding: str) -> bool:
+        """Wether `filename` is known not to contain any `replacer` token"""
+        clean = self.section("clean").get(self.tokens(replacer, encoding))
+        if not clean or filename not in clean:
+            return False
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return False
+        return clean[filename] == list(signature(stat))
+
+    def mark_clean(self, filename: str, replacer: Replacer, encoding: str, stat: os.stat_result):
+        """Remember that `filename` in the `stat` version has no `replacer` token"""
+        if not self.trusted(stat):
+            return
+        key = self.tokens(replacer, encoding)
+        with self.lock:
+            entries = self.section("clean")
+            if key not in entries:
+                entries[key] = {}
+                while len(entries) > MAX_TOKENS:
+                    del entries[next(iter(entries))]
+            entries[key][filename] = list(signature(stat))
+            self.modified.add("clean")
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Iterator, Optional
+
+__all__ = ("Span", "Timings", "FORMATS")
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("json", "chrome")
+
+
+class Span:
+    """A named and timed section of the release workflow"""
+
+    def __init__(self, name: str, category: str, depth: int, args: dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.depth = depth
+        self.args = args
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class Timings:
+    """
+    Record nested timing spans.
+
+    Spans are kept in their starting order and nest by thread.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans: list[Span] = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, category: str = "phase", **args: Any) -> Iterator[Span]:
+        """Time the wrapped block, nested in the current thread span if any"""
+        stack = self.local.__dict__.setdefault("stack", [])
+        span = Span(name, category, len(stack), args)
+        with self.lock:
+            self.spans.append(span)
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            stack.pop()
+
+    @property
+    def total(self) -> float:
+        return sum(span.duration for span in self.spans if span.depth == 0)
+
+    def report(self) -> list[str]:
+        """A per-phase breakdown of the spans, as text lines"""
+        total = self.total or 1
+        width = max([len(span.name) + 2 * span.depth for span in self.spans] + [5])
+        lines = []
+        for span in self.spans:
+            label = "  " * span.depth + span.name
+            lines.append(
+                "{0:<{1}}  {2:8.3f}s  {3:5.1f}%".format(
+                    label, width, span.duration, 100 * span.duration / total
+                )
+            )
+        lines.append("{0:<{1}}  {2:8.3f}s".format("Total", width, self.total))
+        return lines
+
+    def to_json(self) -> dict[str, Any]:
+        """The spans as a JSON serializable dict, times in seconds from the recording start"""
+        return {
+            "total": self.total,
+            "spans": [
+                {
+                    "name": span.name,
+                    "category": span.category,
+                    "depth": span.depth,
+                    "start": span.start - self.origin,
+                    "duration": span.duration,
+                    "args": span.args,
+                }
+                for span in self.spans
+            ],
+        }
+
+    def to_chrome(self) -> dict[str, Any]:
+        """
+        The spans as Chrome trace events, times in microseconds.
+
+        The output can be loaded in `chrome://tracing` or https://ui.perfetto.dev.
+        """
+        pid = os.getpid()
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": (span.start - self.origin) * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": pid,
+                    "tid": span.thread,
+                    "args": {key: str(value) for key, value in span.args.items()},
+                }
+                for span in self.spans
+            ],
+        }
+
+    def export(self, filename: str, format: str = "json"):
+        """Save the spans in `filename` as `json` or `chrome` trace events"""
+        import json
+
+        data = self.to_chrome() if format == "chrome" else self.to_json()
+        with open(filename, "w") as f:
+            json.dump(data, f, indent=2, default=str)
+        logger.debug("Timings saved to %s", filename)
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 import logging
+import os
 from os.path import isdir
 
-from .helpers import BumprError, execute
+from .helpers import BumprError, execute, iter_lines
 
 log = logging.getLogger(__name__)
 
@@ -11,63 +12,336 @@ MSG = "The current repository contains modified files"
 
 
 class BaseVCS:
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, timeout=None, retries=0, backoff=1, fsmonitor=False):
         self.verbose = verbose
-
-    def execute(self, command):
-        """Execute a command"""
-        execute(command, verbose=self.verbose)
-
-    def validate(self, dryrun=False):
-        """Ensure the working dir is a repository and there is no modified files"""
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.fsmonitor = fsmonitor
+
+    def execute(self, command, retry=False):
+        """Execute a command, retried on failure if `retry` is set (ie. for network operations)"""
+        execute(
+            command,
+            verbose=self.verbose,
+            timeout=self.timeout,
+            retries=self.retries if retry else 0,
+            backoff=self.backoff,
+        )
+
+    def query(self, command):
+        """Execute a command and return its output"""
+        return execute(command, verbose=False, capture=True, timeout=self.timeout)
+
+    def query_lines(self, command):
+        """Lazily yield a command output lines, stopping the command when closed"""
+        return iter_lines(command, timeout=self.timeout)
+
+    def validate(self, dryrun=False, paths=None):
+        """
+        Ensure the working dir is a repository and there is no modified files.
+
+        Only the files in `paths` are checked if given, the whole working tree otherwise.
+        """
         raise NotImplementedError
 
-    def commit(self, message):
-        """Commit all modified files"""
+    def commit(self, message, files=None):
+        """Commit the given `files`, or all the modified files if `None`"""
         raise NotImplementedError
 
     def tag(self, name, annotation=None):
         """Create a tag"""
         raise NotImplementedError
 
+    def checkout(self, branch):
+        """Switch the working tree to `branch`"""
+        raise NotImplementedError
+
+    def current_branch(self):
+        """The current branch name, `None` if unknown"""
+        return None
+
     def push(self):
         """Push changes to remote repository"""
         raise NotImplementedError
 
 
 class Git(BaseVCS):
-    def validate(self, dryrun=False):
+    DEFAULT_REMOTE = "origin"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.reset()
+
+    def reset(self):
+        """Forget the branch and the tags of a previous release"""
+        self.branch = None
+        self.remote = None
+        self.remote_branch = None
+        self.tags = []
+
+    def validate(self, dryrun=False, paths=None):
         if not isdir(".git"):
             raise BumprError("Current directory is not a git repopsitory")
+        self.reset()
+
+        # A single query gives both the working tree status and the upstream branch.
+        # Untracked files are ignored and the first modified file is enough to fail.
+        cmd = ["git"]
+        if self.fsmonitor:
+            cmd += ["-c", "core.fsmonitor=true", "-c", "core.untrackedCache=true"]
+        cmd += ["status", "--porcelain", "--branch", "--untracked-files=no"]
+        if paths:
+            cmd += ["--"] + list(paths)
+        lines = self.query_lines(cmd)
+        try:
+            for line in lines:
+                if line.startswith("## "):
+                    self.parse_branch(line[3:])
+                elif line and not line.startswith("??"):
+                    if dryrun:
+                        log.warning(MSG)
+                        break
+                    else:
+                        raise BumprError(MSG)
+        finally:
+            lines.close()
+
+    def parse_branch(self, header):
+        """
+        Parse a `git status --branch` header like `main...origin/main [ahead 1]`
+        """
+        header = header.split(" [", 1)[0]
+        if header.startswith("No commits yet on ") or header.startswith("Initial commit on "):
+            self.branch = header.rsplit(" ", 1)[-1]
+        elif not header.startswith("HEAD (no branch)"):
+            branch, _, upstream = header.partition("...")
+            self.branch = branch
+            if upstream:
+                self.remote, _, self.remote_branch = upstream.partition("/")
+
+    def commit(self, message, files=None):
+        if files is None:
+            self.execute(["git", "commit", "-am", message])
+        else:
+            self.execute(["git", "add", "--"] + list(files))
+            self.execute(["git", "commit", "-m", message, "--"] + list(files))
 
-        for line in execute("git status --porcelain", verbose=False).splitlines():
-            if not line.startswith("??"):
+    def tag(self, name, annotation=None):
+        cmd = ["git", "tag", name]
+        if annotation:
+            cmd += ["--annotate", "-m", '"{0}"'.format(annotation)]
+        self.execute(cmd)
+        self.tags.append(name)
+
+    def checkout(self, branch):
+        self.execute(["git", "checkout", "--quiet", branch])
+
+    def current_branch(self):
+        branch = self.query(["git", "rev-parse", "--abbrev-ref", "HEAD"]).strip()
+        return branch if branch != "HEAD" else None
+
+    def refspecs(self):
+        """The current branch and the tags created by this instance refspecs"""
+        if self.branch:
+            refspecs = ["HEAD:refs/heads/{0}".format(self.remote_branch or self.branch)]
+        else:
+            refspecs = ["HEAD"]
+        return refspecs + ["refs/tags/{0}".format(tag) for tag in self.tags]
+
+    def push(self):
+        """Push the current branch and the tags created by this instance in a single atomic push"""
+        self.execute(
+            ["git", "push", "--atomic", self.remote or self.DEFAULT_REMOTE] + self.refspecs(),
+            retry=True,
+        )
+
+
+def is_local(url):
+    """Wether a git remote url is a local path"""
+    if url.startswith("file://"):
+        return True
+    return "://" not in url and (os.path.isabs(url) or ":" not in url.split("/", 1)[0])
+
+
+def in_paths(path, paths):
+    """Wether a repository relative `path` is one of `paths` or inside one of them"""
+    for parent in paths:
+        parent = parent.replace(os.sep, "/").rstrip("/")
+        if path == parent or path.startswith(parent + "/"):
+            return True
+    return False
+
+
+class GitNative(Git):
+    """
+    A git backend working in-process through `pygit2` (libgit2) instead of `git` commands.
+
+    It falls back on the `git` commands when `pygit2` is not installed.
+    Unlike the `git` commands, it does not run the repository hooks.
+    Pushes to remote (non local) repositories still use `git push`
+    for its credentials helpers and atomic pushes support.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import pygit2  # type: ignore
+        except ImportError:
+            log.debug("pygit2 is not installed, using git commands")
+            pygit2 = None
+        self.pygit2 = pygit2
+        self._repository = None
+
+    @property
+    def repository(self):
+        if self._repository is None:
+            self._repository = self.pygit2.Repository(".")
+        return self._repository
+
+    def signature(self, role):
+        """The `AUTHOR` or `COMMITTER` signature, from the environment like git or the config"""
+        name = os.environ.get("GIT_{0}_NAME".format(role))
+        email = os.environ.get("GIT_{0}_EMAIL".format(role))
+        if not (name and email):
+            try:
+                default = self.repository.default_signature
+            except (KeyError, self.pygit2.GitError):
+                raise BumprError("Git user name and email are not configured")
+            name, email = name or default.name, email or default.email
+        return self.pygit2.Signature(name, email)
+
+    def status(self):
+        """The tracked files status flags by path"""
+        try:
+            return self.repository.status(untracked_files="no")
+        except TypeError:  # pygit2 < 1.14
+            return {
+                path: flags
+                for path, flags in self.repository.status().items()
+                if not flags & self.pygit2.GIT_STATUS_WT_NEW
+            }
+
+    def validate(self, dryrun=False, paths=None):
+        if self.pygit2 is None:
+            return super().validate(dryrun, paths)
+        if not isdir(".git"):
+            raise BumprError("Current directory is not a git repopsitory")
+        self.reset()
+
+        repository = self.repository
+        if repository.head_is_unborn:
+            self.branch = repository.references["HEAD"].target.rsplit("/", 1)[-1]
+        elif not repository.head_is_detached:
+            self.branch = repository.head.shorthand
+            try:
+                self.remote = repository.config["branch.{0}.remote".format(self.branch)]
+                merge = repository.config["branch.{0}.merge".format(self.branch)]
+                self.remote_branch = merge.replace("refs/heads/", "", 1)
+            except KeyError:
+                pass
+
+        ignored = self.pygit2.GIT_STATUS_IGNORED | self.pygit2.GIT_STATUS_WT_NEW
+        for path, flags in self.status().items():
+            if flags & ~ignored and (not paths or in_paths(path, paths)):
                 if dryrun:
                     log.warning(MSG)
                     break
                 else:
                     raise BumprError(MSG)
 
-    def commit(self, message):
-        self.execute(["git", "commit", "-am", message])
+    def commit(self, message, files=None):
+        if self.pygit2 is None:
+            return super().commit(message, files)
+        pygit2 = self.pygit2
+        repository = self.repository
+        index = repository.index
+        index.read()
+        if files is None:
+            for path, flags in self.status().items():
+                if flags & pygit2.GIT_STATUS_WT_DELETED:
+                    index.remove(path)
+                elif flags & (pygit2.GIT_STATUS_WT_MODIFIED | pygit2.GIT_STATUS_WT_TYPECHANGE):
+                    index.add(path)
+            tree_index = index
+        else:
+            # Like `git commit -- files`: other staged changes are left out of the commit
+            tree_index = pygit2.Index()
+            if not repository.head_is_unborn:
+                tree_index.read_tree(repository.head.peel(pygit2.Commit).tree)
+            for filename in files:
+                path = os.path.relpath(os.path.abspath(filename), repository.workdir)
+                path = path.replace(os.sep, "/")
+                if os.path.exists(filename):
+                    index.add(path)
+                    tree_index.add(index[path])
+                else:
+                    index.remove(path)
+                    tree_index.remove(path)
+        index.write()
+        parents = [] if repository.head_is_unborn else [repository.head.target]
+        try:
+            repository.create_commit(
+                "HEAD",
+                self.signature("AUTHOR"),
+                self.signature("COMMITTER"),
+                message if message.endswith("\n") else message + "\n",
+                tree_index.write_tree(repository),
+                parents,
+            )
+        except pygit2.GitError as e:
+            raise BumprError("Unable to commit: {0}".format(e))
 
     def tag(self, name, annotation=None):
-        cmd = ["git", "tag", name]
-        if annotation:
-            cmd += ["--annotate", "-m", '"{0}"'.format(annotation)]
-        self.execute(cmd)
+        if self.pygit2 is None:
+            return super().tag(name, annotation)
+        repository = self.repository
+        try:
+            if annotation:
+                repository.create_tag(
+                    name,
+                    repository.head.target,
+                    self.pygit2.GIT_OBJECT_COMMIT,
+                    self.signature("COMMITTER"),
+                    annotation + "\n",
+                )
+            else:
+                repository.references.create("refs/tags/{0}".format(name), repository.head.target)
+        except (ValueError, self.pygit2.GitError) as e:
+            raise BumprError("Unable to create tag {0}: {1}".format(name, e))
+        self.tags.append(name)
 
     def push(self):
-        self.execute(["git", "push"])
-        self.execute(["git", "push", "--tags"])
+        if self.pygit2 is None or not self.branch:
+            return super().push()
+        try:
+            remote = self.repository.remotes[self.remote or self.DEFAULT_REMOTE]
+        except KeyError:
+            raise BumprError("Unknown remote {0}".format(self.remote or self.DEFAULT_REMOTE))
+        if not is_local(remote.url):
+            return super().push()
+
+        rejected = []
+
+        class Callbacks(self.pygit2.RemoteCallbacks):
+            def push_update_reference(self, refname, message):
+                if message:
+                    rejected.append("{0} ({1})".format(refname, message))
+
+        try:
+            remote.push(self.refspecs(), callbacks=Callbacks())
+        except self.pygit2.GitError as e:
+            raise BumprError("Unable to push to {0}: {1}".format(remote.name, e))
+        if rejected:
+            raise BumprError("Rejected by {0}: {1}".format(remote.name, ", ".join(rejected)))
 
 
 class Mercurial(BaseVCS):
-    def validate(self, dryrun=False):
+    def validate(self, dryrun=False, paths=None):
         if not isdir(".hg"):
             raise BumprError("Current directory is not a mercurial repopsitory")
 
-        for line in execute("hg status -mard", verbose=False).splitlines():
+        for line in self.query(["hg", "status", "-mard"] + list(paths or [])).splitlines():
             if not line.startswith("??"):
                 if dryrun:
                     log.warning(MSG)
@@ -75,8 +349,11 @@ class Mercurial(BaseVCS):
                 else:
                     raise BumprError(MSG)
 
-    def commit(self, message):
-        self.execute(["hg", "commit", "-A", "-m", message])
+    def commit(self, message, files=None):
+        if files is None:
+            self.execute(["hg", "commit", "-A", "-m", message])
+        else:
+            self.execute(["hg", "commit", "-m", message] + list(files))
 
     def tag(self, name, annotation=None):
         cmd = ["hg", "tag", name]
@@ -84,16 +361,22 @@ class Mercurial(BaseVCS):
             cmd += ["-m", '"{0}"'.format(annotation)]
         self.execute(cmd)
 
+    def checkout(self, branch):
+        self.execute(["hg", "update", branch])
+
+    def current_branch(self):
+        return self.query(["hg", "branch"]).strip()
+
     def push(self):
-        self.execute(["hg", "push"])
+        self.execute(["hg", "push"], retry=True)
 
 
 class Bazaar(BaseVCS):
-    def validate(self, dryrun=False):
+    def validate(self, dryrun=False, paths=None):
         if not isdir(".bzr"):
             raise BumprError("Current directory is not a bazaar repopsitory")
 
-        for line in execute("bzr status --short", verbose=False).splitlines():
+        for line in self.query(["bzr", "status", "--short"] + list(paths or [])).splitlines():
             if not line.startswith("?"):
                 if dryrun:
                     log.warning(MSG)
@@ -101,25 +384,40 @@ class Bazaar(BaseVCS):
                 else:
                     raise BumprError(MSG)
 
-    def commit(self, message):
-        self.execute(["bzr", "commit", "-m", message])
+    def commit(self, message, files=None):
+        self.execute(["bzr", "commit", "-m", message] + list(files or []))
 
     def tag(self, name, annotation=None):
         if annotation:
             log.warning("Tag annotation is not supported by Bazaar")
         self.execute(["bzr", "tag", name])
 
+    def checkout(self, branch):
+        self.execute(["bzr", "switch", branch])
+
     def push(self):
-        self.execute(["bzr", "push"])
+        self.execute(["bzr", "push"], retry=True)
 
 
 class Fake(BaseVCS):
-    def validate(self, dryrun=False):
+    def validate(self, dryrun=False, paths=None):
         return True
 
 
+def from_config(config):
+    """Build the `config.vcs` backend with the commands options of `config`"""
+    return VCS[config.vcs](
+        verbose=config.verbose,
+        timeout=config.timeout,
+        retries=config.retries if "push" in config.retry else 0,
+        backoff=config.retry_backoff,
+        fsmonitor=config.fsmonitor,
+    )
+
+
 VCS = {
     "git": Git,
+    "git-native": GitNative,
     "hg": Mercurial,
     "bzr": Bazaar,
     "fake": Fake,
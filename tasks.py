@@ -1,4 +1,6 @@
+import json
 import os
+import shutil
 import sys
 
 from invoke import task
@@ -27,6 +29,16 @@ LINTERS = (
     ("Static Analysis", "flake8 bumpr"),
     ("Type checking", "mypy bumpr"),
 )
+# Cumulative import time budgets in milliseconds, measured with `python -X importtime`
+IMPORT_BUDGETS = (
+    ("bumpr --version", "-m bumpr --version", 5),
+    ("Configuration loading", "-c 'import bumpr.config'", 80),
+    ("Release machinery", "-c 'import bumpr.monorepo'", 120),
+)
+BENCH_RESULTS = "reports/benchmarks.json"
+BENCH_BASELINE = ".benchmarks/baseline.json"
+# Maximum tolerated slowdown of a benchmark median against the baseline
+BENCH_THRESHOLD = 0.25
 FORMATTERS = (
     ("Sort imports using isort", "isort"),
     ("Format code using black", "black"),
@@ -121,6 +133,41 @@ def cover(ctx, report=False, verbose=False):
         ctx.run(" ".join(cmd), pty=PTY)
 
 
+@task
+def bench(ctx, save=False, threshold=BENCH_THRESHOLD):
+    """Run benchmarks and compare them to the baseline"""
+    header(bench.__doc__)
+    with ctx.cd(ROOT):
+        ctx.run(f"pytest tests/benchmarks --bench --bench-json={BENCH_RESULTS}", pty=PTY)
+    results = os.path.join(ROOT, BENCH_RESULTS)
+    baseline = os.path.join(ROOT, BENCH_BASELINE)
+    if save:
+        os.makedirs(os.path.dirname(baseline), exist_ok=True)
+        shutil.copy(results, baseline)
+        success(f"Benchmarks baseline saved in {BENCH_BASELINE}")
+        return
+    if not os.path.exists(baseline):
+        exit(f"No benchmarks baseline in {BENCH_BASELINE}, run with --save to create it")
+    with open(results) as f:
+        current = json.load(f)["benchmarks"]
+    with open(baseline) as f:
+        reference = json.load(f)["benchmarks"]
+    regressions = []
+    for name, result in sorted(current.items()):
+        if name not in reference:
+            info("{0}: {1:.4f}s (new)", name, result["median"])
+            continue
+        ratio = result["median"] / reference[name]["median"] - 1
+        text = f"{name}: {result['median']:.4f}s ({ratio:+.1%})"
+        if ratio > threshold:
+            regressions.append(name)
+            error(text)
+        else:
+            success(text)
+    if regressions:
+        exit(f"{len(regressions)} benchmark(s) slower than the {threshold:.0%} threshold")
+
+
 @task
 def lint(ctx):
     """Run linters"""
@@ -141,6 +188,36 @@ def lint(ctx):
         success("All linters succeeded")
 
 
+def import_time(output):
+    """Sum the cumulative import time in milliseconds of the top-level bumpr modules"""
+    total = 0
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip().startswith("bumpr") and not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1000
+
+
+@task
+def importtime(ctx):
+    """Check import times against their budget"""
+    header(importtime.__doc__)
+    with ctx.cd(ROOT):
+        over_budget = False
+        for name, args, budget in IMPORT_BUDGETS:
+            result = ctx.run(f"{sys.executable} -X importtime {args}", hide=True)
+            elapsed = import_time(result.stderr)
+            if elapsed > budget:
+                over_budget = True
+                error(f"{name}: {elapsed:.1f}ms (budget: {budget}ms)")
+            else:
+                success(f"{name}: {elapsed:.1f}ms (budget: {budget}ms)")
+        if over_budget:
+            exit("some import times are over budget")
+
+
 @task
 def format(ctx):
     """Format code"""
@@ -0,0 +1,68 @@
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import pytest
+
+from bumpr import __version__
+
+RESULTS = {}
+
+
+class Benchmark:
+    """
+    Time a function over some rounds.
+
+    `setup` is executed before each round, outside of the timed section.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, func, *args, rounds=5, setup=None, **kwargs):
+        timings = []
+        for _ in range(rounds):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            timings.append(time.perf_counter() - start)
+        RESULTS[self.name] = {
+            "rounds": rounds,
+            "min": min(timings),
+            "max": max(timings),
+            "mean": statistics.mean(timings),
+            "median": statistics.median(timings),
+        }
+        return result
+
+
+@pytest.fixture
+def benchmark(request):
+    return Benchmark(request.node.name)
+
+
+def pytest_sessionfinish(session):
+    filename = session.config.getoption("--bench-json")
+    if not filename or not RESULTS:
+        return
+    # Tests change the current directory
+    filename = os.path.join(str(session.config.invocation_params.dir), filename)
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(filename, "w") as f:
+        json.dump(
+            {
+                "version": __version__,
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "benchmarks": RESULTS,
+            },
+            f,
+            indent=2,
+            sort_keys=True,
+        )
@@ -0,0 +1,182 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from bumpr.config import Config
+from bumpr.releaser import Releaser
+from bumpr.vcs import Fake, Git
+
+pytestmark = pytest.mark.benchmark
+
+VERSION = "1.2.3.dev"
+
+CONTENT = """\
+Some package documentation
+
+Version: {0}
+Lorem ipsum dolor sit amet, consectetur adipisicing elit.
+Non, ad, facilis, vel voluptas fugiat sit debitis iusto
+numquam quasi aliquid cum quod laborum assumenda quia
+""".format(
+    VERSION
+)
+
+LINE = "Lorem ipsum dolor sit amet, consectetur adipisicing elit.\n"
+
+
+def write_files(count, content=CONTENT):
+    """Write `count` files in a `docs` tree of 100 files directories"""
+    filenames = []
+    for i in range(count):
+        dirname = "docs/{0}".format(i // 100)
+        if i % 100 == 0:
+            shutil.rmtree(dirname, ignore_errors=True)
+            os.makedirs(dirname)
+        filename = "{0}/file{1}.txt".format(dirname, i)
+        with open(filename, "w") as f:
+            f.write(content)
+        filenames.append(filename)
+    return filenames
+
+
+def write_large_file(filename, size):
+    """Write a `size` bytes file with a version string every 1000 lines"""
+    lines = size // len(LINE)
+    with open(filename, "w") as f:
+        for i in range(lines):
+            f.write("Version: {0}\n".format(VERSION) if i % 1000 == 0 else LINE)
+
+
+def releaser_for(workspace, **kwargs):
+    config = Config({"file": str(workspace.module), **kwargs})
+    return Releaser(config)
+
+
+@pytest.mark.parametrize("count", [10, 1000, 10000])
+def test_bump_files(benchmark, workspace, count):
+    filenames = write_files(count)
+    releaser = releaser_for(workspace, files=filenames)
+
+    benchmark(
+        releaser.bump_files,
+        [(VERSION, "1.2.3")],
+        rounds=3 if count > 1000 else 5,
+        setup=lambda: write_files(count),
+    )
+
+    assert releaser.stats["rewritten"] > count
+
+
+@pytest.mark.parametrize("count", [1000])
+def test_bump_files_glob(benchmark, workspace, count):
+    write_files(count)
+    releaser = releaser_for(workspace, files=["docs/**/*.txt"])
+
+    benchmark(releaser.bump_files, [(VERSION, "1.2.3")], setup=lambda: write_files(count))
+
+
+@pytest.mark.parametrize("count", [1000])
+def test_bump_files_parallel(benchmark, workspace, count):
+    filenames = write_files(count)
+    releaser = releaser_for(workspace, files=filenames, jobs=4)
+
+    benchmark(releaser.bump_files, [(VERSION, "1.2.3")], setup=lambda: write_files(count))
+
+
+@pytest.mark.parametrize("size", [8 * 1024 * 1024, 32 * 1024 * 1024])
+def test_bump_large_file(benchmark, workspace, size):
+    write_large_file("large.txt", size)
+    releaser = releaser_for(workspace, files=["large.txt"])
+
+    benchmark(
+        releaser.bump_files,
+        [(VERSION, "1.2.3")],
+        rounds=3,
+        setup=lambda: write_large_file("large.txt", size),
+    )
+
+
+def test_find_version_large_file(benchmark, workspace):
+    write_large_file("large.py", 32 * 1024 * 1024)
+    with open("large.py", "a") as f:
+        f.write("__version__ = '{0}'\n".format(VERSION))
+    releaser = releaser_for(workspace, files=[])
+    releaser.config.file = "large.py"
+
+    assert benchmark(releaser.find_version, rounds=3) == VERSION
+
+
+def test_dryrun_diff(benchmark, workspace):
+    filenames = write_files(1000)
+    releaser = releaser_for(workspace, files=filenames, dryrun=True)
+
+    def diff():
+        releaser.bump_files([(VERSION, "1.2.3")])
+        diffs = [list(diff) for diff in releaser.diffs.values()]
+        releaser.diffs.clear()
+        releaser.modified.clear()
+        return diffs
+
+    diffs = benchmark(diff)
+
+    assert len(diffs) == 1001
+
+
+def test_config_parsing(benchmark, workspace):
+    packages = "\n".join(
+        "[package:pkg{0}]\nfile = pkg{0}/__init__.py\nfiles = pkg{0}/README\n".format(i)
+        for i in range(50)
+    )
+    workspace.write(
+        "bumpr.rc",
+        """\
+        [bumpr]
+        file = fake.py
+        vcs = git
+        files =
+            README
+            docs/**/*.md
+        exclude = docs/_build/**
+
+        [bump]
+        message = Release {{version}}
+
+        [changelog]
+        file = CHANGELOG.md
+        bump = {{version}}
+        prepare = Current
+
+        [readthedoc]
+        id = bumpr
+
+        """
+        + packages,
+    )
+
+    config = benchmark(Config.parse_args, [], rounds=20)
+
+    assert len(config.packages) == 50
+
+
+def test_fake_vcs_validate(benchmark, workspace):
+    benchmark(Fake().validate, rounds=20)
+
+
+@pytest.fixture
+def git_repository(workspace, monkeypatch):
+    if not shutil.which("git"):
+        pytest.skip("git is not available")
+    for key in "AUTHOR", "COMMITTER":
+        monkeypatch.setenv("GIT_{0}_NAME".format(key), "bumpr")
+        monkeypatch.setenv("GIT_{0}_EMAIL".format(key), "bumpr@example.com")
+    monkeypatch.setenv("GIT_CONFIG_NOSYSTEM", "1")
+    write_files(1000)
+    for command in ["init", "-q"], ["add", "."], ["commit", "-q", "-m", "init"]:
+        subprocess.check_call(["git"] + command)
+    return workspace
+
+
+def test_git_validate(benchmark, git_repository):
+    benchmark(Git().validate, rounds=10)
@@ -3,10 +3,26 @@ from textwrap import dedent
 import pytest
 
 
-def pytest_configure():
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption("--bench", action="store_true", help="Run the benchmarks")
+    group.addoption("--bench-json", metavar="PATH", help="Save the benchmarks results as JSON")
+
+
+def pytest_configure(config):
     from bumpr import log
 
     log.init()
+    config.addinivalue_line("markers", "benchmark: marks benchmarks, only run with --bench")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--bench"):
+        return
+    skip = pytest.mark.skip(reason="Benchmarks only run with --bench")
+    for item in items:
+        if item.get_closest_marker("benchmark"):
+            item.add_marker(skip)
 
 
 DEFAULT_VERSION = "1.2.3.dev"
@@ -362,6 +362,244 @@ class ConfigTest:
 
         assert config == expected
 
+    @pytest.mark.bumprc(
+        """\
+        [bumpr]
+        jobs = 4
+    """
+    )
+    def test_jobs_from_config(self):
+        config = Config.parse_args(["-c", "test.rc"])
+
+        assert config.jobs == 4
+
+    @pytest.mark.bumprc(
+        """\
+        [bumpr]
+        regex_scan_bytes = 65536
+        regex_max_line = 100
+    """
+    )
+    def test_regex_limits_from_config(self):
+        config = Config.parse_args(["-c", "test.rc"])
+
+        assert config.regex_scan_bytes == 65536
+        assert config.regex_max_line == 100
+
+    @pytest.mark.bumprc(
+        """\
+        [bumpr]
+        files =
+            README
+            docs/**/*.md
+        exclude =
+            docs/drafts/**
+    """
+    )
+    def test_files_patterns_from_config(self):
+        config = Config.parse_args(["-c", "test.rc"])
+
+        assert config.files == ["README", "docs/**/*.md"]
+        assert config.exclude == ["docs/drafts/**"]
+
+    def test_jobs_from_args(self):
+        config = Config.parse_args(["-c", "fake", "-j", "8"])
+
+        assert config.jobs == 8
+
+    def test_output_log_from_args(self):
+        config = Config.parse_args(["-c", "fake", "--output-log", "build.log"])
+
+        assert config.output_log == "build.log"
+
+    @pytest.mark.bumprc(
+        """\
+        [bumpr]
+        timings = true
+        timings_output = timings.json
+    """
+    )
+    def test_timings_from_config(self):
+        config = Config.parse_args(["-c", "test.rc"])
+
+        assert config.timings is True
+        assert config.timings_output == "timings.json"
+        assert config.timings_format == "json"
+
+    def test_timings_from_args(self):
+        config = Config.parse_args(
+            [
+                "-c",
+                "fake",
+                "--timings",
+                "--timings-output",
+                "trace.json",
+                "--timings-format",
+                "chrome",
+            ]
+        )
+
+        assert config.timings is True
+        assert config.timings_output == "trace.json"
+        assert config.timings_format == "chrome"
+
+    @pytest.mark.bumprc(
+        """\
+        [bumpr]
+        parallel = tests, publish
+        parallel_jobs = 2
+    """
+    )
+    def test_parallel_from_config(self):
+        config = Config.parse_args(["-c", "test.rc"])
+
+        assert config.parallel == ["tests", "publish"]
+        assert config.parallel_jobs == 2
+
+    @pytest.mark.bumprc(
+        """\
+        [bumpr]
+        timeout = 600
+        retries = 3
+        retry = publish
+        retry_backoff = 2.5
+    """
+    )
+    def test_timeout_and_retries_from_config(self):
+        config = Config.parse_args(["-c", "test.rc"])
+
+        assert config.timeout == 600
+        assert config.retries == 3
+        assert config.retry == ["publish"]
+        assert config.retry_backoff == 2.5
+
+    @pytest.mark.bumprc(
+        """\
+        [bumpr]
+        vcs = git
+        fsmonitor = true
+    """
+    )
+    def test_fsmonitor_from_config(self):
+        assert Config.parse_args(["-c", "test.rc"]).fsmonitor
+
+    def test_timeout_and_retries_from_args(self):
+        config = Config.parse_args(["-c", "fake", "--timeout", "1.5", "--retries", "2"])
+
+        assert config.timeout == 1.5
+        assert config.retries == 2
+
+    def test_validate_retry(self):
+        config = Config({"file": "version.py", "retry": ["bump"]})
+
+        with pytest.raises(ValidationError):
+            config.validate()
+
+    def test_validate_parallel(self):
+        config = Config({"file": "version.py", "parallel": ["tests", "unknown"]})
+
+        with pytest.raises(ValidationError):
+            config.validate()
+
+    def test_validate_timings_format(self):
+        config = Config({"file": "version.py", "timings_format": "xml"})
+
+        with pytest.raises(ValidationError):
+            config.validate()
+
+    @pytest.mark.bumprc(
+        """\
+        [bumpr]
+        vcs = git
+        tests = tox
+        files = README
+        [package:pkg-a]
+        file = pkg-a/__init__.py
+        files =
+            pkg-a/README
+            pkg-a/docs/*.md
+        [bumpr:package:pkg-b]
+        file = pkg-b/__init__.py
+        tag_format = b{version}
+        [package:pkg-b:changelog]
+        file = CHANGES
+    """
+    )
+    def test_packages_from_config(self):
+        config = Config.parse_args(["-c", "test.rc"])
+
+        assert list(config.packages) == ["pkg-a", "pkg-b"]
+        assert config.packages["pkg-a"] == {
+            "file": "pkg-a/__init__.py",
+            "files": ["pkg-a/README", "pkg-a/docs/*.md"],
+        }
+        assert config.packages["pkg-b"]["changelog"]["file"] == "CHANGES"
+        assert config.packages["pkg-b"]["changelog"]["empty"] == "Nothing yet"
+
+        package = config.package("pkg-a")
+        assert package.name == "pkg-a"
+        assert package.vcs == "git"
+        assert package.tests is None
+        assert package.files == ["pkg-a/README", "pkg-a/docs/*.md"]
+        assert package.tag_format == "{name}-{version}"
+        assert package.packages == {}
+        assert all(package[hook.key] is False for hook in HOOKS)
+
+        package = config.package("pkg-b")
+        assert package.files == []
+        assert package.tag_format == "b{version}"
+        assert package.changelog.file == "CHANGES"
+
+    @pytest.mark.bumprc(
+        """\
+        [bumpr]
+        commit = true
+        [package:pkg-a]
+        file = pkg-a/__init__.py
+        commit = false
+        regex_max_line = 5
+        timeout = 1.5
+        retry = tests, publish
+    """
+    )
+    def test_typed_package_options_from_config(self):
+        config = Config.parse_args(["-c", "test.rc"])
+
+        assert config.packages["pkg-a"] == {
+            "file": "pkg-a/__init__.py",
+            "commit": False,
+            "regex_max_line": 5,
+            "timeout": 1.5,
+            "retry": ["tests", "publish"],
+        }
+        package = config.package("pkg-a")
+        assert package.commit is False
+        assert package.regex_max_line == 5
+
+    def test_package_unknown(self):
+        config = Config()
+        with pytest.raises(ValidationError):
+            config.package("unknown")
+
+    def test_only_from_args(self):
+        config = Config.parse_args(["-c", "fake", "-k", "pkg-a", "--package", "pkg-b"])
+
+        assert config.only == ["pkg-a", "pkg-b"]
+
+    def test_validate_packages(self):
+        config = Config()
+        config.packages = {"pkg-a": {"file": "pkg-a/__init__.py"}}
+        config.validate()
+
+        config.only = ["unknown"]
+        with pytest.raises(ValidationError):
+            config.validate()
+
+        config.only = []
+        config.packages["pkg-b"] = {}
+        with pytest.raises(ValidationError):
+            config.validate()
+
     def test_validate(self):
         config = Config({"file": "version.py"})
         config.validate()
@@ -0,0 +1,93 @@
+import difflib
+
+import pytest
+
+from bumpr.diff import changed_region, unified_diff
+from bumpr.replacer import Replacer
+
+TEXT = "".join("line {0}\n".format(i) for i in range(1, 51))
+
+
+def expected(before, after, context=3, **kwargs):
+    """The whole file `difflib` diff"""
+    lines = difflib.unified_diff(
+        before.split("\n"), after.split("\n"), lineterm="", n=context, **kwargs
+    )
+    return list(lines)
+
+
+def edit(text, old, new):
+    replacer = Replacer([(old, new)])
+    return replacer.replace(text), replacer.edits(text)
+
+
+@pytest.mark.parametrize(
+    "old,new",
+    [
+        ("line 1\n", "first line\n"),
+        ("line 25\n", "middle line\n"),
+        ("line 50\n", "last line\n"),
+        ("line 4\n", "line 4\nline 4 bis\n"),
+        ("line 4\nline 5\n", ""),
+    ],
+)
+@pytest.mark.parametrize("context", [0, 1, 3])
+def test_single_region(old, new, context):
+    after, edits = edit(TEXT, old, new)
+
+    assert list(unified_diff(TEXT, after, edits, context)) == expected(TEXT, after, context)
+    assert list(unified_diff(TEXT, after, None, context)) == expected(TEXT, after, context)
+
+
+@pytest.mark.parametrize("context", [0, 1, 3])
+def test_many_regions(context):
+    before = TEXT.replace("line 2\n", "v1\n").replace("line 9\n", "v1\n")
+    before = before.replace("line 16\n", "v1\n").replace("line 40\n", "x v1 v1\n")
+    after, edits = edit(before, "v1", "v2")
+
+    assert list(unified_diff(before, after, edits, context)) == expected(before, after, context)
+
+
+def test_no_change():
+    assert list(unified_diff(TEXT, TEXT)) == []
+    assert list(unified_diff(TEXT, TEXT, [])) == []
+
+
+def test_without_trailing_newline():
+    before = "a\nb\nversion 1"
+    after, edits = edit(before, "1", "2")
+
+    assert list(unified_diff(before, after, edits)) == expected(before, after)
+
+
+def test_file_headers():
+    after, edits = edit(TEXT, "line 25\n", "middle line\n")
+
+    diff = list(unified_diff(TEXT, after, edits, fromfile="a/README", tofile="b/README"))
+
+    assert diff[:3] == ["--- a/README", "+++ b/README", "@@ -22,7 +22,7 @@"]
+    assert diff == expected(TEXT, after, fromfile="a/README", tofile="b/README")
+
+
+def test_lazy():
+    diff = unified_diff(TEXT, None)  # Nothing is computed until iterated
+
+    with pytest.raises(TypeError):
+        next(diff)
+
+
+@pytest.mark.parametrize(
+    "before,after,region",
+    [
+        ("abcdef", "abXdef", (2, 3, "X")),
+        ("abcdef", "abcXdef", (3, 3, "X")),
+        ("abcdef", "abef", (2, 4, "")),
+        ("aaaa", "aaaaa", (4, 4, "a")),
+        ("", "abc", (0, 0, "abc")),
+        ("same", "same", (4, 4, "")),
+    ],
+)
+def test_changed_region(before, after, region):
+    assert changed_region(before, after) == region
+    start, end, replacement = region
+    assert before[:start] + replacement + before[end:] == after
@@ -0,0 +1,65 @@
+import pytest
+
+from bumpr.edits import Edit, EditConflict, EditList
+
+
+class EditListTest:
+    def test_apply(self):
+        edits = EditList("file", "version 1.2.3.dev (1.2.3.dev)")
+        edits.add(19, 9, "1.2.3", "second")
+        edits.add(8, 9, "1.2.3", "first")
+
+        assert edits.apply() == "version 1.2.3 (1.2.3)"
+        assert edits.text == "version 1.2.3.dev (1.2.3.dev)"
+        assert edits.spans() == [(8, 17, "1.2.3"), (19, 28, "1.2.3")]
+
+    def test_apply_without_edits(self):
+        edits = EditList("file", "text")
+
+        assert not edits
+        assert edits.apply() == "text"
+
+    def test_extend(self):
+        edits = EditList("file", "abc")
+        edits.extend([(0, 1, "A"), (2, 2, "-")], "source")
+
+        assert edits.edits == [Edit(0, 1, "A", "source"), Edit(2, 0, "-", "source")]
+        assert edits.apply() == "Ab-c"
+
+    @pytest.mark.parametrize(
+        "text,old,new",
+        [("aaaa", "aa", "b"), ("a-b-c", "-", "+"), ("abc", "x", "y"), ("ab", "", "x")],
+    )
+    def test_replace_like_str_replace(self, text, old, new):
+        edits = EditList("file", text)
+        edits.replace(old, new)
+
+        assert edits.apply() == text.replace(old, new) if old else text
+
+    def test_adjacent_edits(self):
+        edits = EditList("file", "abcd")
+        edits.add(0, 2, "X")
+        edits.add(2, 2, "Y")
+
+        assert edits.apply() == "XY"
+
+    @pytest.mark.parametrize(
+        "first,second",
+        [
+            ((0, 3, "X"), (2, 2, "Y")),
+            ((1, 1, "X"), (0, 4, "Y")),
+            ((1, 0, "X"), (1, 0, "Y")),
+            ((1, 0, "X"), (1, 2, "Y")),
+        ],
+    )
+    def test_conflicts(self, first, second):
+        edits = EditList("file", "abcd")
+        edits.add(*first, source="changelog")
+        edits.add(*second, source="replacements")
+
+        with pytest.raises(EditConflict) as excinfo:
+            edits.apply()
+
+        assert "file" in str(excinfo.value)
+        assert "changelog" in str(excinfo.value)
+        assert "replacements" in str(excinfo.value)
@@ -0,0 +1,285 @@
+import builtins
+import os
+import re
+
+import pytest
+
+from bumpr.files import ContentCache, FileIndex, Transaction, is_pattern, translate
+
+
+@pytest.mark.parametrize(
+    "pattern,path,expected",
+    [
+        ("*.md", "README.md", True),
+        ("*.md", "docs/index.md", False),
+        ("docs/*.md", "docs/index.md", True),
+        ("docs/**/*.md", "docs/index.md", True),
+        ("docs/**/*.md", "docs/api/index.md", True),
+        ("**/Chart.yaml", "charts/app/Chart.yaml", True),
+        ("charts/*/Chart.yaml", "charts/app/Chart.yaml", True),
+        ("charts/*/Chart.yaml", "charts/app/sub/Chart.yaml", False),
+        ("file?.txt", "file1.txt", True),
+        ("file[0-9].txt", "file1.txt", True),
+        ("file[!0-9].txt", "file1.txt", False),
+    ],
+)
+def test_translate(pattern, path, expected):
+    assert bool(re.match("^{0}$".format(translate(pattern)), path)) is expected
+
+
+def test_is_pattern():
+    assert is_pattern("docs/*.md")
+    assert is_pattern("file?.txt")
+    assert is_pattern("file[0-9].txt")
+    assert not is_pattern("README.md")
+
+
+@pytest.fixture
+def tree(workspace):
+    for dirname in "docs", "docs/api", "build", "charts", "charts/app", ".git":
+        workspace.mkdir(dirname)
+    workspace.write("docs/index.md", "")
+    workspace.write("docs/api/index.md", "")
+    workspace.write("docs/api/generated.md", "")
+    workspace.write("docs/draft.md", "")
+    workspace.write("build/index.md", "")
+    workspace.write("charts/app/Chart.yaml", "")
+    workspace.write(".git/config.md", "")
+    workspace.write(".gitignore", "build/\ngenerated.md\n*.log\n")
+    workspace.write("docs/.gitignore", "draft.md\n")
+    workspace.write("app.log", "")
+    return workspace
+
+
+class FileIndexTest:
+    def test_files_honour_gitignore(self, tree):
+        index = FileIndex()
+        assert index.files == [
+            ".gitignore",
+            "README",
+            "fake.py",
+            "charts/app/Chart.yaml",
+            "docs/.gitignore",
+            "docs/index.md",
+            "docs/api/index.md",
+        ]
+
+    def test_negated_rule(self, tree):
+        tree.write("docs/.gitignore", "*.md\n!index.md\n")
+        index = FileIndex()
+        assert index.glob("docs/**/*.md") == ["docs/index.md", "docs/api/index.md"]
+
+    def test_glob(self, tree):
+        index = FileIndex()
+        assert index.glob("docs/**/*.md") == ["docs/index.md", "docs/api/index.md"]
+        assert index.glob("charts/*/Chart.yaml") == ["charts/app/Chart.yaml"]
+        assert index.glob("./docs/*.md") == ["docs/index.md"]
+
+    def test_expand(self, tree):
+        index = FileIndex()
+        expanded = index.expand(
+            ["README", "docs/**/*.md", "charts/*/Chart.yaml", "docs/index.md"],
+            excludes=["docs/api/**"],
+        )
+        assert expanded == ["README", "docs/index.md", "charts/app/Chart.yaml"]
+
+    def test_expand_keeps_literal_filenames(self, tree):
+        index = FileIndex()
+        assert index.expand(["build/index.md", "missing.txt"]) == ["build/index.md", "missing.txt"]
+
+    def test_walk_once(self, tree, mocker):
+        walk = mocker.spy(os, "walk")
+        index = FileIndex()
+        index.expand(["docs/*.md", "docs/**/*.md", "*.py"])
+        index.glob("charts/**")
+        assert walk.call_count == 1
+
+    def test_no_walk_without_patterns(self, tree, mocker):
+        walk = mocker.spy(os, "walk")
+        index = FileIndex()
+        index.expand(["README", "fake.py"])
+        assert not walk.called
+
+
+def read(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+class TransactionTest:
+    def test_stage_and_commit(self, workspace):
+        transaction = Transaction()
+        with transaction.stage("README") as f:
+            f.write(b"new readme")
+
+        assert "README" in transaction
+        assert read(transaction.path("README")) == "new readme"
+        assert "new readme" != read("README")
+
+        transaction.commit()
+
+        assert read("README") == "new readme"
+        transaction.close()
+        assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+    def test_stage_twice(self, workspace):
+        transaction = Transaction()
+        for content in b"first", b"second":
+            with transaction.stage("README") as f:
+                f.write(content)
+        transaction.commit()
+        transaction.close()
+
+        assert read("README") == "second"
+        assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+    def test_stage_normalized_path(self, workspace):
+        transaction = Transaction()
+        with transaction.stage("./README") as f:
+            f.write(b"first")
+        with transaction.stage("README") as f:
+            f.write(b"second")
+
+        assert "./README" in transaction
+        assert transaction.path("./README") == transaction.path("README")
+        transaction.commit()
+        transaction.close()
+
+        assert read("README") == "second"
+        assert transaction.committed == []
+        assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+    def test_stage_error(self, workspace):
+        transaction = Transaction()
+        with pytest.raises(ValueError):
+            with transaction.stage("README"):
+                raise ValueError()
+
+        assert "README" not in transaction
+        assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+    def test_rollback(self, workspace):
+        original = read("README")
+        transaction = Transaction()
+        for filename in "README", "fake.py", "new.txt":
+            with transaction.stage(filename) as f:
+                f.write(b"new content")
+        transaction.commit()
+        assert read("README") == "new content"
+
+        transaction.rollback()
+
+        assert read("README") == original
+        assert "1.2.3.dev" in read("fake.py")
+        assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+    def test_commit_twice(self, workspace):
+        original = read("README")
+        transaction = Transaction()
+        for content in b"first", b"second":
+            with transaction.stage("README") as f:
+                f.write(content)
+            with transaction.stage("new.txt") as f:
+                f.write(content)
+            transaction.commit()
+
+        assert read("README") == "second"
+        assert transaction.committed == ["README", "new.txt"]
+
+        transaction.rollback()
+        transaction.close()
+
+        assert read("README") == original
+        assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+    def test_commit_twice_and_close(self, workspace):
+        transaction = Transaction()
+        for content in b"first", b"second":
+            with transaction.stage("README") as f:
+                f.write(content)
+            transaction.commit()
+        transaction.close()
+
+        assert read("README") == "second"
+        assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+    def test_stage_symlink(self, workspace):
+        os.mkdir("docs")
+        os.rename("README", os.path.join("docs", "index.md"))
+        os.symlink(os.path.join("docs", "index.md"), "README")
+        original = read("README")
+        transaction = Transaction()
+        with transaction.stage("README") as f:
+            f.write(b"new readme")
+
+        assert "README" in transaction
+        assert read(transaction.path("README")) == "new readme"
+
+        transaction.commit()
+
+        assert os.path.islink("README")
+        assert read(os.path.join("docs", "index.md")) == "new readme"
+        assert transaction.committed == [os.path.join("docs", "index.md")]
+
+        transaction.rollback()
+
+        assert os.path.islink("README")
+        assert read("README") == original
+        assert sorted(os.listdir("docs")) == ["index.md"]
+
+    def test_commit_failure_restores_originals(self, workspace, mocker):
+        original = read("README")
+        transaction = Transaction()
+        for filename in "README", "fake.py":
+            with transaction.stage(filename) as f:
+                f.write(b"new content")
+        replace = os.replace
+        failures = [OSError("disk full")]
+
+        def failing_replace(src, dst):
+            if dst == "fake.py" and failures:
+                raise failures.pop()
+            replace(src, dst)
+
+        mocker.patch("os.replace", side_effect=failing_replace)
+
+        with pytest.raises(OSError):
+            transaction.commit()
+
+        mocker.stopall()
+        assert read("README") == original
+        assert "1.2.3.dev" in read("fake.py")
+        assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+
+class ContentCacheTest:
+    def test_read_once(self, workspace, mocker):
+        cache = ContentCache()
+        spy = mocker.spy(builtins, "open")
+
+        assert cache.read("README") == cache.read("README")
+
+        assert spy.call_count == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_read_modified_file(self, workspace):
+        cache = ContentCache()
+        cache.read("README")
+        workspace.write("README", "a new content of another size")
+
+        assert cache.read("README") == b"a new content of another size"
+        assert cache.misses == 2
+        assert len(cache.contents) == 1
+
+    def test_store_survives_rename(self, workspace, mocker):
+        cache = ContentCache()
+        transaction = Transaction()
+        with transaction.stage("README") as f:
+            f.write(b"staged")
+        cache.store(transaction.path("README"), b"staged")
+        transaction.commit()
+        transaction.close()
+        spy = mocker.spy(builtins, "open")
+
+        assert cache.read("README") == b"staged"
+        assert not spy.called
@@ -1,56 +1,103 @@
-from subprocess import CalledProcessError
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+from subprocess import CalledProcessError, TimeoutExpired
 
 import pytest
 
-from bumpr.helpers import BumprError, check_output, execute
+from bumpr.helpers import (
+    BumprError,
+    CommandOutput,
+    command_prefixes,
+    execute,
+    iter_lines,
+    run_command,
+)
+
+WAIT_FOR = """\
+import os, time
+open({mine!r}, "w").close()
+deadline = time.time() + 10
+while not os.path.exists({other!r}) and time.time() < deadline:
+    time.sleep(0.01)
+print({mine!r})
+"""
 
 
 @pytest.fixture
-def check_call(mocker):
-    yield mocker.patch("subprocess.check_call")
+def commands(mocker):
+    """
+    Record the commands run attached to the terminal and the commands with a piped output.
+
+    The piped commands output is their mock `return_value`.
+    """
+    terminal = mocker.Mock()
+    piped = mocker.Mock(return_value="")
+
+    def run(cmd, output=None, cwd=None, timeout=None):
+        if output is None:
+            terminal(cmd)
+        else:
+            for line in piped(cmd).splitlines(True):
+                output.write(line)
 
+    mocker.patch("bumpr.helpers.run_command", side_effect=run)
+    yield terminal, piped
 
-@pytest.fixture(name="check_output")
-def check_output_mock(mocker):
-    yield mocker.patch("bumpr.helpers.check_output")
+
+@pytest.fixture
+def terminal(commands):
+    yield commands[0]
+
+
+@pytest.fixture
+def piped(commands):
+    yield commands[1]
 
 
 class ExecuteTest:
-    def test_execute_quiet(self, check_call, check_output):
-        output = "some output"
-        check_output.return_value = output
-        assert execute("some command") == output
-        check_output.assert_called_with(["some", "command"])
-        assert not check_call.called
-
-    def test_execute_verbose(self, check_call, check_output):
+    def test_execute_quiet(self, terminal, piped):
+        piped.return_value = "some output"
+        assert execute("some command") == ""
+        piped.assert_called_with(["some", "command"])
+        assert not terminal.called
+
+    def test_execute_capture(self, terminal, piped):
+        piped.return_value = "some output\n"
+        assert execute("some command\nanother command", capture=True) == "some output\n" * 2
+        assert not terminal.called
+
+    def test_execute_verbose(self, terminal, piped):
         execute("some command", verbose=True)
-        check_call.assert_called_with(["some", "command"])
-        assert not check_output.called
+        terminal.assert_called_with(["some", "command"])
+        assert not piped.called
 
-    def test_execute_array(self, check_call, check_output):
+    def test_execute_array(self, terminal, piped):
         execute(["some", "command"])
-        check_output.assert_called_with(["some", "command"])
-        assert not check_call.called
+        piped.assert_called_with(["some", "command"])
+        assert not terminal.called
 
-    def test_execute_quoted(self, check_output):
+    def test_execute_quoted(self, piped):
         execute('some command "with quote"')
-        check_output.assert_called_with(["some", "command", "with quote"])
+        piped.assert_called_with(["some", "command", "with quote"])
 
-    def test_execute_format(self, check_output):
+    def test_execute_format(self, piped):
         execute("some command {key}", replacements={"key": "value"})
-        check_output.assert_called_with(["some", "command", "value"])
+        piped.assert_called_with(["some", "command", "value"])
 
-    def test_execute_format_array(self, check_output):
+    def test_execute_format_array(self, piped):
         execute(["some", "command", "{key}"], replacements={"key": "value"})
-        check_output.assert_called_with(["some", "command", "value"])
+        piped.assert_called_with(["some", "command", "value"])
 
-    def test_execute_dry(self, check_call, check_output):
+    def test_execute_dry(self, terminal, piped):
         execute("some command", dryrun=True)
-        assert not check_call.called
-        assert not check_output.called
+        assert not terminal.called
+        assert not piped.called
 
-    def test_execute_multiple(self, check_output, mocker):
+    def test_execute_multiple(self, piped, mocker):
         execute(
             """
             some command
@@ -62,10 +109,10 @@ class ExecuteTest:
             mocker.call(["some", "command"]),
             mocker.call(["another", "command"]),
         )
-        for executed, expected in zip(check_output.call_args_list, expected):
+        for executed, expected in zip(piped.call_args_list, expected):
             assert executed == expected
 
-    def test_execute_multiple_array(self, check_output, mocker):
+    def test_execute_multiple_array(self, piped, mocker):
         execute(
             (
                 ["some", "command"],
@@ -77,24 +124,259 @@ class ExecuteTest:
             mocker.call(["some", "command"]),
             mocker.call(["another", "command"]),
         )
-        for executed, expected in zip(check_output.call_args_list, expected):
+        for executed, expected in zip(piped.call_args_list, expected):
             assert executed == expected
 
-    def test_execute_error_quiet(self, check_output, mocker):
+    def test_execute_error_quiet(self, piped, mocker):
         error = CalledProcessError(1, "cmd")
         error.output = "some output"
-        check_output.side_effect = error
+        piped.side_effect = error
 
         with pytest.raises(BumprError):
             mocker.patch("builtins.print")
             execute("some failed command")
 
-    def test_execute_error_verbose(self, check_call):
-        check_call.side_effect = CalledProcessError(1, "cmd")
+    def test_execute_error_verbose(self, terminal):
+        terminal.side_effect = CalledProcessError(1, "cmd")
 
         with pytest.raises(BumprError):
             execute("some failed command", verbose=True)
 
 
-def test_check_output():
-    assert check_output(["echo", "123"]).strip() == "123"
+PYTHON = [sys.executable, "-c"]
+
+
+class ExecuteParallelTest:
+    def test_concurrent_commands(self, tmpdir):
+        # Each command waits for the other one to start
+        commands = [
+            PYTHON + [WAIT_FOR.format(mine=name, other=other)]
+            for name, other in (("a", "b"), ("b", "a"))
+        ]
+
+        start = time.perf_counter()
+        output = execute(commands, parallel=True, cwd=str(tmpdir), capture=True)
+
+        assert time.perf_counter() - start < 5
+        assert output == "a\nb\n"
+
+    def test_concurrency_limit(self, mocker):
+        spy = mocker.spy(asyncio, "Semaphore")
+
+        output = execute(
+            [PYTHON + ["print(1)"], PYTHON + ["print(2)"]], parallel=True, jobs=1, capture=True
+        )
+
+        spy.assert_called_once_with(1)
+        assert output == "1\n2\n"
+
+    def test_prefixed_verbose_output(self, capfd):
+        execute(
+            [PYTHON + ["print('one')"], PYTHON + ["print('two', end='')"], ["true"]],
+            parallel=True,
+            verbose=True,
+        )
+
+        out, _ = capfd.readouterr()
+        name = os.path.basename(sys.executable)
+        assert sorted(out.splitlines()) == [
+            "{0}#1 | one".format(name),
+            "{0}#2 | two".format(name),
+        ]
+
+    def test_fail_fast(self, tmpdir):
+        marker = tmpdir.join("finished")
+        slow = "import time; time.sleep(30); open({0!r}, 'w')".format(str(marker))
+
+        start = time.perf_counter()
+        with pytest.raises(BumprError, match="exit code 3"):
+            execute([PYTHON + [slow], PYTHON + ["import sys; sys.exit(3)"]], parallel=True)
+
+        assert time.perf_counter() - start < 5
+        assert not marker.exists()
+
+    def test_dryrun(self, terminal, piped):
+        execute("some command\nanother command", dryrun=True, parallel=True)
+
+        assert not terminal.called
+        assert not piped.called
+
+
+class RunCommandTest:
+    def test_bounded_memory(self, mocker):
+        debug = mocker.patch("bumpr.helpers.log.debug")
+        output = CommandOutput(tail=10)
+
+        run_command(PYTHON + ["for i in range(1000): print(i)"], output)
+
+        assert len(output.lines) == 10
+        assert output.text == "[990 lines skipped]\n" + "".join(
+            "{0}\n".format(i) for i in range(990, 1000)
+        )
+        assert debug.call_count == 1000
+
+    def test_error_reports_the_tail(self, mocker):
+        output = CommandOutput(tail=2)
+
+        with pytest.raises(CalledProcessError) as excinfo:
+            run_command(PYTHON + ["print(1); print(2); print(3); exit(1)"], output)
+
+        assert excinfo.value.output == "[1 lines skipped]\n2\n3\n"
+
+    def test_capture(self):
+        output = CommandOutput(capture=True, tail=2)
+
+        run_command(PYTHON + ["print(1); print(2); print(3)"], output)
+
+        assert output.text == "1\n2\n3\n"
+
+    def test_echo(self, capfd):
+        run_command(PYTHON + ["print('line')"], CommandOutput("cmd | ", echo=True))
+
+        assert capfd.readouterr()[0] == "cmd | line\n"
+
+    def test_spool(self, tmpdir):
+        spool = str(tmpdir.join("output.log"))
+        commands = [PYTHON + ["print('one')"], PYTHON + ["print('two')"]]
+
+        execute(commands, spool=spool)
+        execute(commands, spool=spool, verbose=True, parallel=True)
+
+        with open(spool) as f:
+            lines = f.read().splitlines()
+        name = os.path.basename(sys.executable)
+        assert lines[:2] == ["one", "two"]
+        assert sorted(lines[2:]) == ["{0}#1 | one".format(name), "{0}#2 | two".format(name)]
+
+
+class IterLinesTest:
+    def test_lines(self):
+        lines = iter_lines(PYTHON + ["print('one'); print('two')"])
+
+        assert list(lines) == ["one", "two"]
+
+    def test_string_command(self):
+        assert list(iter_lines("git --version"))[0].startswith("git version")
+
+    def test_error(self):
+        with pytest.raises(BumprError, match="exit code 2"):
+            list(iter_lines(PYTHON + ["import sys; print('out'); sys.exit(2)"]))
+
+    def test_error_output(self, capsys):
+        with pytest.raises(BumprError):
+            list(iter_lines(PYTHON + ["import sys; sys.stderr.write('failure'); sys.exit(1)"]))
+
+        assert "failure" in capsys.readouterr()[0]
+
+    def test_close_stops_the_command(self):
+        script = (
+            "import sys, time\nfor i in range(100): print(i); sys.stdout.flush(); time.sleep(1)"
+        )
+        lines = iter_lines(PYTHON + [script])
+
+        start = time.perf_counter()
+        assert next(lines) == "0"
+        lines.close()
+        assert time.perf_counter() - start < 5
+
+    def test_timeout(self):
+        with pytest.raises(BumprError, match="timed out after 0.2s"):
+            list(iter_lines(PYTHON + ["import time; time.sleep(30)"], timeout=0.2))
+
+
+FLAKY = (
+    "import os, sys; done = os.path.exists('flaky'); open('flaky', 'w'); sys.exit(0 if done else 1)"
+)
+
+SPAWN = """\
+import subprocess, sys, time
+subprocess.Popen([sys.executable, "-c", "import time; time.sleep(1); open({0!r}, 'w')"])
+time.sleep(30)
+"""
+
+needs_process_groups = pytest.mark.skipif(
+    not hasattr(os, "killpg"), reason="Requires POSIX process groups"
+)
+
+
+class TimeoutAndRetriesTest:
+    def test_timeout(self):
+        start = time.perf_counter()
+        with pytest.raises(TimeoutExpired):
+            run_command(PYTHON + ["import time; time.sleep(30)"], CommandOutput(), timeout=0.2)
+
+        assert time.perf_counter() - start < 5
+
+    @needs_process_groups
+    def test_timeout_stops_the_process_group(self, tmpdir):
+        marker = tmpdir.join("grandchild")
+
+        with pytest.raises(TimeoutExpired):
+            run_command(PYTHON + [SPAWN.format(str(marker))], CommandOutput(), timeout=0.2)
+
+        time.sleep(1.5)
+        assert not marker.exists()
+
+    def test_execute_timeout(self, mocker):
+        with pytest.raises(BumprError, match="timed out after 0.2s"):
+            execute(PYTHON + ["import time; time.sleep(30)"], timeout=0.2)
+
+    def test_execute_parallel_timeout(self):
+        commands = [PYTHON + ["import time; time.sleep(30)"], PYTHON + ["pass"]]
+
+        start = time.perf_counter()
+        with pytest.raises(BumprError, match="timed out"):
+            execute(commands, timeout=0.2, parallel=True)
+        assert time.perf_counter() - start < 5
+
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_retry_until_success(self, tmpdir, mocker, parallel):
+        warning = mocker.patch("bumpr.helpers.log.warning")
+
+        execute(
+            [PYTHON + [FLAKY], PYTHON + ["pass"]],
+            cwd=str(tmpdir),
+            retries=1,
+            backoff=0,
+            parallel=parallel,
+        )
+
+        assert warning.call_count == 1
+
+    def test_no_retry_by_default(self, tmpdir):
+        with pytest.raises(BumprError, match="exit code 1"):
+            execute(PYTHON + [FLAKY], cwd=str(tmpdir))
+
+    def test_exponential_backoff(self, mocker):
+        sleep = mocker.patch("bumpr.helpers.time.sleep")
+        mocker.patch("bumpr.helpers.log.warning")
+
+        with pytest.raises(BumprError):
+            execute(PYTHON + ["exit(1)"], retries=3, backoff=0.5)
+
+        assert [call.args[0] for call in sleep.call_args_list] == [0.5, 1, 2]
+
+    @needs_process_groups
+    def test_sigterm_stops_running_commands(self, tmpdir):
+        marker = tmpdir.join("grandchild")
+        handler = signal.getsignal(signal.SIGTERM)
+        timer = threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGTERM))
+
+        start = time.perf_counter()
+        timer.start()
+        with pytest.raises(SystemExit) as excinfo:
+            execute(PYTHON + [SPAWN.format(str(marker))])
+
+        assert excinfo.value.code == 128 + signal.SIGTERM
+        assert time.perf_counter() - start < 5
+        assert signal.getsignal(signal.SIGTERM) is handler
+        time.sleep(1.5)
+        assert not marker.exists()
+
+
+def test_command_prefixes():
+    assert command_prefixes([["tox"], ["/usr/bin/tox", "-e", "lint"], ["flake8"]]) == [
+        "tox#1  | ",
+        "tox#2  | ",
+        "flake8 | ",
+    ]
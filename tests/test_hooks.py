@@ -1,11 +1,15 @@
+import sys
+import time
 from datetime import datetime
 from textwrap import dedent
 
 import pytest
 
 from bumpr.config import Config, ObjectDict
+from bumpr.edits import EditList
 from bumpr.helpers import BumprError
 from bumpr.hooks import ChangelogHook, CommandsHook, ReadTheDocHook, ReplaceHook
+from bumpr.releaser import Releaser
 from bumpr.version import Version
 
 
@@ -138,20 +142,33 @@ class CommandsHookTest:
         )
         self.releaser.config.verbose = False
         self.releaser.config.dryrun = False
+        self.releaser.execute_options.side_effect = lambda verbose=None: dict(
+            verbose=verbose, dryrun=False, spool="bumpr.log", timeout=60
+        )
         self.hook = CommandsHook(self.releaser)
 
     def test_bump(self, mocker):
         execute = mocker.patch("bumpr.hooks.execute")
         self.hook.bump([])
         execute.assert_called_once_with(
-            "bump command", replacements=mocker.ANY, verbose=mocker.ANY, dryrun=False
+            "bump command",
+            replacements=mocker.ANY,
+            verbose=mocker.ANY,
+            dryrun=False,
+            spool="bumpr.log",
+            timeout=60,
         )
 
     def test_prepare(self, mocker):
         execute = mocker.patch("bumpr.hooks.execute")
         self.hook.prepare([])
         execute.assert_called_once_with(
-            "prepare command", replacements=mocker.ANY, verbose=mocker.ANY, dryrun=False
+            "prepare command",
+            replacements=mocker.ANY,
+            verbose=mocker.ANY,
+            dryrun=False,
+            spool="bumpr.log",
+            timeout=60,
         )
 
     def test_bump_dryrun(self, mocker):
@@ -159,7 +176,12 @@ class CommandsHookTest:
         self.hook.dryrun = True
         self.hook.bump([])
         execute.assert_called_once_with(
-            "bump command", replacements=mocker.ANY, verbose=mocker.ANY, dryrun=True
+            "bump command",
+            replacements=mocker.ANY,
+            verbose=mocker.ANY,
+            dryrun=True,
+            spool="bumpr.log",
+            timeout=60,
         )
 
     def test_prepare_dryrun(self, mocker):
@@ -167,10 +189,27 @@ class CommandsHookTest:
         self.hook.dryrun = True
         self.hook.prepare([])
         execute.assert_called_once_with(
-            "prepare command", replacements=mocker.ANY, verbose=mocker.ANY, dryrun=True
+            "prepare command",
+            replacements=mocker.ANY,
+            verbose=mocker.ANY,
+            dryrun=True,
+            spool="bumpr.log",
+            timeout=60,
         )
 
 
+def test_commands_hook_timeout(workspace):
+    command = '"{0}" -c "import time; time.sleep(30)"'.format(sys.executable)
+    config = Config({"file": "fake.py", "timeout": 0.2, "commands": {"bump": command}})
+    releaser = Releaser(config)
+    hook = CommandsHook(releaser)
+
+    start = time.perf_counter()
+    with pytest.raises(BumprError, match="timed out after 0.2s"):
+        hook.bump([])
+    assert time.perf_counter() - start < 5
+
+
 class ChangelogHookTest:
     @pytest.fixture(autouse=True)
     def setUp(self, mocker):
@@ -183,6 +222,12 @@ class ChangelogHookTest:
         self.releaser.config.encoding = "utf8"
         self.releaser.config.verbose = False
         self.releaser.config.dryrun = False
+        self.edits = {}
+        self.releaser.edit.side_effect = self.edit
+
+    def edit(self, filename):
+        with open(filename) as f:
+            return self.edits.setdefault(filename, EditList(filename, f.read()))
 
     def test_validate_no_file(self):
         with pytest.raises(BumprError):
@@ -231,7 +276,9 @@ class ChangelogHookTest:
         """
         ).format(self.releaser.timestamp)
 
-        self.releaser.perform.assert_called_once_with("changelog", content, expected)
+        self.releaser.edit.assert_called_once_with("changelog")
+        assert self.edits["changelog"].apply() == expected
+        assert all(edit.source == "changelog" for edit in self.edits["changelog"].edits)
 
     def test_prepare(self, workspace):
         content = dedent(
@@ -272,7 +319,9 @@ class ChangelogHookTest:
         """
         ).format(self.releaser.timestamp)
 
-        self.releaser.perform.assert_called_once_with("changelog", content, expected)
+        self.releaser.edit.assert_called_once_with("changelog")
+        assert self.edits["changelog"].apply() == expected
+        assert all(edit.source == "changelog" for edit in self.edits["changelog"].edits)
 
     def test_bump_no_separator(self, workspace):
         content = dedent(
@@ -305,7 +354,9 @@ class ChangelogHookTest:
         """
         ).format(self.releaser.timestamp)
 
-        self.releaser.perform.assert_called_once_with("changelog", content, expected)
+        self.releaser.edit.assert_called_once_with("changelog")
+        assert self.edits["changelog"].apply() == expected
+        assert all(edit.source == "changelog" for edit in self.edits["changelog"].edits)
 
     def test_prepare_no_separator(self, workspace):
         content = dedent(
@@ -343,7 +394,9 @@ class ChangelogHookTest:
         """
         ).format(self.releaser.timestamp)
 
-        self.releaser.perform.assert_called_once_with("changelog", content, expected)
+        self.releaser.edit.assert_called_once_with("changelog")
+        assert self.edits["changelog"].apply() == expected
+        assert all(edit.source == "changelog" for edit in self.edits["changelog"].edits)
 
 
 class ReplaceHookTest:
@@ -1,6 +1,6 @@
 import logging
 
-from bumpr.log import DIFF, DRYRUN, BumprLogger
+from bumpr.log import DIFF, DRYRUN, ANSIFormatter, BumprLogger, ansi
 
 
 def test_bumpr_logger(caplog):
@@ -24,3 +24,19 @@ def test_bumpr_logger(caplog):
         ("test_logging", logging.ERROR, "error"),
         ("test_logging", logging.CRITICAL, "critical"),
     ]
+
+
+def test_ansi_formatter_colors_each_diff_line():
+    record = logging.LogRecord(
+        "test", DIFF, __file__, 1, "@@ -1 +1 @@\n-old\n+new\n same", (), None
+    )
+    record.levelname = "DIFF"
+
+    lines = ANSIFormatter().format(record).split("\n")
+
+    assert lines == [
+        ansi("cyan", "@@ -1 +1 @@"),
+        ansi("red", "-old"),
+        ansi("green", "+new"),
+        " same",
+    ]
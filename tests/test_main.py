@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from bumpr import __about__ as about
+from bumpr import __version__
+from bumpr.__main__ import main
+
+
+def imported_modules(code):
+    """The modules imported by a fresh interpreter executing `code`"""
+    script = "import sys\n{0}\nprint(' '.join(sorted(sys.modules)))".format(code)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(about.__file__)))
+    output = subprocess.check_output(
+        [sys.executable, "-c", script], cwd=root, universal_newlines=True
+    )
+    return set(output.split())
+
+
+def test_version(capsys):
+    main(["--version"])
+
+    assert capsys.readouterr().out == "{0}\n".format(__version__)
+
+
+def test_version_fast_path():
+    modules = imported_modules("from bumpr.__main__ import main; main(['--version'])")
+
+    assert "bumpr.__about__" in modules
+    for module in "bumpr.config", "bumpr.releaser", "bumpr.log", "argparse", "logging":
+        assert module not in modules
+
+
+def test_help(capsys, mocker):
+    mocker.patch("bumpr.log.init")
+
+    with pytest.raises(SystemExit):
+        main(["--help"])
+
+    assert "usage:" in capsys.readouterr().out
+
+
+def test_config_does_not_load_release_machinery():
+    modules = imported_modules("import bumpr.config")
+
+    for module in "bumpr.releaser", "bumpr.vcs", "argparse", "concurrent.futures":
+        assert module not in modules
+
+
+def test_vcs_loaded_only_when_enabled():
+    modules = imported_modules(
+        "from bumpr.config import Config; from bumpr.releaser import Releaser; "
+        "Releaser(Config({{'file': {0!r}}}))".format(about.__file__)
+    )
+
+    assert "bumpr.releaser" in modules
+    for module in "bumpr.vcs", "concurrent.futures", "mmap", "difflib":
+        assert module not in modules
@@ -0,0 +1,354 @@
+import os
+
+import pytest
+
+from bumpr.config import Config
+from bumpr.helpers import BumprError
+from bumpr.monorepo import MonorepoReleaser, dependency_waves, read_project
+
+
+@pytest.fixture
+def monorepo(workspace):
+    for name, version in ("pkg-a", "1.2.3.dev"), ("pkg-b", "2.0.0.dev"):
+        workspace.mkdir(name)
+        workspace.write("{0}/__init__.py".format(name), "__version__ = '{0}'\n".format(version))
+        workspace.write("{0}/README".format(name), "Version: {0}\n".format(version))
+    workspace.write("CHANGES", "Current\n-------\n\n- Some change\n")
+    return workspace
+
+
+def read(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+def make_config(**kwargs):
+    config = Config(kwargs)
+    config.packages = {
+        "pkg-a": {"file": "pkg-a/__init__.py", "files": ["pkg-a/README"]},
+        "pkg-b": {
+            "file": "pkg-b/__init__.py",
+            "files": ["pkg-b/README"],
+            "changelog": {
+                "file": "CHANGES",
+                "separator": "-",
+                "bump": "{version}",
+                "prepare": "Current",
+                "empty": "Nothing yet",
+            },
+        },
+    }
+    return config
+
+
+def test_constructor(monorepo):
+    releaser = MonorepoReleaser(make_config())
+
+    assert [p.config.name for p in releaser.packages] == ["pkg-a", "pkg-b"]
+    assert [str(p.version) for p in releaser.packages] == ["1.2.3", "2.0.0"]
+    assert [p.tag_label for p in releaser.packages] == ["pkg-a-1.2.3", "pkg-b-2.0.0"]
+    assert [len(p.hooks) for p in releaser.packages] == [0, 1]
+    assert all(p.index is releaser.index for p in releaser.packages)
+
+
+def test_constructor_only(monorepo):
+    config = make_config()
+    config.only = ["pkg-b"]
+
+    releaser = MonorepoReleaser(config)
+
+    assert [p.config.name for p in releaser.packages] == ["pkg-b"]
+
+
+def test_validate_package_paths(monorepo, mocker):
+    validate = mocker.patch("bumpr.vcs.Fake.validate")
+
+    MonorepoReleaser(make_config(vcs="fake"))
+
+    validate.assert_called_once_with(dryrun=False, paths=["CHANGES", "pkg-a", "pkg-b"])
+
+
+def test_validate_paths_setting(monorepo, mocker):
+    validate = mocker.patch("bumpr.vcs.Fake.validate")
+    config = make_config(vcs="fake", only=["pkg-a"])
+    config.packages["pkg-b"]["validate_paths"] = ["."]
+
+    MonorepoReleaser(config)
+    validate.assert_called_with(dryrun=False, paths=["pkg-a"])
+
+    config.only = []
+    MonorepoReleaser(config)
+    validate.assert_called_with(dryrun=False, paths=None)
+
+    config.validate_paths = ["pkg-b/", "common"]
+    MonorepoReleaser(config)
+    validate.assert_called_with(dryrun=False, paths=["common", "pkg-b"])
+
+
+def test_bump(monorepo, mocker):
+    config = make_config(vcs="fake")
+    releaser = MonorepoReleaser(config)
+    commit = mocker.patch.object(releaser.vcs, "commit")
+    tag = mocker.patch.object(releaser.vcs, "tag")
+
+    releaser.bump()
+
+    commit.assert_called_once_with(
+        "Bump version pkg-a 1.2.3, pkg-b 2.0.0",
+        ["pkg-a/__init__.py", "pkg-a/README", "pkg-b/__init__.py", "pkg-b/README", "CHANGES"],
+    )
+    assert tag.call_args_list == [mocker.call("pkg-a-1.2.3"), mocker.call("pkg-b-2.0.0")]
+    assert read("pkg-a/__init__.py") == "__version__ = '1.2.3'\n"
+    assert read("pkg-a/README") == "Version: 1.2.3\n"
+    assert read("pkg-b/__init__.py") == "__version__ = '2.0.0'\n"
+    assert read("pkg-b/README") == "Version: 2.0.0\n"
+    assert read("CHANGES").startswith("2.0.0\n-----\n")
+
+
+def test_bump_failure_restores_all_packages(monorepo, mocker):
+    config = make_config(vcs="fake")
+    releaser = MonorepoReleaser(config)
+    mocker.patch.object(releaser.packages[1], "bump_files", side_effect=OSError("disk full"))
+
+    with pytest.raises(OSError):
+        releaser.bump()
+
+    assert read("pkg-a/__init__.py") == "__version__ = '1.2.3.dev'\n"
+    assert read("CHANGES").startswith("Current\n")
+    assert sorted(os.listdir("pkg-a")) == ["README", "__init__.py"]
+
+
+def test_prepare(monorepo, mocker):
+    config = make_config(vcs="fake", prepare={"part": 2, "suffix": "dev"})
+    releaser = MonorepoReleaser(config)
+    commit = mocker.patch.object(releaser.vcs, "commit")
+    mocker.patch.object(releaser.vcs, "tag")
+    releaser.bump()
+
+    releaser.prepare()
+
+    commit.assert_called_with(
+        "Update to version pkg-a 1.2.4.dev, pkg-b 2.0.1.dev for next development cycle",
+        ["pkg-a/__init__.py", "pkg-a/README", "pkg-b/__init__.py", "pkg-b/README", "CHANGES"],
+    )
+    assert read("CHANGES").startswith("Current\n-------\n\n- Nothing yet\n\n2.0.0\n")
+    assert read("pkg-a/__init__.py") == "__version__ = '1.2.4.dev'\n"
+    assert read("pkg-b/README") == "Version: 2.0.1.dev\n"
+
+
+def test_prepare_skipped(monorepo, mocker):
+    config = make_config(vcs="fake")
+    releaser = MonorepoReleaser(config)
+    commit = mocker.patch.object(releaser.vcs, "commit")
+
+    releaser.prepare()
+
+    assert not commit.called
+
+
+def test_release_dryrun(monorepo, mocker):
+    config = make_config(vcs="fake", dryrun=True, tests="tox", push=True)
+    releaser = MonorepoReleaser(config)
+    execute = mocker.patch("bumpr.monorepo.execute")
+    vcs = mocker.patch.object(releaser, "vcs")
+
+    releaser.release()
+
+    execute.assert_called_once_with(
+        "tox",
+        replacements=mocker.ANY,
+        dryrun=True,
+        verbose=True,
+        parallel=False,
+        jobs=None,
+        spool=None,
+        timeout=None,
+        retries=0,
+        backoff=1.0,
+    )
+    assert not vcs.commit.called
+    assert read("pkg-a/__init__.py") == "__version__ = '1.2.3.dev'\n"
+    assert all(p.timestamp is releaser.timestamp for p in releaser.packages)
+
+
+def write_project(workspace, path, content):
+    if not os.path.isdir(path):
+        workspace.mkdir(path)
+    workspace.write("{0}/pyproject.toml".format(path), content)
+
+
+def test_read_project_pep621(workspace):
+    write_project(
+        workspace,
+        "pkg",
+        """\
+        [project]
+        name = "My_Package"
+        dependencies = ["requests>=2", "other.pkg[extra] ; python_version < '3.8'"]
+
+        [project.optional-dependencies]
+        test = ["pytest"]
+        """,
+    )
+
+    assert read_project("pkg") == ("my-package", {"requests", "other-pkg"})
+
+
+def test_read_project_poetry(workspace):
+    write_project(
+        workspace,
+        "pkg",
+        """\
+        [tool.poetry]
+        name = "pkg"
+
+        [tool.poetry.dependencies]
+        python = "^3.7"
+        Core_Lib = {{path = "../core", develop = true}}
+
+        [tool.poetry.dev-dependencies]
+        flake8 = "*"
+
+        [tool.poetry.group.dev.dependencies]
+        pytest = "*"
+        """,
+    )
+
+    assert read_project("pkg") == ("pkg", {"python", "core-lib"})
+
+
+def test_read_project_missing(workspace):
+    assert read_project(".") == (None, set())
+
+
+def test_dependency_waves():
+    waves = dependency_waves(
+        {
+            "app": {"core", "utils", "external"},
+            "cli": {"app"},
+            "utils": {"core"},
+            "core": set(),
+            "docs": set(),
+        }
+    )
+    assert waves == [["core", "docs"], ["utils"], ["app"], ["cli"]]
+
+
+def test_dependency_waves_cycle():
+    with pytest.raises(BumprError):
+        dependency_waves({"a": {"b"}, "b": {"c"}, "c": {"a"}, "d": set()})
+
+
+def test_packages_ordered_by_dependencies(monorepo):
+    write_project(monorepo, "pkg-a", '[project]\nname = "pkg-a"\ndependencies = ["pkg-b"]\n')
+    write_project(monorepo, "pkg-b", '[tool.poetry]\nname = "pkg-b"\n')
+
+    releaser = MonorepoReleaser(make_config())
+
+    assert [[p.config.name for p in wave] for wave in releaser.waves] == [["pkg-b"], ["pkg-a"]]
+    assert [p.config.name for p in releaser.packages] == ["pkg-b", "pkg-a"]
+    assert [p.config.path for p in releaser.packages] == ["pkg-b", "pkg-a"]
+
+
+def test_dev_dependencies_cycle_ignored(monorepo):
+    write_project(
+        monorepo,
+        "pkg-a",
+        """\
+        [tool.poetry]
+        name = "pkg-a"
+
+        [tool.poetry.dev-dependencies]
+        pkg-b = "*"
+
+        [tool.poetry.group.test.dependencies]
+        pkg-b = "*"
+        """,
+    )
+    write_project(
+        monorepo,
+        "pkg-b",
+        """\
+        [project]
+        name = "pkg-b"
+        dependencies = ["pkg-a"]
+
+        [project.optional-dependencies]
+        test = ["pkg-a"]
+        """,
+    )
+
+    releaser = MonorepoReleaser(make_config())
+
+    assert [[p.config.name for p in wave] for wave in releaser.waves] == [["pkg-a"], ["pkg-b"]]
+
+
+def test_run_waves_sequential(monorepo, mocker):
+    config = make_config()
+    config.packages["pkg-a"]["tests"] = "tox -e {version}"
+    releaser = MonorepoReleaser(config)
+    execute = mocker.patch("bumpr.monorepo.execute")
+
+    releaser.test()
+
+    execute.assert_called_once_with(
+        "tox -e {version}",
+        verbose=True,
+        replacements=releaser.packages[0].command_replacements(),
+        dryrun=False,
+        cwd="pkg-a",
+        parallel=False,
+        jobs=None,
+        spool=None,
+        timeout=None,
+        retries=0,
+        backoff=1.0,
+    )
+
+
+def test_clean_packages_in_their_directory(monorepo, mocker):
+    config = make_config()
+    config.packages["pkg-b"]["clean"] = "make clean"
+    releaser = MonorepoReleaser(config)
+    execute = mocker.patch("bumpr.monorepo.execute")
+
+    releaser.clean()
+
+    execute.assert_called_once_with(
+        "make clean",
+        verbose=False,
+        replacements=releaser.packages[1].command_replacements(),
+        dryrun=False,
+        cwd="pkg-b",
+        parallel=False,
+        jobs=None,
+        spool=None,
+        timeout=None,
+        retries=0,
+        backoff=1.0,
+    )
+
+
+COMMAND = "python -c \"open('published', 'w').write('{version}')\""
+
+
+def test_run_waves_parallel(monorepo):
+    config = make_config(jobs=2)
+    for name in config.packages:
+        config.packages[name]["publish"] = COMMAND
+    releaser = MonorepoReleaser(config)
+
+    releaser.publish()
+
+    assert read("pkg-a/published") == "1.2.3"
+    assert read("pkg-b/published") == "2.0.0"
+
+
+def test_run_waves_parallel_failure(monorepo):
+    config = make_config(jobs=2)
+    config.packages["pkg-a"]["publish"] = 'python -c "raise SystemExit(1)"'
+    config.packages["pkg-b"]["publish"] = COMMAND
+    releaser = MonorepoReleaser(config)
+
+    with pytest.raises(BumprError):
+        releaser.publish()
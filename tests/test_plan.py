@@ -0,0 +1,204 @@
+import subprocess
+
+import pytest
+
+from bumpr.__main__ import main
+from bumpr.config import Config, ValidationError
+from bumpr.helpers import BumprError
+from bumpr.plan import Plan, PlanEntry, parse_plan
+from bumpr.version import Version
+
+PLAN = """\
+# Maintenance releases
+package=core part=patch branch=release/1.x
+package=cli part=minor suffix=rc  # release candidate
+
+package=core
+"""
+
+
+def run(*args):
+    return subprocess.check_output(args, stderr=subprocess.STDOUT, universal_newlines=True)
+
+
+@pytest.fixture
+def git_env(monkeypatch):
+    for key in "AUTHOR", "COMMITTER":
+        monkeypatch.setenv("GIT_{0}_NAME".format(key), "bumpr")
+        monkeypatch.setenv("GIT_{0}_EMAIL".format(key), "bumpr@example.com")
+    monkeypatch.setenv("GIT_CONFIG_NOSYSTEM", "1")
+
+
+def test_parse_plan():
+    assert parse_plan(PLAN.splitlines()) == [
+        PlanEntry(2, package="core", part="patch", branch="release/1.x"),
+        PlanEntry(3, package="cli", part="minor", suffix="rc"),
+        PlanEntry(5, package="core"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "line,error",
+    [
+        ("package core", "plan:1: expected some of package, part, suffix, branch"),
+        ("version=1.0.0", "plan:1: expected some of package, part, suffix, branch"),
+        ("part=micro", "plan:1: unknown part micro"),
+        ("branch='main", "plan:1: No closing quotation"),
+    ],
+)
+def test_parse_plan_errors(line, error):
+    with pytest.raises(ValidationError, match=error):
+        parse_plan([line])
+
+
+def test_validate():
+    with pytest.raises(ValidationError, match="no entry"):
+        Plan(Config(), []).validate()
+    with pytest.raises(ValidationError, match="Unknown package core at line 2"):
+        Plan(Config(), [PlanEntry(2, package="core")]).validate()
+    with pytest.raises(ValidationError, match="requires a vcs"):
+        Plan(Config(), [PlanEntry(1, branch="main")]).validate()
+
+
+def test_entry_config():
+    config = Config({"file": "fake.py", "packages": {"core": {"file": "core.py"}}})
+    config.bump.suffix = "dev"
+    plan = Plan(config, [])
+
+    entry_config = plan.entry_config(PlanEntry(1, package="core", part="minor", suffix=""))
+
+    assert entry_config.only == ["core"]
+    assert entry_config.bump.part is Version.MINOR
+    assert entry_config.bump.suffix is None
+    assert config.only == [] and config.bump.part is None and config.bump.suffix == "dev"
+
+
+def test_run_shares_resources(workspace, mocker):
+    config = Config({"file": "fake.py", "vcs": "fake", "bump_only": True, "commit": False})
+    plan = Plan(config, [PlanEntry(1, part="patch"), PlanEntry(2, part="minor")])
+    releaser = mocker.patch("bumpr.releaser.Releaser")
+    releaser.return_value.version = "1.2.4"
+    releaser.return_value.tag_label = "1.2.4"
+
+    plan.run()
+
+    first, second = releaser.call_args_list
+    assert first.args[0].bump.part is Version.PATCH
+    assert second.args[0].bump.part is Version.MINOR
+    for key in "index", "cache", "vcs":
+        assert first.kwargs[key] is second.kwargs[key]
+    assert releaser.return_value.release.call_count == 2
+
+
+def test_run(workspace, mocker, caplog):
+    config = Config({"file": "fake.py", "vcs": "fake", "bump_only": True, "commit": False})
+    plan = Plan(
+        config,
+        [
+            PlanEntry(1, part="patch", branch="release/1.x"),
+            PlanEntry(2, part="patch", branch="release/1.x"),
+            PlanEntry(3, part="minor", branch="main"),
+        ],
+    )
+    mocker.patch("bumpr.vcs.Fake.current_branch", return_value="develop")
+    checkout = mocker.patch("bumpr.vcs.Fake.checkout", create=True)
+
+    plan.run()
+
+    assert [call.args[0] for call in checkout.call_args_list] == [
+        "release/1.x",
+        "main",
+        "develop",
+    ]
+    assert plan.summary() == [
+        "Line  Package  Branch       Version  Tag    Status",
+        "----  -------  -----------  -------  -----  --------",
+        "1     -        release/1.x  1.2.4    1.2.4  released",
+        "2     -        release/1.x  1.2.5    1.2.5  released",
+        "3     -        main         1.3.0    1.3.0  released",
+    ]
+    assert plan.summary()[-1] in caplog.messages
+
+
+def test_run_stops_on_failure(workspace, mocker):
+    config = Config({"file": "fake.py", "bump_only": True})
+    plan = Plan(config, [PlanEntry(1, part="patch"), PlanEntry(2, part="minor")])
+    mocker.patch("bumpr.releaser.Releaser.bump", side_effect=BumprError("failure"))
+
+    with pytest.raises(BumprError):
+        plan.run()
+
+    assert [result[1:] for result in plan.results] == [
+        ("", "", "failed: failure"),
+        ("", "", "skipped"),
+    ]
+
+
+def test_run_checkout_failure(workspace, mocker):
+    config = Config({"file": "fake.py", "vcs": "fake", "bump_only": True, "commit": False})
+    plan = Plan(
+        config,
+        [PlanEntry(1, part="patch"), PlanEntry(2, part="minor", branch="missing")],
+    )
+    mocker.patch("bumpr.vcs.Fake.current_branch", return_value="develop")
+    mocker.patch("bumpr.vcs.Fake.checkout", create=True, side_effect=BumprError("no branch"))
+
+    with pytest.raises(BumprError):
+        plan.run()
+
+    assert [result[1:] for result in plan.results] == [
+        ("1.2.4", "1.2.4", "released"),
+        ("", "", "failed: no branch"),
+    ]
+
+
+def test_run_monorepo(workspace, mocker):
+    workspace.mkdir("cli")
+    workspace.write("cli/__init__.py", "__version__ = '2.0.0.dev'\n")
+    config = Config({"bump_only": True})
+    config.packages = {"core": {"file": "fake.py"}, "cli": {"file": "cli/__init__.py"}}
+    plan = Plan(config, [PlanEntry(1, package="cli", part="minor", suffix="rc")])
+
+    plan.run()
+
+    assert plan.results == [(plan.entries[0], "cli 2.1.0.rc", "cli-2.1.0.rc", "released")]
+    with open("fake.py") as f:
+        assert "1.2.3.dev" in f.read()
+
+
+def test_main_plan(workspace, git_env, mocker):
+    mocker.patch("bumpr.log.init")
+    workspace.write(
+        "bumpr.rc", "[bumpr]\nfile = fake.py\nvcs = git\n[prepare]\npart = patch\nsuffix = dev\n"
+    )
+    workspace.write("plan.txt", "branch=release/1.x part=patch\nbranch=main part=minor\n")
+    run("git", "init", "-q", "-b", "main")
+    run("git", "add", "fake.py", "README", "bumpr.rc")
+    run("git", "commit", "-q", "-m", "initial")
+    run("git", "branch", "release/1.x")
+    run("git", "checkout", "-q", "-b", "develop")
+
+    main(["plan", "plan.txt"])
+
+    assert run("git", "tag").split() == ["1.2.4", "1.3.0"]
+    assert run("git", "rev-parse", "--abbrev-ref", "HEAD") == "develop\n"
+    assert run("git", "show", "release/1.x:fake.py").endswith("'1.2.5.dev'\n")
+    assert run("git", "show", "main:fake.py").endswith("'1.3.1.dev'\n")
+
+
+def test_main_plan_usage(capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        main(["plan"])
+
+    assert excinfo.value.code == 2
+    assert "usage: bumpr plan PLANFILE" in capsys.readouterr().err
+
+
+def test_main_invalid_plan(workspace, mocker):
+    mocker.patch("bumpr.log.init")
+    workspace.write("plan.txt", "part=micro\n")
+
+    with pytest.raises(SystemExit) as excinfo:
+        main(["plan", "plan.txt", "fake.py"])
+
+    assert excinfo.value.code == 1
@@ -1,8 +1,14 @@
+import builtins
+import json
+import os
+
 import pytest
 
+from bumpr import releaser as releaser_module
 from bumpr.config import Config
+from bumpr.edits import EditConflict
 from bumpr.helpers import BumprError
-from bumpr.releaser import Releaser
+from bumpr.releaser import Releaser, compile_regex, covering_paths, search_version
 from bumpr.version import Version
 
 
@@ -32,6 +38,38 @@ def test_constructor(workspace):
     assert releaser.hooks == []
 
 
+@pytest.mark.parametrize(
+    "paths,expected",
+    [
+        ([], []),
+        (["b", "a/", "./a/file", "a-b/c", "a/b/c"], ["a", "a-b/c", "b"]),
+        (["pkg", "."], None),
+    ],
+)
+def test_covering_paths(paths, expected):
+    assert covering_paths(paths) == expected
+
+
+def test_validate_whole_tree(workspace, mocker):
+    validate = mocker.patch("bumpr.vcs.Fake.validate")
+
+    Releaser(Config({"file": "fake.py", "vcs": "fake"}))
+
+    validate.assert_called_once_with(dryrun=False, paths=None)
+
+
+def test_validate_paths(workspace, mocker):
+    validate = mocker.patch("bumpr.vcs.Fake.validate")
+    config = Config({"file": "fake.py", "files": ["README"], "vcs": "fake", "path": "pkg"})
+
+    Releaser(config)
+    validate.assert_called_with(dryrun=False, paths=["README", "fake.py", "pkg"])
+
+    config.validate_paths = ["docs", "pkg"]
+    Releaser(config)
+    validate.assert_called_with(dryrun=False, paths=["docs", "pkg"])
+
+
 def test_constructor_version_not_found(workspace):
     config = Config({"file": "fake.py"})
     workspace.write("fake.py", "")
@@ -50,6 +88,69 @@ def test_constructor_version_bad_format(workspace):
         Releaser(config)
 
 
+def test_constructor_version_scan_limits(workspace):
+    workspace.write("fake.py", "# comment\n" * 10 + "__version__ = '1.2.3.dev'\n")
+
+    assert (
+        str(Releaser(Config({"file": "fake.py", "regex_max_line": 11})).prev_version) == "1.2.3.dev"
+    )
+    with pytest.raises(BumprError):
+        Releaser(Config({"file": "fake.py", "regex_max_line": 10}))
+    with pytest.raises(BumprError):
+        Releaser(Config({"file": "fake.py", "regex_scan_bytes": 100}))
+
+
+class SearchVersionTest:
+    pattern = compile_regex(Config({}).regex)
+
+    def test_first_match_wins(self):
+        data = b"__version__ = '1.0'\nVERSION = '2.0'\n"
+
+        assert search_version(self.pattern, data, "utf8") == "1.0"
+
+    def test_anchored_default_regex(self):
+        data = b"x = '__version__ = \"0.1\"'\n    VERSION = '1.0'\n"
+
+        assert search_version(self.pattern, data, "utf8") == "1.0"
+
+    def test_stop_at_first_match(self, monkeypatch):
+        monkeypatch.setattr(releaser_module, "SCAN_CHUNK_SIZE", 32)
+        data = b"__version__ = '1.0'\n" + b"#" * 64 + b"\xff" * 64
+
+        # The invalid bytes after the match are never decoded
+        assert search_version(self.pattern, data, "utf8") == "1.0"
+
+    def test_lines_across_chunks(self, monkeypatch):
+        monkeypatch.setattr(releaser_module, "SCAN_CHUNK_SIZE", 7)
+        data = "# é\r\n# comment\r\nVERSION = '1.0' # é\r\n".encode("utf8")
+
+        assert search_version(compile_regex(r"(?m)'(?P<version>.+)'$"), data, "utf8") is None
+        assert search_version(compile_regex(r"(?m)# (?P<version>é)$"), data, "utf8") == "é"
+        assert search_version(self.pattern, data, "utf8") == "1.0"
+
+    def test_scan_limit_cuts_a_character(self):
+        data = "__version__ = '1.0'\n# {0}\n".format("é" * 20).encode("utf8")
+
+        assert search_version(self.pattern, data, "utf8", max_bytes=41) == "1.0"
+        pattern = compile_regex(r"# (?P<version>é+)")
+        assert search_version(pattern, data, "utf8", max_bytes=41) == "é" * 9
+
+    def test_multiline_pattern_fallback(self):
+        data = b"# header\n__version__ = (\n    '1.0'\n)\n"
+        pattern = compile_regex(r"__version__ = \(\s*'(?P<version>.+)'")
+
+        assert search_version(pattern, data, "utf8") == "1.0"
+
+    def test_not_found(self):
+        assert search_version(self.pattern, b"", "utf8") is None
+        assert search_version(self.pattern, b"nothing\n", "utf8") is None
+
+    def test_utf16(self):
+        data = "# comment\n__version__ = '1.0'\n".encode("utf16")
+
+        assert search_version(self.pattern, data, "utf16") == "1.0"
+
+
 def test_constructor_with_hooks(workspace, mocker):
     config = Config({"file": "fake.py"})
     hooks = []
@@ -80,7 +181,39 @@ def test_test(workspace, mocker):
     releaser.test()
 
     execute.assert_called_with(
-        "test command", replacements=mocker.ANY, dryrun=mocker.ANY, verbose=mocker.ANY
+        "test command",
+        replacements=mocker.ANY,
+        dryrun=mocker.ANY,
+        verbose=mocker.ANY,
+        parallel=False,
+        jobs=None,
+        spool=None,
+        timeout=None,
+        retries=0,
+        backoff=1.0,
+    )
+
+
+def test_test_parallel(workspace, mocker):
+    config = Config(
+        {"file": "fake.py", "tests": "lint\ntypecheck", "parallel": ["tests"], "parallel_jobs": 2}
+    )
+    releaser = Releaser(config)
+    execute = mocker.patch("bumpr.releaser.execute")
+
+    releaser.test()
+
+    execute.assert_called_with(
+        "lint\ntypecheck",
+        replacements=mocker.ANY,
+        dryrun=mocker.ANY,
+        verbose=True,
+        parallel=True,
+        jobs=2,
+        spool=None,
+        timeout=None,
+        retries=0,
+        backoff=1.0,
     )
 
 
@@ -118,9 +251,27 @@ def test_publish(workspace, mocker):
         replacements=mocker.ANY,
         dryrun=mocker.ANY,
         verbose=mocker.ANY,
+        parallel=False,
+        jobs=None,
+        spool=None,
+        timeout=None,
+        retries=0,
+        backoff=1.0,
     )
 
 
+def test_publish_retries(workspace, mocker):
+    config = Config({"file": "fake.py", "publish": "publish", "tests": "tests", "retries": 2})
+    releaser = Releaser(config)
+    execute = mocker.patch("bumpr.releaser.execute")
+
+    releaser.publish()
+    assert execute.call_args.kwargs["retries"] == 2
+
+    releaser.test()
+    assert execute.call_args.kwargs["retries"] == 0
+
+
 def test_clean(workspace, mocker):
     config = Config(
         {
@@ -134,7 +285,16 @@ def test_clean(workspace, mocker):
     releaser.clean()
 
     execute.assert_called_with(
-        "clean command", replacements=mocker.ANY, dryrun=mocker.ANY, verbose=mocker.ANY
+        "clean command",
+        replacements=mocker.ANY,
+        dryrun=mocker.ANY,
+        verbose=mocker.ANY,
+        parallel=False,
+        jobs=None,
+        spool=None,
+        timeout=None,
+        retries=0,
+        backoff=1.0,
     )
 
 
@@ -144,8 +304,26 @@ def test_commit(workspace, mocker):
     vcs = mocker.patch.object(releaser, "vcs")
 
     releaser.commit("message")
+    vcs.commit.assert_called_with("message", None)
+
+    releaser.commit("message", ["fake.py"])
+    vcs.commit.assert_called_with("message", ["fake.py"])
+
+
+@pytest.mark.parametrize("commands,files", [(None, ["fake.py", "README"]), ("make docs", None)])
+def test_bump_commits_rewritten_files(workspace, mocker, commands, files):
+    workspace.write("other.txt", "Nothing to replace")
+    config = Config(
+        {"file": "fake.py", "files": ["README", "other.txt"], "vcs": "fake", "tag": False}
+    )
+    config.commands = {"bump": commands, "prepare": None}
+    releaser = Releaser(config)
+    commit = mocker.patch.object(releaser.vcs, "commit")
+    mocker.patch("bumpr.hooks.execute")
 
-    vcs.commit.assert_called_with("message")
+    releaser.bump()
+
+    commit.assert_called_once_with("Bump version 1.2.3", files)
 
 
 def test_commit_no_commit(workspace, mocker):
@@ -489,3 +667,417 @@ def test_prepare_vcs(workspace, mocker):
             content = f.read()
             assert "1.2.4.dev" in content
             assert "1.2.3" not in content
+
+
+def test_bump_parallel(workspace):
+    workspace.mkdir("docs")
+    files = [
+        str(workspace.write("docs/page{0}.md".format(i), "Version {version}\n")) for i in range(5)
+    ]
+    config = Config({"file": "fake.py", "files": files, "jobs": 4})
+    releaser = Releaser(config)
+
+    releaser.bump()
+
+    for filename in [workspace.module] + files:
+        with open(str(filename)) as f:
+            content = f.read()
+            assert "1.2.3" in content
+            assert "1.2.3.dev" not in content
+
+
+def test_bump_parallel_dryrun_diffs_order(workspace):
+    workspace.mkdir("docs")
+    files = [
+        str(workspace.write("docs/page{0}.md".format(i), "Version {version}\n")) for i in range(5)
+    ]
+    config = Config({"file": "fake.py", "files": files, "jobs": 4, "dryrun": True})
+    releaser = Releaser(config)
+    replacements = [(str(releaser.prev_version), str(releaser.version))]
+
+    releaser.bump_files(replacements)
+
+    assert list(releaser.diffs) == ["fake.py"] + files
+
+
+def test_bump_files_deduplicated(workspace, mocker):
+    config = Config({"file": "fake.py", "files": ["fake.py", str(workspace.readme)]})
+    releaser = Releaser(config)
+    bump_file = mocker.patch.object(
+        releaser, "bump_file", side_effect=lambda f, r: (f, "skipped", None, None)
+    )
+
+    releaser.bump_files([])
+
+    assert [c.args[0] for c in bump_file.call_args_list] == ["fake.py", str(workspace.readme)]
+
+
+def test_bump_files_glob(workspace):
+    workspace.mkdir("docs")
+    workspace.write("docs/index.md", "Version {version}\n")
+    workspace.write("docs/draft.md", "Version {version}\n")
+    config = Config({"file": "fake.py", "files": ["docs/*.md"], "exclude": ["docs/draft.md"]})
+    releaser = Releaser(config)
+
+    releaser.bump()
+
+    assert releaser.files == ["docs/index.md"]
+    with open("docs/index.md") as f:
+        assert "Version 1.2.3\n" == f.read()
+    with open("docs/draft.md") as f:
+        assert "Version 1.2.3.dev\n" == f.read()
+
+
+def test_bump_files_prefilter(workspace, mocker):
+    workspace.write("other.txt", "Nothing to see here\n")
+    config = Config({"file": "fake.py", "files": [str(workspace.readme), "other.txt"]})
+    releaser = Releaser(config)
+    decode = mocker.spy(releaser_module, "decode")
+
+    releaser.bump_files([(str(releaser.prev_version), str(releaser.version))])
+
+    assert decode.call_count == 2
+    assert releaser.stats["rewritten"] == 2
+    assert releaser.stats["skipped"] == 1
+
+
+def test_bump_files_keeps_newlines_translation(workspace):
+    workspace.write("crlf.txt", "Version {version}\r\nother line\r\n")
+    config = Config({"file": "fake.py", "files": ["crlf.txt"]})
+    releaser = Releaser(config)
+
+    releaser.bump_files([(str(releaser.prev_version), str(releaser.version))])
+
+    with open("crlf.txt", "rb") as f:
+        assert f.read() == "Version 1.2.3{0}other line{0}".format(os.linesep).encode()
+
+
+def test_bump_files_streaming(workspace, mocker):
+    workspace.write("big.txt", "header {version}\r\n" + "x" * 2048 + "\nfooter {version}\n")
+    workspace.write("big-untouched.txt", "y" * 2048)
+    os.chmod("big.txt", 0o640)
+    config = Config(
+        {"file": "fake.py", "files": ["big.txt", "big-untouched.txt"], "stream_threshold": 1024}
+    )
+    releaser = Releaser(config)
+    decode = mocker.spy(releaser_module, "decode")
+
+    releaser.bump_files([(str(releaser.prev_version), str(releaser.version))])
+
+    assert decode.call_count == 1  # Only the small version file
+    with open("big.txt", "rb") as f:
+        assert f.read() == b"header 1.2.3\r\n" + b"x" * 2048 + b"\nfooter 1.2.3\n"
+    assert os.stat("big.txt").st_mode & 0o777 == 0o640
+    assert releaser.stats["rewritten"] == 2
+    assert releaser.stats["skipped"] == 1
+    assert sorted(os.listdir(".")) == sorted(["fake.py", "README", "big.txt", "big-untouched.txt"])
+
+
+def test_bump_files_streaming_symlink(workspace):
+    workspace.write("big.txt", "header {version}\n" + "x" * 2048)
+    os.symlink("big.txt", "link.txt")
+    config = Config({"file": "fake.py", "files": ["link.txt"], "stream_threshold": 1024})
+    releaser = Releaser(config)
+
+    releaser.bump_files([(str(releaser.prev_version), str(releaser.version))])
+
+    assert os.path.islink("link.txt")
+    with open("big.txt", "rb") as f:
+        assert f.read() == b"header 1.2.3\n" + b"x" * 2048
+
+
+def test_bump_files_streaming_disabled_on_dryrun(workspace):
+    workspace.write("big.txt", "header {version}\n" + "x" * 2048)
+    config = Config(
+        {"file": "fake.py", "files": ["big.txt"], "stream_threshold": 1024, "dryrun": True}
+    )
+    releaser = Releaser(config)
+
+    releaser.bump_files([(str(releaser.prev_version), str(releaser.version))])
+
+    assert "big.txt" in releaser.diffs
+    with open("big.txt") as f:
+        assert "1.2.3.dev" in f.read()
+
+
+def test_bump_hook_failure_restores_files(workspace, mocker):
+    config = Config({"file": "fake.py", "files": [str(workspace.readme)]})
+    releaser = Releaser(config)
+    hook = mocker.MagicMock()
+    hook.bump.side_effect = BumprError("hook failure")
+    mocker.patch.object(releaser, "hooks", [mocker.MagicMock(), hook])
+
+    with pytest.raises(BumprError):
+        releaser.bump()
+
+    for file in workspace.module, workspace.readme:
+        with file.open() as f:
+            assert "1.2.3.dev" in f.read()
+    assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+
+def test_bump_vcs_failure_restores_files(workspace, mocker):
+    config = Config({"file": "fake.py", "files": [str(workspace.readme)], "vcs": "fake"})
+    releaser = Releaser(config)
+    commit = mocker.patch.object(releaser.vcs, "commit", side_effect=BumprError("commit failure"))
+    tag = mocker.patch.object(releaser.vcs, "tag")
+
+    with pytest.raises(BumprError):
+        releaser.bump()
+
+    assert commit.called
+    assert not tag.called
+    for file in workspace.module, workspace.readme:
+        with file.open() as f:
+            assert "1.2.3.dev" in f.read()
+    assert sorted(os.listdir(".")) == ["README", "fake.py"]
+
+
+def test_bump_applies_staged_files_before_vcs_commit(workspace, mocker):
+    config = Config({"file": "fake.py", "files": [str(workspace.readme)], "vcs": "fake"})
+    releaser = Releaser(config)
+
+    def commit(message, files):
+        for file in workspace.module, workspace.readme:
+            with file.open() as f:
+                assert "1.2.3.dev" not in f.read()
+
+    vcs_commit = mocker.patch.object(releaser.vcs, "commit", side_effect=commit)
+    mocker.patch.object(releaser.vcs, "tag")
+
+    def hook_bump(replacements):
+        assert releaser.transaction is not None
+
+    hook = mocker.MagicMock()
+    hook.bump.side_effect = hook_bump
+    mocker.patch.object(releaser, "hooks", [hook])
+
+    releaser.bump()
+
+    assert vcs_commit.called
+    assert releaser.transaction is None
+
+
+def test_release_timings(workspace, mocker):
+    config = Config(
+        {
+            "file": "fake.py",
+            "files": [str(workspace.readme)],
+            "timings": True,
+            "timings_output": "timings.json",
+            "changelog": {"file": "CHANGES"},
+        }
+    )
+    workspace.write("CHANGES", "Current\n-------\n\n- Some change\n")
+    releaser = Releaser(config)
+    info = mocker.patch.object(releaser_module.logger, "info")
+
+    releaser.release()
+
+    spans = [(span.name, span.depth) for span in releaser.timings.spans]
+    assert spans == [
+        ("clean", 0),
+        ("test", 0),
+        ("bump", 0),
+        ("changelog.bump", 1),
+        ("files", 1),
+        ("publish", 0),
+        ("prepare", 0),
+        ("push", 0),
+    ]
+    assert mocker.call("Timings:") in info.call_args_list
+    with open("timings.json") as f:
+        exported = json.load(f)
+    assert [span["name"] for span in exported["spans"]] == [name for name, _ in spans]
+
+
+def test_release_failure_reports_timings(workspace, mocker):
+    config = Config({"file": "fake.py", "timings": True})
+    releaser = Releaser(config)
+    mocker.patch.object(releaser, "test", side_effect=BumprError("tests failed"))
+    report = mocker.spy(releaser.timings, "report")
+
+    with pytest.raises(BumprError):
+        releaser.release()
+
+    assert [span.name for span in releaser.timings.spans] == ["clean", "test"]
+    assert report.called
+
+
+def test_dryrun_diff_only_around_changes(workspace, mocker):
+    lines = ["line {0}".format(i) for i in range(1000)]
+    lines[500] = "version {version}"
+    workspace.write("big.txt", "\n".join(lines) + "\n")
+    config = Config({"file": "fake.py", "files": ["big.txt"], "dryrun": True})
+    releaser = Releaser(config)
+    mocker.patch.object(releaser_module, "DIFF_CHUNK_SIZE", 4)
+    diff = mocker.patch.object(releaser_module.logger, "diff")
+
+    releaser.bump_files([(str(releaser.prev_version), str(releaser.version))])
+    releaser.display_diff()
+
+    assert diff.call_args_list[-4:] == [
+        mocker.call("big.txt"),
+        mocker.call("--- \n+++ \n@@ -498,7 +498,7 @@\n line 497"),
+        mocker.call(" line 498\n line 499\n-version 1.2.3.dev\n+version 1.2.3"),
+        mocker.call(" line 501\n line 502\n line 503\n"),
+    ]
+
+
+CHANGELOG = """\
+Current
+-------
+
+- Some change (see 1.2.3.dev docs)
+"""
+
+
+def test_bump_hook_edits_and_replacements_in_a_single_pass(workspace, mocker):
+    workspace.write("CHANGES", CHANGELOG)
+    config = Config(
+        {
+            "file": "fake.py",
+            "files": ["CHANGES"],
+            "changelog": {"file": "CHANGES", "bump": "{version}"},
+        }
+    )
+    releaser = Releaser(config)
+    load = mocker.spy(releaser, "load")
+
+    releaser.bump()
+
+    with open("CHANGES") as f:
+        assert f.read() == "1.2.3\n-----\n\n- Some change (see 1.2.3 docs)\n"
+    load.assert_called_once_with("CHANGES")
+    assert not releaser.edits
+    changes = dict(releaser.changes)
+    assert [edit.source for edit in changes["CHANGES"]] == ["changelog", "replacements"]
+    assert [edit.source for edit in changes["fake.py"]] == ["replacements"]
+
+
+def test_bump_hook_edits_and_replacements_of_a_file_spelled_differently(workspace):
+    workspace.write("CHANGES", CHANGELOG)
+    config = Config(
+        {
+            "file": "./fake.py",
+            "files": ["./CHANGES", "fake.py"],
+            "changelog": {"file": "CHANGES", "bump": "{version}"},
+        }
+    )
+    releaser = Releaser(config)
+
+    releaser.bump()
+
+    with open("CHANGES") as f:
+        assert f.read() == "1.2.3\n-----\n\n- Some change (see 1.2.3 docs)\n"
+    assert sorted(dict(releaser.changes)) == ["CHANGES", "fake.py"]
+    assert releaser.stats["rewritten"] == 2
+
+
+def test_bump_conflicting_edits(workspace):
+    config = Config(
+        {
+            "file": "fake.py",
+            "files": ["CHANGES"],
+            "changelog": {"file": "CHANGES", "bump": "{version}", "prepare": "Version 1.2.3.dev"},
+        }
+    )
+    workspace.write(
+        "CHANGES", CHANGELOG.replace("Current\n-------", "Version 1.2.3.dev\n-----------------")
+    )
+    releaser = Releaser(config)
+
+    with pytest.raises(EditConflict):
+        releaser.bump()
+
+    with open("fake.py") as f:
+        assert "1.2.3.dev" in f.read()
+    assert not releaser.edits
+
+
+COPY_CHANGES = "python -c \"import shutil; shutil.copy('CHANGES', 'seen')\""
+
+
+def test_bump_commands_hook_sees_changelog(workspace):
+    workspace.write("CHANGES", CHANGELOG)
+    config = Config(
+        {
+            "file": "fake.py",
+            "changelog": {"file": "CHANGES", "bump": "{version}"},
+            "commands": {"bump": COPY_CHANGES},
+        }
+    )
+    releaser = Releaser(config)
+
+    releaser.bump()
+
+    with open("seen") as f:
+        assert f.read().startswith("1.2.3\n-----\n")
+    with open("fake.py") as f:
+        assert "1.2.3.dev" not in f.read()
+
+
+def test_release_commands_hook_and_changelog_in_files(workspace):
+    workspace.write("CHANGES", CHANGELOG)
+    config = Config(
+        {
+            "file": "fake.py",
+            "files": ["CHANGES"],
+            "bump_only": True,
+            "changelog": {"file": "CHANGES", "bump": "{version}"},
+            "commands": {"bump": COPY_CHANGES},
+        }
+    )
+    releaser = Releaser(config)
+
+    releaser.release()
+
+    # The replacements are applied on top of the changelog rewritten before the commands
+    with open("CHANGES") as f:
+        assert f.read() == "1.2.3\n-----\n\n- Some change (see 1.2.3 docs)\n"
+    with open("seen") as f:
+        assert f.read() == "1.2.3\n-----\n\n- Some change (see 1.2.3.dev docs)\n"
+    assert sorted(os.listdir(".")) == ["CHANGES", "README", "fake.py", "seen"]
+
+
+def test_bump_commands_hook_failure_restores_changelog(workspace):
+    workspace.write("CHANGES", CHANGELOG)
+    config = Config(
+        {
+            "file": "fake.py",
+            "changelog": {"file": "CHANGES", "bump": "{version}"},
+            "commands": {"bump": 'python -c "raise SystemExit(1)"'},
+        }
+    )
+    releaser = Releaser(config)
+
+    with pytest.raises(BumprError):
+        releaser.bump()
+
+    with open("CHANGES") as f:
+        assert f.read() == CHANGELOG
+    with open("fake.py") as f:
+        assert "1.2.3.dev" in f.read()
+
+
+@pytest.mark.parametrize("dryrun", [False, True])
+def test_release_reads_files_once(workspace, mocker, dryrun):
+    workspace.write("CHANGES", CHANGELOG)
+    config = Config(
+        {
+            "file": "fake.py",
+            "files": ["README"],
+            "dryrun": dryrun,
+            "prepare": {"part": Version.PATCH, "suffix": "dev"},
+            "changelog": {"file": "CHANGES", "bump": "{version}"},
+        }
+    )
+    spy = mocker.spy(builtins, "open")
+
+    releaser = Releaser(config)
+    releaser.release()
+
+    reads = [call.args[0] for call in spy.call_args_list if "r" in call.args[1]]
+    assert sorted(reads) == ["CHANGES", "README", "fake.py"]
+    with open("fake.py") as f:
+        assert f.read().strip().endswith("'1.2.3.dev'" if dryrun else "'1.2.4.dev'")
@@ -0,0 +1,98 @@
+import io
+
+import pytest
+
+from bumpr.replacer import Replacer
+
+
+def sequential(text, replacements):
+    for token, replacement in replacements:
+        text = text.replace(token, replacement)
+    return text
+
+
+class ReplacerTest:
+    def test_no_replacements(self):
+        replacer = Replacer([])
+        assert not replacer
+        assert replacer.replace("some text") == "some text"
+
+    def test_single_replacement(self):
+        replacer = Replacer([("1.2.3.dev", "1.2.3")])
+        assert replacer
+        assert replacer.replace("version 1.2.3.dev (1.2.3.dev)") == "version 1.2.3 (1.2.3)"
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "Version: 1.2.3.dev\nhttps://bumpr.readthedocs.io/en/latest\n",
+            "?branch=master and 1.2.3.dev and ?branch=master",
+            "nothing to replace here",
+        ],
+    )
+    def test_same_output_as_sequential(self, text):
+        replacements = [
+            ("https://bumpr.readthedocs.io/en/latest", "https://bumpr.readthedocs.io/en/1.2.3"),
+            ("?branch=master", "?tag=1.2.3"),
+            ("1.2.3.dev", "1.2.3"),
+        ]
+        assert Replacer(replacements).replace(text) == sequential(text, replacements)
+
+    def test_overlapping_tokens_first_declared_wins(self):
+        replacer = Replacer([("1.2.3.dev", "A"), ("1.2.3", "B")])
+        assert replacer.replace("1.2.3.dev 1.2.3") == "A B"
+
+        replacer = Replacer([("1.2.3", "B"), ("1.2.3.dev", "A")])
+        assert replacer.replace("1.2.3.dev 1.2.3") == "B.dev B"
+
+    def test_leftmost_match_wins(self):
+        replacer = Replacer([("bc", "X"), ("ab", "Y")])
+        assert replacer.replace("abc") == "Yc"
+
+    def test_replacements_are_not_rescanned(self):
+        replacer = Replacer([("a", "b"), ("b", "c")])
+        assert replacer.replace("ab") == "bc"
+
+    def test_empty_and_duplicated_tokens(self):
+        replacer = Replacer([("", "X"), ("a", "1"), ("a", "2")])
+        assert replacer.replace("aa") == "11"
+
+    def test_edits(self):
+        replacer = Replacer([("1.2.3.dev", "1.2.3"), ("latest", "1.2.3")])
+        text = "1.2.3.dev latest"
+
+        edits = replacer.edits(text)
+
+        assert edits == [(0, 9, "1.2.3"), (10, 16, "1.2.3")]
+        assert Replacer([]).edits(text) == []
+
+    def test_may_match(self):
+        replacer = Replacer([("1.2.3.dev", "1.2.3"), ("é", "e")])
+        assert replacer.may_match(b"version 1.2.3.dev", "utf8")
+        assert replacer.may_match("café".encode("utf8"), "utf8")
+        assert not replacer.may_match(b"version 1.2.3", "utf8")
+
+    def test_may_match_without_tokens(self):
+        assert not Replacer([]).may_match(b"anything", "utf8")
+
+    def test_may_match_untrusted_encoding(self):
+        replacer = Replacer([("1.2.3.dev", "1.2.3")])
+        assert replacer.bytes_pattern("utf-16") is None
+        assert replacer.may_match(b"anything", "utf-16")
+
+    def test_may_match_tokens_with_newlines(self):
+        replacer = Replacer([("a\nb", "c")])
+        assert replacer.bytes_pattern("utf8") is None
+        assert replacer.may_match(b"a\r\nb", "utf8")
+
+    def test_stream(self):
+        replacer = Replacer([("1.2.3.dev", "1.2.3"), ("é", "e")])
+        target = io.BytesIO()
+        source = "1.2.3.dev café\r\n1.2.3.dev".encode("utf8")
+
+        assert replacer.stream(source, target, "utf8") == 3
+        assert target.getvalue() == b"1.2.3 cafe\r\n1.2.3"
+
+    def test_stream_untrusted_encoding(self):
+        replacer = Replacer([("1.2.3.dev", "1.2.3")])
+        assert replacer.stream(b"", io.BytesIO(), "utf-16") == -1
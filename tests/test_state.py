@@ -0,0 +1,149 @@
+import builtins
+import json
+import os
+import time
+
+import pytest
+
+from bumpr.config import Config
+from bumpr.releaser import Releaser
+from bumpr.replacer import Replacer
+from bumpr.state import FORMAT, State
+
+
+def age(*filenames):
+    """Make files old enough for their fingerprint to be trusted"""
+    past = time.time() - 3600
+    for filename in filenames:
+        os.utime(filename, (past, past))
+
+
+class StateTest:
+    def test_empty_without_directory(self, workspace):
+        state = State()
+
+        assert state.config("key") is None
+        state.save()
+        assert not os.path.exists(".bumpr")
+
+    def test_save_and_reload(self, workspace):
+        state = State()
+        state.store_config("key", {"file": "fake.py", "bump": {"part": 1}})
+        state.save()
+
+        assert os.path.exists(".bumpr/config.json")
+        with open(".bumpr/.gitignore") as f:
+            assert f.read() == "*\n"
+        assert State().config("key") == {"file": "fake.py", "bump": {"part": 1}}
+
+    def test_ignore_corrupted_state(self, workspace):
+        os.mkdir(".bumpr")
+        with open(".bumpr/config.json", "w") as f:
+            f.write("{not json")
+
+        assert State().config("key") is None
+
+    def test_ignore_other_format_or_version(self, workspace):
+        os.mkdir(".bumpr")
+        for data in (
+            {"format": FORMAT + 1, "bumpr": "0.0.0", "entries": {"key": {}}},
+            {"format": FORMAT, "bumpr": "0.0.0", "entries": {"key": {}}},
+        ):
+            with open(".bumpr/config.json", "w") as f:
+                json.dump(data, f)
+            assert State().config("key") is None
+
+    def test_version_from_fingerprint(self, workspace, mocker):
+        age("fake.py")
+        state = State()
+        with open("fake.py", "rb") as f:
+            state.store_version("fake.py", ["regex"], "utf8", f.read(), "1.2.3.dev")
+        state.save()
+        read = mocker.Mock()
+
+        assert State().version("fake.py", ["regex"], "utf8", read) == "1.2.3.dev"
+        assert State().version("fake.py", ["other"], "utf8", read) is None
+        assert not read.called
+
+    def test_version_from_hash(self, workspace):
+        state = State()
+        with open("fake.py", "rb") as f:
+            data = f.read()
+        state.store_version("fake.py", ["regex"], "utf8", data, "1.2.3.dev")
+
+        # Recently modified files are only trusted by their content
+        assert state.version("fake.py", ["regex"], "utf8", lambda: data) == "1.2.3.dev"
+        assert state.version("fake.py", ["regex"], "utf8", lambda: b"changed") is None
+
+    def test_clean_files(self, workspace):
+        age("README")
+        state = State()
+        replacer = Replacer([("1.2.3.dev", "1.2.3")])
+        state.mark_clean("README", replacer, "utf8", os.stat("README"))
+
+        assert state.is_clean("README", replacer, "utf8")
+        assert not state.is_clean("README", Replacer([("1.2.3", "1.2.4.dev")]), "utf8")
+        assert not state.is_clean("README", replacer, "latin1")
+
+        workspace.write("README", "Changed")
+        assert not state.is_clean("README", replacer, "utf8")
+
+    def test_recent_files_are_not_marked_clean(self, workspace):
+        state = State()
+        replacer = Replacer([("1.2.3.dev", "1.2.3")])
+        state.mark_clean("README", replacer, "utf8", os.stat("README"))
+
+        assert not state.is_clean("README", replacer, "utf8")
+
+
+def test_parse_args_caches_config(workspace, mocker):
+    workspace.write("bumpr.rc", "[bumpr]\nfile = fake.py\ncache = true\n")
+
+    config = Config.parse_args([])
+    assert config.cache
+
+    override = mocker.spy(Config, "override_from_config")
+    assert Config.parse_args([]) == config
+    assert isinstance(Config.parse_args([]).bump, dict)
+    assert not override.called
+
+    # Any argument or file change is a cache miss
+    assert Config.parse_args(["--dryrun"]).dryrun
+    workspace.write("bumpr.rc", "[bumpr]\nfile = other.py\ncache = true\n")
+    assert Config.parse_args([]).file == "other.py"
+    assert Config.parse_args(["--no-cache"]).file == "other.py"
+    assert override.call_count == 3
+
+
+def test_parse_args_without_cache(workspace):
+    workspace.write("bumpr.rc", "[bumpr]\nfile = fake.py\n")
+
+    Config.parse_args([])
+
+    assert not os.path.exists(".bumpr")
+
+
+@pytest.mark.parametrize("dryrun", [False, True])
+def test_release_skips_clean_files(workspace, mocker, dryrun):
+    workspace.write("other.txt", "Nothing to replace")
+    age("fake.py", "README", "other.txt")
+    config = Config(
+        {"file": "fake.py", "files": ["README", "other.txt"], "dryrun": dryrun, "cache": True}
+    )
+
+    Releaser(config).release()
+    assert os.path.exists(".bumpr/clean.json")
+    if not dryrun:
+        workspace.write("fake.py", "__version__ = '{version}'")
+        workspace.write("README", "Version: {version}")
+        age("fake.py", "README")
+
+    spy = mocker.spy(builtins, "open")
+    releaser = Releaser(config)
+    releaser.release()
+
+    reads = [call.args[0] for call in spy.call_args_list]
+    assert "other.txt" not in reads
+    assert releaser.stats["skipped"] >= 1
+    with open("fake.py") as f:
+        assert f.read().strip().endswith("'1.2.3.dev'" if dryrun else "'1.2.3'")
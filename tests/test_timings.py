@@ -0,0 +1,101 @@
+import json
+import threading
+
+from bumpr.timings import Timings
+
+
+def record():
+    timings = Timings()
+    with timings.span("bump"):
+        with timings.span("changelog.bump", "hook", file="CHANGES"):
+            pass
+        with timings.span("files", "files"):
+            pass
+    with timings.span("push"):
+        pass
+    return timings
+
+
+class TimingsTest:
+    def test_nested_spans(self):
+        timings = record()
+
+        assert [(span.name, span.category, span.depth) for span in timings.spans] == [
+            ("bump", "phase", 0),
+            ("changelog.bump", "hook", 1),
+            ("files", "files", 1),
+            ("push", "phase", 0),
+        ]
+        bump, hook, files, push = timings.spans
+        assert bump.start <= hook.start <= hook.end <= files.start <= files.end <= bump.end
+        assert timings.total == bump.duration + push.duration
+
+    def test_spans_nest_by_thread(self):
+        timings = Timings()
+
+        def worker():
+            with timings.span("worker"):
+                pass
+
+        with timings.span("bump"):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+
+        assert [span.depth for span in timings.spans] == [0, 0]
+
+    def test_span_closed_on_error(self):
+        timings = Timings()
+        try:
+            with timings.span("test"):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        assert timings.spans[0].end is not None
+        with timings.span("bump"):
+            pass
+        assert timings.spans[1].depth == 0
+
+    def test_report(self):
+        lines = record().report()
+
+        assert [line.split()[0] for line in lines] == [
+            "bump",
+            "changelog.bump",
+            "files",
+            "push",
+            "Total",
+        ]
+        assert lines[1].startswith("  changelog.bump")
+        assert lines[0].endswith("%")
+
+    def test_to_json(self):
+        data = record().to_json()
+
+        assert [span["name"] for span in data["spans"]] == [
+            "bump",
+            "changelog.bump",
+            "files",
+            "push",
+        ]
+        assert data["spans"][1]["args"] == {"file": "CHANGES"}
+        assert data["total"] >= data["spans"][0]["duration"]
+
+    def test_to_chrome(self):
+        data = record().to_chrome()
+
+        events = data["traceEvents"]
+        assert [event["name"] for event in events] == ["bump", "changelog.bump", "files", "push"]
+        assert all(event["ph"] == "X" for event in events)
+        assert events[1]["cat"] == "hook"
+        assert events[0]["ts"] <= events[1]["ts"]
+        assert events[0]["dur"] >= events[1]["dur"]
+
+    def test_export(self, tmpdir):
+        timings = record()
+        for format in "json", "chrome":
+            filename = str(tmpdir.join("timings.{0}".format(format)))
+            timings.export(filename, format)
+            with open(filename) as f:
+                assert json.load(f) == json.loads(json.dumps(getattr(timings, "to_" + format)()))
@@ -1,9 +1,52 @@
+import importlib.util
 import logging
+import os
+import subprocess
+import sys
 
 import pytest
 
 from bumpr.helpers import BumprError
-from bumpr.vcs import BaseVCS, Bazaar, Git, Mercurial
+from bumpr.vcs import VCS, BaseVCS, Bazaar, Git, GitNative, Mercurial, is_local
+
+
+def run(*args):
+    return subprocess.check_output(args, stderr=subprocess.STDOUT, universal_newlines=True)
+
+
+@pytest.fixture
+def git_env(monkeypatch):
+    for key in "AUTHOR", "COMMITTER":
+        monkeypatch.setenv("GIT_{0}_NAME".format(key), "bumpr")
+        monkeypatch.setenv("GIT_{0}_EMAIL".format(key), "bumpr@example.com")
+    monkeypatch.setenv("GIT_CONFIG_NOSYSTEM", "1")
+
+
+def output(*lines):
+    """A lazy command output, like `iter_lines()`"""
+    yield from lines
+
+
+needs_pygit2 = pytest.mark.skipif(
+    importlib.util.find_spec("pygit2") is None, reason="Requires pygit2"
+)
+
+GIT_BACKENDS = [Git, pytest.param(GitNative, marks=needs_pygit2)]
+
+
+def init_repository(remote=None):
+    run("git", "init", "-q", "-b", "main")
+    run("git", "add", ".")
+    run("git", "commit", "-q", "-m", "initial")
+    if remote:
+        run("git", "init", "-q", "--bare", str(remote))
+        run("git", "remote", "add", "origin", str(remote))
+        run("git", "push", "-q", "-u", "origin", "main")
+
+
+MSG = "The current repository contains modified files"
+
+STATUS = ["git", "status", "--porcelain", "--branch", "--untracked-files=no"]
 
 
 class BaseVCSTest:
@@ -11,52 +54,116 @@ class BaseVCSTest:
         vcs = BaseVCS(verbose=True)
         execute = mocker.patch("bumpr.vcs.execute")
         vcs.execute("cmd arg")
-        execute.assert_called_with("cmd arg", verbose=True)
+        execute.assert_called_with("cmd arg", verbose=True, timeout=None, retries=0, backoff=1)
 
     def test_execute_quiet(self, mocker):
         vcs = BaseVCS(verbose=False)
         execute = mocker.patch("bumpr.vcs.execute")
         vcs.execute("cmd arg")
-        execute.assert_called_with("cmd arg", verbose=False)
+        execute.assert_called_with("cmd arg", verbose=False, timeout=None, retries=0, backoff=1)
+
+    def test_execute_retry(self, mocker):
+        vcs = BaseVCS(timeout=10, retries=3, backoff=2)
+        execute = mocker.patch("bumpr.vcs.execute")
+
+        vcs.execute("cmd arg")
+        execute.assert_called_with("cmd arg", verbose=False, timeout=10, retries=0, backoff=2)
+
+        vcs.execute("cmd arg", retry=True)
+        execute.assert_called_with("cmd arg", verbose=False, timeout=10, retries=3, backoff=2)
+
+    def test_query(self, mocker):
+        vcs = BaseVCS(verbose=True, timeout=10)
+        execute = mocker.patch("bumpr.vcs.execute", return_value="output")
+
+        assert vcs.query("cmd arg") == "output"
+        execute.assert_called_with("cmd arg", verbose=False, capture=True, timeout=10)
 
 
 class GitTest:
+    def test_constructor(self):
+        git = Git(verbose=True, timeout=5, retries=2, backoff=3)
+
+        assert (git.verbose, git.timeout, git.retries, git.backoff) == (True, 5, 2, 3)
+        assert git.tags == []
+
     def test_validate_ok(self, workspace, mocker):
         workspace.mkdir(".git")
         git = Git()
 
-        execute = mocker.patch("bumpr.vcs.execute")
-        execute.return_value = "?? new.py"
+        query = mocker.patch("bumpr.vcs.iter_lines", return_value=output("## main...origin/main"))
         git.validate()
-        execute.assert_called_with("git status --porcelain", verbose=False)
+        query.assert_called_with(STATUS, timeout=None)
 
     def test_validate_ko_not_git(self, workspace, mocker):
         git = Git()
 
-        execute = mocker.patch("bumpr.vcs.execute")
+        query = mocker.patch("bumpr.vcs.iter_lines")
         with pytest.raises(BumprError):
             git.validate()
-        assert execute.called is False
+        assert query.called is False
 
     def test_validate_ko_not_clean(self, workspace, mocker):
         workspace.mkdir(".git")
         git = Git()
+        read = []
 
-        execute = mocker.patch("bumpr.vcs.execute")
-        execute.return_value = "\n".join((" M modified.py", "?? new.py"))
+        def lines():
+            for line in ("## main", " M modified.py", "M  staged.py"):
+                read.append(line)
+                yield line
+
+        query = mocker.patch("bumpr.vcs.iter_lines", return_value=lines())
         with pytest.raises(BumprError):
             git.validate()
-        execute.assert_called_with("git status --porcelain", verbose=False)
+        query.assert_called_with(STATUS, timeout=None)
+        # Stops reading at the first modified file
+        assert read == ["## main", " M modified.py"]
+        assert git.branch == "main"
 
     def test_validate_not_clean_dryrun(self, workspace, mocker):
         workspace.mkdir(".git")
-        git = Git()
-        execute = mocker.patch("bumpr.vcs.execute")
-        execute.return_value = "\n".join((" M modified.py", "?? new.py"))
+        git = Git(timeout=10)
+        query = mocker.patch("bumpr.vcs.iter_lines", return_value=output(" M modified.py"))
 
         git.validate(dryrun=True)
 
-        execute.assert_called_with("git status --porcelain", verbose=False)
+        query.assert_called_with(STATUS, timeout=10)
+
+    def test_validate_fsmonitor(self, workspace, mocker):
+        workspace.mkdir(".git")
+        git = Git(fsmonitor=True)
+        query = mocker.patch("bumpr.vcs.iter_lines", return_value=output())
+
+        git.validate()
+
+        query.assert_called_with(
+            ["git", "-c", "core.fsmonitor=true", "-c", "core.untrackedCache=true"] + STATUS[1:],
+            timeout=None,
+        )
+
+    def test_validate_paths(self, workspace, mocker):
+        workspace.mkdir(".git")
+        git = Git()
+        query = mocker.patch("bumpr.vcs.iter_lines", return_value=output())
+
+        git.validate(paths=["pkg", "README"])
+
+        query.assert_called_with(STATUS + ["--", "pkg", "README"], timeout=None)
+
+    @pytest.mark.parametrize("backend", GIT_BACKENDS)
+    def test_validate_real_repository(self, workspace, git_env, backend):
+        init_repository()
+        workspace.write("untracked.py", "")
+        git = backend()
+
+        git.validate()
+        assert git.branch == "main"
+
+        workspace.write("README", "modified")
+        git.validate(paths=["fake.py"])
+        with pytest.raises(BumprError):
+            git.validate()
 
     def test_tag(self, mocker):
         git = Git()
@@ -79,13 +186,226 @@ class GitTest:
         git.commit("message")
         execute.assert_called_with(["git", "commit", "-am", "message"])
 
+    def test_checkout(self, mocker):
+        git = Git()
+
+        execute = mocker.patch.object(git, "execute")
+        git.checkout("release/1.x")
+        execute.assert_called_with(["git", "checkout", "--quiet", "release/1.x"])
+
+    @pytest.mark.parametrize("output,branch", [("main\n", "main"), ("HEAD\n", None)])
+    def test_current_branch(self, mocker, output, branch):
+        git = Git()
+
+        query = mocker.patch.object(git, "query", return_value=output)
+        assert git.current_branch() == branch
+        query.assert_called_with(["git", "rev-parse", "--abbrev-ref", "HEAD"])
+
+    def test_validate_resets_previous_release(self, workspace, mocker):
+        workspace.mkdir(".git")
+        git = Git()
+        git.branch, git.remote, git.remote_branch, git.tags = "old", "upstream", "old", ["1.0"]
+        mocker.patch("bumpr.vcs.iter_lines", return_value=output("## main"))
+
+        git.validate()
+
+        assert (git.branch, git.remote, git.remote_branch, git.tags) == ("main", None, None, [])
+
+    def test_commit_files(self, mocker):
+        git = Git()
+
+        execute = mocker.patch.object(git, "execute")
+        git.commit("message", ["fake.py", "README"])
+        assert execute.call_args_list == [
+            mocker.call(["git", "add", "--", "fake.py", "README"]),
+            mocker.call(["git", "commit", "-m", "message", "--", "fake.py", "README"]),
+        ]
+
+    @pytest.mark.parametrize("backend", GIT_BACKENDS)
+    def test_commit_only_files(self, workspace, git_env, backend):
+        init_repository()
+        workspace.write("fake.py", "__version__ = '1.2.3'")
+        workspace.write("README", "unrelated")
+        workspace.write("staged.py", "")
+        run("git", "add", "staged.py")
+        git = backend()
+
+        git.commit("Bump version 1.2.3", ["fake.py"])
+
+        assert run("git", "show", "--name-only", "--format=%s") == "Bump version 1.2.3\n\nfake.py\n"
+        assert run("git", "status", "--porcelain") == " M README\nA  staged.py\n"
+
+    @pytest.mark.parametrize(
+        "header,branch,remote,remote_branch",
+        [
+            ("main...origin/main", "main", "origin", "main"),
+            ("main...upstream/release/1.x [ahead 1]", "main", "upstream", "release/1.x"),
+            ("main", "main", None, None),
+            ("No commits yet on main", "main", None, None),
+            ("HEAD (no branch)", None, None, None),
+        ],
+    )
+    def test_validate_parse_branch(self, workspace, mocker, header, branch, remote, remote_branch):
+        workspace.mkdir(".git")
+        git = Git()
+        mocker.patch("bumpr.vcs.iter_lines", return_value=output("## {0}".format(header)))
+
+        git.validate()
+
+        assert git.branch == branch
+        assert git.remote == remote
+        assert git.remote_branch == remote_branch
+
     def test_push(self, mocker):
         git = Git()
+        git.branch, git.remote, git.remote_branch = "main", "upstream", "master"
+
+        execute = mocker.patch.object(git, "execute")
+        git.tag("fake")
+        git.push()
+        execute.assert_called_with(
+            ["git", "push", "--atomic", "upstream", "HEAD:refs/heads/master", "refs/tags/fake"],
+            retry=True,
+        )
+        assert execute.call_count == 2
+
+    def test_push_without_upstream(self, mocker):
+        git = Git()
+
+        execute = mocker.patch.object(git, "execute")
+        git.push()
+        execute.assert_called_once_with(["git", "push", "--atomic", "origin", "HEAD"], retry=True)
+
+    @pytest.mark.parametrize("backend", GIT_BACKENDS)
+    def test_push_to_bare_remote(self, workspace, git_env, backend):
+        remote = workspace.root / "remote.git"
+        init_repository(remote)
+        run("git", "tag", "unrelated")
+        git = backend()
+        git.validate()
+        workspace.write("README", "updated")
+
+        git.commit("update")
+        git.tag("1.0.0", annotation="version 1.0.0")
+        git.push()
+
+        remote_refs = run("git", "ls-remote", str(remote))
+        head = run("git", "rev-parse", "HEAD").strip()
+        assert "{0}\trefs/heads/main".format(head) in remote_refs
+        assert "refs/tags/1.0.0" in remote_refs
+        assert "refs/tags/unrelated" not in remote_refs
+        assert run("git", "status", "--porcelain", "--untracked-files=no") == ""
+        assert run("git", "log", "-1", "--format=%s%n%an") == "update\nbumpr\n"
+        assert run("git", "cat-file", "-t", "1.0.0") == "tag\n"
+
 
+@needs_pygit2
+class GitNativeTest:
+    def test_registered(self):
+        assert VCS["git-native"] is GitNative
+
+    def test_fallback_without_pygit2(self, workspace, mocker):
+        mocker.patch.dict(sys.modules, {"pygit2": None})
+        workspace.mkdir(".git")
+        git = GitNative()
+        query = mocker.patch("bumpr.vcs.iter_lines", return_value=output("## main"))
         execute = mocker.patch.object(git, "execute")
+
+        git.validate()
+        git.commit("message")
+        git.tag("fake")
+
+        assert git.pygit2 is None
+        assert git.branch == "main"
+        query.assert_called_with(STATUS, timeout=None)
+        assert execute.call_args_list == [
+            mocker.call(["git", "commit", "-am", "message"]),
+            mocker.call(["git", "tag", "fake"]),
+        ]
+
+    def test_no_subprocess(self, workspace, git_env, mocker):
+        init_repository(workspace.root / "remote.git")
+        git = GitNative()
+        popen = mocker.patch("subprocess.Popen")
+
+        git.validate()
+        workspace.write("README", "updated")
+        git.commit("update")
+        git.tag("1.0.0")
         git.push()
-        execute.assert_any_call(["git", "push"])
-        execute.assert_any_call(["git", "push", "--tags"])
+
+        assert not popen.called
+        assert (git.branch, git.remote, git.remote_branch) == ("main", "origin", "main")
+        mocker.stop(popen)
+        remote_refs = run("git", "ls-remote", str(workspace.root / "remote.git"))
+        assert "{0}\trefs/heads/main".format(run("git", "rev-parse", "HEAD").strip()) in remote_refs
+        assert "refs/tags/1.0.0" in remote_refs
+
+    def test_validate_not_clean(self, workspace, git_env, caplog):
+        init_repository()
+        workspace.write("README", "modified")
+        git = GitNative()
+
+        with pytest.raises(BumprError):
+            git.validate()
+        git.validate(dryrun=True)
+        git.validate(paths=["fake.py", "docs"])
+        assert caplog.record_tuples == [("bumpr.vcs", logging.WARNING, MSG)]
+
+    def test_validate_unborn_branch(self, workspace, git_env):
+        run("git", "init", "-q", "-b", "trunk")
+        git = GitNative()
+
+        git.validate()
+
+        assert git.branch == "trunk"
+
+    def test_commit_deleted_files(self, workspace, git_env):
+        init_repository()
+        workspace.write("new.py", "")
+        os.remove("README")
+        git = GitNative()
+
+        git.commit("remove README")
+
+        assert run("git", "ls-files") == "fake.py\n"
+        assert run("git", "status", "--porcelain") == "?? new.py\n"
+
+        workspace.write("README", "restored")
+        run("git", "add", "README")
+        run("git", "commit", "-q", "-m", "restore README")
+        os.remove("README")
+        git.commit("remove README", ["README"])
+
+        assert run("git", "ls-files") == "fake.py\n"
+
+    def test_push_to_network_remote_uses_git(self, workspace, git_env, mocker):
+        init_repository()
+        run("git", "remote", "add", "origin", "git@example.com:project.git")
+        git = GitNative()
+        git.branch = "main"
+        execute = mocker.patch.object(git, "execute")
+
+        git.push()
+
+        execute.assert_called_once_with(
+            ["git", "push", "--atomic", "origin", "HEAD:refs/heads/main"], retry=True
+        )
+
+
+@pytest.mark.parametrize(
+    "url,local",
+    [
+        ("/srv/git/project.git", True),
+        ("../project.git", True),
+        ("file:///srv/git/project.git", True),
+        ("git@example.com:project.git", False),
+        ("https://example.com/project.git", False),
+        ("ssh://git@example.com/project.git", False),
+    ],
+)
+def test_is_local(url, local):
+    assert is_local(url) is local
 
 
 class MercurialTest:
@@ -96,7 +416,9 @@ class MercurialTest:
         execute = mocker.patch("bumpr.vcs.execute")
         execute.return_value = "?? new.py"
         mercurial.validate()
-        execute.assert_called_with("hg status -mard", verbose=False)
+        execute.assert_called_with(
+            ["hg", "status", "-mard"], verbose=False, capture=True, timeout=None
+        )
 
     def test_validate_ko_not_mercurial(self, workspace, mocker):
         mercurial = Mercurial()
@@ -114,7 +436,9 @@ class MercurialTest:
         execute.return_value = "\n".join((" M modified.py", "?? new.py"))
         with pytest.raises(BumprError):
             mercurial.validate()
-        execute.assert_called_with("hg status -mard", verbose=False)
+        execute.assert_called_with(
+            ["hg", "status", "-mard"], verbose=False, capture=True, timeout=None
+        )
 
     def test_validate_not_clean_dryrun(self, workspace, mocker):
         workspace.mkdir(".hg")
@@ -123,7 +447,19 @@ class MercurialTest:
         execute = mocker.patch("bumpr.vcs.execute")
         execute.return_value = "\n".join((" M modified.py", "?? new.py"))
         mercurial.validate(dryrun=True)
-        execute.assert_called_with("hg status -mard", verbose=False)
+        execute.assert_called_with(
+            ["hg", "status", "-mard"], verbose=False, capture=True, timeout=None
+        )
+
+    def test_validate_paths(self, workspace, mocker):
+        workspace.mkdir(".hg")
+        mercurial = Mercurial()
+
+        execute = mocker.patch("bumpr.vcs.execute", return_value="")
+        mercurial.validate(paths=["pkg", "README"])
+        execute.assert_called_with(
+            ["hg", "status", "-mard", "pkg", "README"], verbose=False, capture=True, timeout=None
+        )
 
     def test_tag(self, mocker):
         mercurial = Mercurial()
@@ -146,12 +482,22 @@ class MercurialTest:
         mercurial.commit("message")
         execute.assert_called_with(["hg", "commit", "-A", "-m", "message"])
 
+        mercurial.commit("message", ["fake.py", "README"])
+        execute.assert_called_with(["hg", "commit", "-m", "message", "fake.py", "README"])
+
     def test_push(self, mocker):
         mercurial = Mercurial()
 
         execute = mocker.patch.object(mercurial, "execute")
         mercurial.push()
-        execute.assert_called_with(["hg", "push"])
+        execute.assert_called_with(["hg", "push"], retry=True)
+
+    def test_checkout(self, mocker):
+        mercurial = Mercurial()
+
+        execute = mocker.patch.object(mercurial, "execute")
+        mercurial.checkout("stable")
+        execute.assert_called_with(["hg", "update", "stable"])
 
 
 class BazaarTest:
@@ -162,7 +508,9 @@ class BazaarTest:
         execute = mocker.patch("bumpr.vcs.execute")
         execute.return_value = "? new.py"
         bazaar.validate()
-        execute.assert_called_with("bzr status --short", verbose=False)
+        execute.assert_called_with(
+            ["bzr", "status", "--short"], verbose=False, capture=True, timeout=None
+        )
 
     def test_validate_ko_not_bazaar(self, workspace, mocker):
         bazaar = Bazaar()
@@ -180,7 +528,9 @@ class BazaarTest:
         execute.return_value = "\n".join((" M modified.py", "? new.py"))
         with pytest.raises(BumprError):
             bazaar.validate()
-        execute.assert_called_with("bzr status --short", verbose=False)
+        execute.assert_called_with(
+            ["bzr", "status", "--short"], verbose=False, capture=True, timeout=None
+        )
 
     def test_validate_not_clean_dryrun(self, workspace, mocker):
         workspace.mkdir(".bzr")
@@ -191,7 +541,19 @@ class BazaarTest:
 
         bazaar.validate(dryrun=True)
 
-        execute.assert_called_with("bzr status --short", verbose=False)
+        execute.assert_called_with(
+            ["bzr", "status", "--short"], verbose=False, capture=True, timeout=None
+        )
+
+    def test_validate_paths(self, workspace, mocker):
+        workspace.mkdir(".bzr")
+        bazaar = Bazaar()
+
+        execute = mocker.patch("bumpr.vcs.execute", return_value="")
+        bazaar.validate(paths=["pkg", "README"])
+        execute.assert_called_with(
+            ["bzr", "status", "--short", "pkg", "README"], verbose=False, capture=True, timeout=None
+        )
 
     def test_tag(self, mocker, caplog):
         bazaar = Bazaar()
@@ -219,9 +581,19 @@ class BazaarTest:
         bazaar.commit("message")
         execute.assert_called_with(["bzr", "commit", "-m", "message"])
 
+        bazaar.commit("message", ["fake.py", "README"])
+        execute.assert_called_with(["bzr", "commit", "-m", "message", "fake.py", "README"])
+
     def test_push(self, mocker):
         bazaar = Bazaar()
 
         execute = mocker.patch.object(bazaar, "execute")
         bazaar.push()
-        execute.assert_called_with(["bzr", "push"])
+        execute.assert_called_with(["bzr", "push"], retry=True)
+
+    def test_checkout(self, mocker):
+        bazaar = Bazaar()
+
+        execute = mocker.patch.object(bazaar, "execute")
+        bazaar.checkout("stable")
+        execute.assert_called_with(["bzr", "switch", "stable"])